@@ -4,15 +4,20 @@ from flask_migrate import Migrate
 import os
 
 from application.admin import setup_admin
+from application.apis.api import api
+from application.commands import register_commands
 from application.routes.billing import billing
+from application.routes.documents import documents
+from application.routes.exports import exports
 from application.routes.payment import payment
 from application.routes.visit import visit
 from application.routes.main import main
 from application.routes.prescription import prescription
 from application.routes.triage import triage
-from application.extensions import db, migrate
+from application.extensions import cache, db, docx_templates, document_cache, formulary, instrumentation, migrate, init_db, renderer
+from application.services.search_service import PatientSearchService
 
-def create_app():
+def create_app(config_overrides=None):
 
     basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
     template_dir = os.path.join(basedir, 'templates')
@@ -20,10 +25,19 @@ def create_app():
 
     app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
     app.config.from_object('config.Config')
+    if config_overrides:
+        app.config.update(config_overrides)
 
-    db.init_app(app)
+    init_db(app)
     migrate.init_app(app, db)
+    cache.init_app(app)
+    renderer.init_app(app)
+    document_cache.init_app(app)
+    docx_templates.init_app(app)
+    formulary.init_app(app)
+    instrumentation.init_app(app)
     setup_admin(app)
+    register_commands(app)
 
     from application.models.models import Patient, Doctor, Visit, Triage, Prescription, Invoice, InvoiceItem
 
@@ -33,8 +47,13 @@ def create_app():
     app.register_blueprint(triage, name='triage_bp')
     app.register_blueprint(prescription, name='prescription_bp')
     app.register_blueprint(main, name='main_bp' )
+    app.register_blueprint(documents, name='documents_bp')
+    app.register_blueprint(exports, name='exports_bp')
+    app.register_blueprint(api, name='api_bp')
 
     with app.app_context():
         db.create_all()
+        with db.engine.begin() as connection:
+            PatientSearchService.ensure_index(connection)
     
     return app
\ No newline at end of file
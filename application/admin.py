@@ -1,88 +1,60 @@
 from dataclasses import fields
 from typing import Optional
-from flask import Flask, make_response, render_template, request, redirect, url_for, flash
+from flask import Flask, current_app, g, jsonify, render_template, request, redirect, send_file, url_for, flash
 from flask_admin.model.form import InlineFormAdmin
 from flask_login import current_user
 from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.ajax import QueryAjaxModelLoader
+from flask_admin.contrib.sqla.filters import BaseSQLAFilter
+from flask_admin.model.ajax import DEFAULT_PAGE_SIZE
 from flask_admin.actions import action
 from flask_admin.form import rules
-from sqlalchemy import func
-from wtforms import DateField, DateTimeField, DecimalField, SelectField, TextAreaField, StringField
+from flask_admin.model.template import EndpointLinkRowAction
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import attributes, joinedload, selectinload
+from wtforms import DateField, DateTimeField, DecimalField, IntegerField, SelectField, TextAreaField, StringField
 from wtforms.validators import DataRequired, NumberRange, ValidationError, Length, Email, Optional
-from application.models.models import Invoice, VisitReport, db, Patient, Payment, Prescription, Visit, Drug, Triage, Doctor, InvoiceItem
-from datetime import datetime, timedelta
-import pdfkit
+from application.models.models import Invoice, VisitReport, db, Patient, Payment, Prescription, PrescriptionDrug, Visit, Drug, Triage, Doctor, InvoiceItem, StockMovement
+from application.extensions import cache, document_cache, formulary, renderer, router
+from application.services.document_service import DocumentService
+from application.services.import_service import PatientImportService
+from application.services.invoice_service import InvoiceService
+from application.services.rollup_service import RollupService
+from application.services.search_service import PatientSearchService
+from application.services.export_service import ExportService
+from application.services.analytics_service import AnalyticsService
+from application.services.vitals_service import VitalsService
+from application.services.stock_service import InsufficientStock
+from datetime import date, datetime, timedelta
+from werkzeug.utils import secure_filename
+import os
+import threading
+from application.routes.documents import queue_pdf
 
 class KMCAdminIndexView(AdminIndexView):
     @expose('/')
+    @router.read_only_view
     def index(self):
         # Example: Calculate monthly metrics for the last 6 months
         today = datetime.today()
         six_months_ago = today - timedelta(days=180)
 
-        # Aggregate visits per month
-        visits_per_month = (
-            db.session.query(
-                db.func.strftime('%Y-%m', Visit.visit_date).label('month'),
-                db.func.count(Visit.id)
-            )
-            .filter(Visit.visit_date >= six_months_ago)
-            .group_by('month')
-            .order_by('month')
-            .all()
-        )
-
-        # Aggregate prescriptions per month
-        prescriptions_per_month = (
-            db.session.query(
-                db.func.strftime('%Y-%m', Prescription.start_date).label('month'),
-                db.func.count(Prescription.id)
-            )
-            .filter(Prescription.start_date >= six_months_ago)
-            .group_by('month')
-            .order_by('month')
-            .all()
+        # Monthly metrics come from the rollup table, cached until the next write
+        metrics = cache.get_or_set(
+            f"admin:dashboard:{six_months_ago:%Y-%m}",
+            lambda: self._dashboard_metrics(six_months_ago),
+            ttl=300,
+            tags=('visits', 'prescriptions', 'invoices', 'monthly_rollups'),
         )
 
-        # Aggregate invoices total per month
-        invoices_per_month = (
-            db.session.query(
-                db.func.strftime('%Y-%m', Invoice.invoice_date).label('month'),
-                db.func.sum(Invoice.total_amount).label('total_amount')
-            )
-            .filter(Invoice.invoice_date >= six_months_ago)
-            .group_by('month')
-            .order_by('month')
-            .all()
-        )
-
-        # Total active patients
-        active_patients_count = db.session.query(func.count(func.distinct(Visit.patient_id))).scalar()
-
-        # Prepare data for charts (convert query results to dict or lists)
-        def unpack_monthly_data(data, value_index=1):
-            months = [row[0] for row in data]
-            values = [row[value_index] for row in data]
-            return months, values
-
-        visits_months, visits_counts = unpack_monthly_data(visits_per_month)
-        prescriptions_months, prescriptions_counts = unpack_monthly_data(prescriptions_per_month)
-        invoices_months, invoices_totals = unpack_monthly_data(invoices_per_month, value_index=1)
-
         # Flash a welcome message
         flash("Welcome to the KMC EHR Admin Dashboard!", "info")
 
         # Render a custom dashboard template with metrics and charts
         return self.render(
             'admin/dashboard.html',
-            visits_months=visits_months,
-            visits_counts=visits_counts,
-            prescriptions_months=prescriptions_months,
-            prescriptions_counts=prescriptions_counts,
-            invoices_months=invoices_months,
-            invoices_totals=invoices_totals,
-            active_patients_count=active_patients_count,
+            **metrics,
             side_panel_links=[
                 {'name': 'Patients', 'url': '/admin/patient/'},
                 {'name': 'Visits', 'url': '/admin/visit/'},
@@ -93,7 +65,251 @@ class KMCAdminIndexView(AdminIndexView):
             ]
         )
 
-class PatientAdminView(ModelView):
+    @staticmethod
+    def _dashboard_metrics(since):
+        months, all_time = RollupService.dashboard(since)
+        periods = [row.period for row in months]
+        return {
+            'visits_months': periods,
+            'visits_counts': [row.visit_count for row in months],
+            'prescriptions_months': periods,
+            'prescriptions_counts': [row.prescription_count for row in months],
+            'invoices_months': periods,
+            'invoices_totals': [row.invoice_total for row in months],
+            'active_patients_count': all_time.active_patients if all_time else 0,
+        }
+
+    @expose('/cache-stats')
+    def cache_stats(self):
+        """Hit/miss counters for sizing the result cache"""
+        return jsonify(dict(cache.stats(), formulary=formulary.stats()))
+
+    @expose('/pdf-stats')
+    def pdf_stats(self):
+        """Queue depth and coalescing counters for the PDF workers"""
+        return jsonify(dict(renderer.stats(), document_cache=document_cache.stats()))
+
+    @expose('/analytics')
+    @router.read_only_view
+    def analytics(self):
+        """Drug, revenue and visit-type reports for ?start=&end= (YYYY-MM-DD) and ?period="""
+        try:
+            start, end = (date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                          for name in ('start', 'end'))
+            return jsonify(AnalyticsService.summary(start, end, request.args.get('period', 'month')))
+        except ValueError as exc:
+            return jsonify(error=str(exc)), 400
+
+    @expose('/vitals')
+    @router.read_only_view
+    def vitals(self):
+        """Triage distributions, BMI bands and BP stages for ?start=&end= (YYYY-MM-DD)"""
+        try:
+            start, end = (date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                          for name in ('start', 'end'))
+        except ValueError as exc:
+            return jsonify(error=str(exc)), 400
+        return jsonify(VitalsService.cohort(start, end))
+
+    @expose('/export')
+    def export(self):
+        """Date-range export form; the download streams from exports_bp.export"""
+        return self.render(
+            'admin/export.html', datasets=ExportService.DATASETS, formats=ExportService.FORMATS,
+        )
+
+class EagerLoadingModelView(ModelView):
+    """ModelView whose list query eager-loads what its columns render.
+
+    Without a profile each row lazy-loads its relationships while the list
+    template renders, so a page costs one query per row per relationship.
+    """
+    # Loader options applied to the list query, e.g. joinedload(Visit.patient)
+    list_loader_options = ()
+
+    # Replaced by the explicit profile above
+    column_auto_select_related = False
+
+    def get_query(self):
+        # get_count_query is left alone: loader options do not apply to COUNT(*)
+        return super().get_query().options(*self.list_loader_options)
+
+class KeysetPaginationMixin:
+    """Seek pagination for ModelViews over large, append-mostly tables.
+
+    The default list order walks keyset_columns newest first, and Newer/Older
+    links carry the boundary row's key instead of a page number, so every
+    page is an index range read however deep it is. The total shown is a
+    count cached for keyset_count_ttl seconds. Sorting by a column falls
+    back to Flask-Admin's OFFSET paging.
+    """
+    # Unique ordering key, newest first, e.g. (Visit.visit_date, Visit.id)
+    keyset_columns = ()
+    keyset_count_ttl = 60
+
+    list_template = 'admin/keyset_list.html'
+
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        if sort_column is not None or (page and not self._keyset_args()):
+            return super().get_list(page, sort_column, sort_desc, search, filters,
+                                    execute=execute, page_size=page_size)
+
+        page_size = page_size or self.page_size
+        query = self.get_query()
+        joins, count_joins = {}, {}
+        if self._search_supported and search:
+            query, _, joins, count_joins = self._apply_search(query, None, joins, count_joins, search)
+        if filters and self._filters:
+            query, _, joins, count_joins = self._apply_filters(query, None, joins, count_joins, filters)
+        for relation in self._auto_joins:
+            query = query.options(joinedload(relation))
+
+        direction, key = self._keyset_args()
+        newer = direction == 'before'
+        if key:
+            query = query.filter(self._keyset_condition(key, newer))
+        order = [column.asc() if newer else column.desc() for column in self.keyset_columns]
+        rows = query.order_by(*order).limit(page_size + 1).all()
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if newer:
+            rows.reverse()
+
+        g.keyset_pager = {
+            'newer_url': self._keyset_url('before', rows[0]) if rows and (has_more if newer else key) else None,
+            'older_url': self._keyset_url('after', rows[-1]) if rows and (newer or has_more) else None,
+        }
+        count = None if search or filters else self._approximate_count()
+        return count, rows
+
+    def render(self, template, **kwargs):
+        kwargs.setdefault('keyset', g.pop('keyset_pager', None))
+        return super().render(template, **kwargs)
+
+    def _keyset_args(self):
+        for direction in ('after', 'before'):
+            raw = request.args.get(direction)
+            if raw:
+                try:
+                    return direction, self._decode_key(raw)
+                except ValueError:
+                    break
+        return None, None
+
+    def _keyset_condition(self, key, newer):
+        """Row-value comparison spelt out so the leading column stays an index range"""
+        (first, *rest), (first_value, *rest_values) = self.keyset_columns, key
+        tail = and_(*[column > value if newer else column < value for column, value in zip(rest, rest_values)])
+        if newer:
+            return and_(first >= first_value, or_(first > first_value, tail))
+        return and_(first <= first_value, or_(first < first_value, tail))
+
+    def _keyset_url(self, direction, row):
+        args = {k: v for k, v in request.args.items(multi=False) if k not in ('after', 'before', 'page')}
+        args[direction] = self._encode_key(row)
+        return url_for('.index_view', **args)
+
+    def _encode_key(self, row):
+        values = [getattr(row, column.key) for column in self.keyset_columns]
+        return '~'.join(value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values)
+
+    def _decode_key(self, raw):
+        parts = raw.split('~')
+        if len(parts) != len(self.keyset_columns):
+            raise ValueError("Malformed keyset cursor")
+        values = []
+        for column, part in zip(self.keyset_columns, parts):
+            python_type = column.type.python_type
+            values.append(python_type.fromisoformat(part) if hasattr(python_type, 'fromisoformat') else python_type(part))
+        return values
+
+    def _approximate_count(self):
+        return cache.get_or_set(
+            f"admin:count:{self.model.__tablename__}",
+            lambda: self.get_count_query().scalar(),
+            ttl=self.keyset_count_ttl,
+        )
+
+class IndexedLookup(QueryAjaxModelLoader):
+    """Select2 lookup for form_ajax_refs that pages along an index.
+
+    Flask-Admin's own loader matches CAST(column AS TEXT) ILIKE '%term%',
+    which scans the whole table. Subclasses build matching_ids(), a SELECT
+    of ids ordered by an index that serves the term as a prefix; a page of
+    it is fetched and only those rows are loaded, so neither the form nor a
+    lookup grows with the table.
+    """
+
+    def __init__(self, name, model, label):
+        super().__init__(name, db.session, model, fields=('id',))
+        self.label = label
+
+    def format(self, model):
+        if not model:
+            return None
+        return model.id, self.label(model)
+
+    def get_list(self, term, offset=0, limit=DEFAULT_PAGE_SIZE):
+        ids = [row[0] for row in db.session.execute(self.matching_ids((term or '').strip(), offset, limit))]
+        rows = {row.id: row for row in self.get_query().filter(self.model.id.in_(ids))}
+        return [rows[id] for id in ids if id in rows]
+
+    def matching_ids(self, term, offset, limit):
+        raise NotImplementedError
+
+    @staticmethod
+    def _prefix(column, word):
+        """column starts with word, as a range so an index on column serves it"""
+        return and_(column >= word, column < word + '\uffff')
+
+
+class PatientLookup(IndexedLookup):
+    """Patients by ID, name or phone prefix through the patient_search index, newest first when empty"""
+
+    def __init__(self, name):
+        super().__init__(name, Patient, lambda patient: f"{patient.full_name} ({patient.patient_id})")
+
+    def matching_ids(self, term, offset, limit):
+        if not term:
+            return select(Patient.id).order_by(Patient.id.desc()).offset(offset).limit(limit)
+        return PatientSearchService.matching_ids(term, ranked=True, limit=limit, offset=offset)
+
+
+class DoctorLookup(IndexedLookup):
+    """Active doctors whose first or last name starts with each word"""
+
+    def __init__(self, name):
+        super().__init__(name, Doctor, lambda doctor: doctor.full_name)
+
+    def matching_ids(self, term, offset, limit):
+        query = select(Doctor.id).where(Doctor.is_active.is_(True))
+        for word in term.lower().split():
+            query = query.where(or_(
+                self._prefix(func.lower(Doctor.last_name), word),
+                self._prefix(func.lower(Doctor.first_name), word),
+            ))
+        return query.order_by(func.lower(Doctor.last_name), Doctor.id).offset(offset).limit(limit)
+
+
+class VisitLookup(IndexedLookup):
+    """Visits by visit ID prefix or by patient, newest first"""
+
+    def __init__(self, name):
+        super().__init__(name, Visit, lambda visit: f"{visit.visit_id} - {visit.visit_date:%Y-%m-%d}")
+
+    def matching_ids(self, term, offset, limit):
+        query = select(Visit.id).order_by(Visit.visit_date.desc(), Visit.id.desc())
+        if term.upper().startswith('KMC-'):
+            query = query.where(self._prefix(Visit.visit_id, term.upper()))
+        elif term:
+            query = query.where(Visit.patient_id.in_(PatientSearchService.matching_ids(term)))
+        return query.offset(offset).limit(limit)
+
+
+class PatientAdminView(KeysetPaginationMixin, ModelView):
+    keyset_columns = (Patient.created_at, Patient.id)
     column_list = ['patient_id', 'full_name', 'age', 'gender', 'phone', 'email', 'address']
     column_searchable_list = ['patient_id', 'first_name', 'last_name', 'phone']
     column_filters = ['gender', 'age']
@@ -114,6 +330,44 @@ class PatientAdminView(ModelView):
         }
     }
 
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        """Match the search box against the patient_search index instead of LIKE scans"""
+        if not search.strip():
+            return query, count_query, joins, count_joins
+        condition = PatientSearchService.filter_condition(search)
+        query = query.filter(condition)
+        if count_query is not None:
+            count_query = count_query.filter(condition)
+        return query, count_query, joins, count_joins
+
+    @expose('/import/', methods=('GET', 'POST'))
+    def import_view(self):
+        """Upload a CSV/XLSX registry and import it in the background"""
+        if request.method == 'POST':
+            upload = request.files.get('file')
+            filename = secure_filename(upload.filename) if upload else ''
+            if not filename.lower().endswith(('.csv', '.xlsx', '.xlsm')):
+                flash("Choose a .csv or .xlsx file to import.", "error")
+                return redirect(url_for('.import_view'))
+            directory = os.path.join(current_app.instance_path, 'imports')
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, filename)
+            upload.save(path)
+            threading.Thread(
+                target=self._run_import, args=(current_app._get_current_object(), path), daemon=True
+            ).start()
+            flash(f"Importing {filename}; progress is shown below.", "success")
+            return redirect(url_for('.import_view'))
+        return self.render('admin/patient_import.html', imports=PatientImportService.progress())
+
+    @staticmethod
+    def _run_import(app, path):
+        with app.app_context():
+            try:
+                PatientImportService.import_file(path)
+            except Exception:
+                app.logger.exception("Patient import of %s failed", path)
+
     @action('start_visit', 'Start Visit', 'Start a new visit for selected patients?')
     def action_start_visit(self, ids):
         for patient_id in ids:
@@ -166,13 +420,12 @@ class DoctorAdminView(ModelView):
             ('surgery', 'Surgery')
         ]
     }
-    def on_model_change(self, form, model, is_created):
-        if is_created:
-            model.doctor_id = Doctor.generate_doctor_id()
 
 
-class VisitAdminView(ModelView):
+class VisitAdminView(KeysetPaginationMixin, EagerLoadingModelView):
+    keyset_columns = (Visit.visit_date, Visit.id)
     column_list = ['id', 'patient', 'doctor', 'visit_date', 'visit_type', 'status']
+    list_loader_options = (joinedload(Visit.patient), joinedload(Visit.doctor))
     column_labels = {
         'patient': 'Patient Name',
         'doctor': 'Attending Doctor'
@@ -191,33 +444,37 @@ class VisitAdminView(ModelView):
     }
     
     form_columns = ['patient', 'doctor', 'visit_date', 'visit_type', 'status']
+    form_ajax_refs = {
+        'patient': PatientLookup('patient'),
+        'doctor': DoctorLookup('doctor'),
+    }
     
     form_overrides = {
         'visit_date': DateTimeField,
         'visit_type': SelectField,
         'status': SelectField,
-        'patient': SelectField,  
-        'doctor': SelectField
     }
 
     form_args = {
         'visit_type': {
             'choices': [
-                ('walk-in', 'Walk-in', True, {}),
-                ('scheduled', 'Scheduled', False, {}),
-                ('appointment', 'Appointment', False, {}),
-                ('emergency', 'Emergency', False, {}),
-                ('follow-up', 'Follow-up', False, {})
+                ('walk-in', 'Walk-in'),
+                ('scheduled', 'Scheduled'),
+                ('appointment', 'Appointment'),
+                ('emergency', 'Emergency'),
+                ('follow-up', 'Follow-up')
             ],
+            'default': 'walk-in',
             'validators': [DataRequired()]
         },
         'status': {
             'choices': [
-                ('scheduled', 'Scheduled', False, {}),
-                ('in-progress', 'In Progress', True, {}),
-                ('completed', 'Completed', False, {}),
-                ('cancelled', 'Cancelled', False, {})
+                ('scheduled', 'Scheduled'),
+                ('in-progress', 'In Progress'),
+                ('completed', 'Completed'),
+                ('cancelled', 'Cancelled')
             ],
+            'default': 'in-progress',
             'validators': [DataRequired()]
         },
         'visit_date': {
@@ -226,28 +483,6 @@ class VisitAdminView(ModelView):
         }
     }
 
-    def on_form_prefill(self, form, id):
-        """Load dynamic choices when editing an existing record"""
-        self._load_dynamic_choices(form)
-
-    def create_form(self, obj=None):
-        """Load dynamic choices when creating a new record"""
-        form = super(VisitAdminView, self).create_form(obj)
-        self._load_dynamic_choices(form)
-        return form
-
-    def _load_dynamic_choices(self, form):
-        """Helper method to load patient and doctor choices"""
-        from application.models.models import Patient, Doctor
-        
-        # Load patients
-        patients = Patient.query.order_by(Patient.full_name).all()
-        form.patient.choices = [(str(p.id), p.full_name) for p in patients]
-        
-        # Load active doctors
-        doctors = Doctor.query.filter_by(is_active=True).order_by(Doctor.full_name).all()
-        form.doctor.choices = [(str(d.id), d.full_name) for d in doctors]
-
     def on_model_change(self, form, model, is_created):
         """Handle post-create/update actions"""
         from application.models.models import Triage
@@ -264,7 +499,7 @@ class VisitAdminView(ModelView):
         db.session.commit()
 
 
-class VisitReportView(ModelView):
+class VisitReportView(EagerLoadingModelView):
     can_create = True
     can_edit = True
     can_delete = False
@@ -272,7 +507,10 @@ class VisitReportView(ModelView):
 
     # Field display options
     column_list = ['visit_date', 'patient', 'doctor', 'final_diagnosis']
+    list_loader_options = (joinedload(VisitReport.patient), joinedload(VisitReport.doctor))
     
+    form_ajax_refs = {'patient': PatientLookup('patient')}
+
     # Set editable form columns (no nested/related fields)
     form_columns = [
         'patient', 'visit_date',
@@ -342,31 +580,28 @@ class VisitReportView(ModelView):
             model.doctor_id = current_user.id
 
     # Add print icon in list view
-    column_extra_row_actions = [{
-        'label': 'Print',
-        'url': lambda view, context, model, name: url_for('.print_report', report_id=model.id),
-        'icon_class': 'glyphicon glyphicon-print'
-    }]
+    column_extra_row_actions = [
+        EndpointLinkRowAction('fa fa-print', '.print_report', title='Print', id_arg='report_id')
+    ]
 
     # Templates (if needed for customization)
-    list_template = 'reports/visit_report_list.html'
     edit_template = 'reports/visit_report_edit.html'
 
     # PDF Print Route
     @expose('/print/<int:report_id>')
     def print_report(self, report_id):
         report = VisitReport.query.get_or_404(report_id)
-        rendered = render_template('admin/visit_report_print.html', report=report)
-        pdf = pdfkit.from_string(rendered, False)
-
-        response = make_response(pdf)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'inline; filename=report_{report_id}.pdf'
-        return response
+        template = 'reports/visit_report_list.html'
+        return queue_pdf(
+            template, f'report_{report_id}.pdf',
+            cache_key=DocumentService.report_cache_key(report, template), report=report,
+        )
 
-class PrescriptionAdminView(ModelView):
+class PrescriptionAdminView(EagerLoadingModelView):
     column_list = ['id', 'visit', 'dosage', 'frequency', 'start_date']
+    list_loader_options = (joinedload(Prescription.visit),)
     form_columns = ['visit', 'dosage', 'frequency', 'quantity', 'status', 'start_date', 'end_date']
+    form_ajax_refs = {'visit': VisitLookup('visit')}
     form_args = {
         'status': {
             'validators': [DataRequired()],
@@ -385,18 +620,51 @@ class PrescriptionAdminView(ModelView):
         'end_date': DateField('End date', format='%Y-%m-%d')
     }
 
-    
-    def on_model_change(self, form, model, is_created):
-        if is_created:
-            drug = Drug.query.get(model.drug_id)
-            if drug.stock >= model.quantity:
-                drug.stock -= model.quantity
-            else:
-                raise ValidationError("Insufficient drug stock")
+    def handle_view_exception(self, exc):
+        # Stock is reserved by the ledger when the prescribed drugs are flushed
+        if isinstance(exc, InsufficientStock):
+            flash(str(exc), 'error')
+            return True
+        return super().handle_view_exception(exc)
+
+    @action('print_prescriptions', 'Print Prescriptions')
+    def action_print_prescriptions(self, ids):
+        """Selected prescriptions as one Word document, a page each"""
+        prescriptions = (
+            Prescription.query
+            .options(
+                joinedload(Prescription.patient), joinedload(Prescription.doctor),
+                selectinload(Prescription.prescription_drugs).joinedload(PrescriptionDrug.drug),
+            )
+            .filter(Prescription.id.in_(ids))
+            .order_by(Prescription.id)
+            .all()
+        )
+        return send_file(
+            DocumentService.generate_prescriptions(prescriptions),
+            as_attachment=True,
+            download_name='prescriptions.docx',
+            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        )
             
 
-class InvoiceView(ModelView):
-    column_list = ['id', 'patient', 'invoice_date', 'total_amount']
+class OutstandingInvoiceFilter(BaseSQLAFilter):
+    """Invoices with a balance still due, for the front desk's follow-up list"""
+
+    def __init__(self):
+        super().__init__(Invoice.id, 'Balance', options=(('1', 'Outstanding'),))
+
+    def apply(self, query, value, alias=None):
+        return InvoiceService.outstanding(query)
+
+    def operation(self):
+        return 'is'
+
+class InvoiceView(KeysetPaginationMixin, EagerLoadingModelView):
+    keyset_columns = (Invoice.created_at, Invoice.id)
+    column_list = ['id', 'patient', 'invoice_date', 'total_amount', 'amount_paid', 'balance_due']
+    column_filters = [OutstandingInvoiceFilter()]
+    list_loader_options = (joinedload(Invoice.patient),)
     
     form_columns = [
         'patient',
@@ -414,12 +682,9 @@ class InvoiceView(ModelView):
         (
             InvoiceItem,
             {
-                'form_columns': ['drugs', 'description', 'quantity', 'unit_price'],
+                # id is rendered as a hidden field, so a submitted line updates its own row
+                'form_columns': ['id', 'drug_id', 'description', 'quantity', 'unit_price'],
                 'form_args': {
-                    'drugs': {
-                        'query_factory': lambda: Drug.query.filter_by(is_active=True),
-                        'get_label': 'name'
-                    },
                     'unit_price': {
                         'validators': [NumberRange(min=0)]
                     },
@@ -428,8 +693,11 @@ class InvoiceView(ModelView):
                     }
                 },
                 'form_extra_fields': {
-                    'unit_price': DecimalField('Unit Price', validators=[NumberRange(min=0)]),
-                    'quantity': DecimalField('Quantity', validators=[NumberRange(min=1)])
+                    # Choices come from the in-memory formulary, not a query per item row
+                    'drug_id': SelectField('Drug', coerce=int, choices=formulary.choices),
+                    # Left blank, the formulary price is used
+                    'unit_price': DecimalField('Unit Price', validators=[Optional(), NumberRange(min=0)]),
+                    'quantity': IntegerField('Quantity', validators=[NumberRange(min=1)])
                 }
             }
         )
@@ -439,23 +707,13 @@ class InvoiceView(ModelView):
     edit_template = 'billing/invoice_edit.html'
     details_template = 'billing/invoice_details.html'
 
-    form_args = {
-        'patient': {
-            'query_factory': lambda: Patient.query.order_by(Patient.full_name),
-            'get_label': 'full_name'
-        },
-        'visit': {
-            'query_factory': lambda: Visit.query.order_by(Visit.visit_date.desc()),
-            'get_label': 'visit_reference'  # Assumes you have this property defined
-        }
+    form_ajax_refs = {
+        'patient': PatientLookup('patient'),
+        'visit': VisitLookup('visit'),
     }
 
     column_extra_row_actions = [
-        {
-            'label': 'Print',
-            'url': 'invoice.print_invoice',
-            'icon_class': 'glyphicon glyphicon-print'
-        }
+        EndpointLinkRowAction('fa fa-print', '.print_invoice', title='Print', id_arg='invoice_id')
     ]
 
     form_create_rules = [
@@ -476,24 +734,56 @@ class InvoiceView(ModelView):
     ]
     form_edit_rules = form_create_rules
 
-    def create_form(self, obj=None):
-        form = super().create_form(obj)
-        form.patient.query = Patient.query.order_by(Patient.full_name)
-        return form
-
     def on_model_change(self, form, model, is_created):
         if is_created and not getattr(model, 'doctor_id', None):
             model.doctor_id = current_user.id  # Assumes Flask-Login is used
+        # Loading a retired line's drug must not flush the lines before they are checked
+        with db.session.no_autoflush:
+            for item in model.invoice_items:
+                drug = formulary.get(item.drug_id)
+                if drug is None:
+                    # A line keeps a drug taken off the formulary after it was billed;
+                    # only new lines and changed drugs must be active
+                    history = attributes.get_history(item, 'drug_id')
+                    if item.id is None or history.deleted:
+                        raise ValidationError(f"Drug {item.drug_id} is not in the formulary")
+                    drug = {'name': item.drugs.name, 'unit_price': item.drugs.unit_price}
+                if item.unit_price is None:
+                    item.unit_price = drug['unit_price']
+                item.description = item.description or drug['name']
+                item.item_type = item.item_type or 'medication'
+                item.total_price = item.unit_price * item.quantity
+
+    def edit_form(self, obj=None):
+        form = super().edit_form(obj)
+        billed = {item.drug_id for item in obj.invoice_items} if obj is not None else set()
+        retired = sorted(drug_id for drug_id in billed if formulary.get(drug_id) is None)
+        if retired:
+            # Lines billed before their drug left the formulary stay editable
+            choices = formulary.choices() + [
+                (drug.id, f"{drug.name} {drug.strength or ''}".rstrip() + ' (inactive)')
+                for drug in Drug.query.filter(Drug.id.in_(retired)).order_by(Drug.name)
+            ]
+            for entry in form.invoice_items.entries:
+                entry.form.drug_id.choices = choices
+        return form
+
+    def get_query(self):
+        # amount_paid and balance_due come from the list query itself
+        return InvoiceService.with_balances(super().get_query())
+
+    def render(self, template, **kwargs):
+        # Lets the form fill a line's price and description as soon as a drug is picked
+        return super().render(template, drug_prices=formulary.prices(), **kwargs)
 
     @expose('/print/<int:invoice_id>')
     def print_invoice(self, invoice_id):
         invoice = Invoice.query.get_or_404(invoice_id)
-        rendered = render_template('billing/invoice_print.html', invoice=invoice)
-        pdf = pdfkit.from_string(rendered, False)
-        response = make_response(pdf)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'inline; filename=invoice{invoice_id}.pdf'
-        return response
+        template = 'billing/invoice_print.html'
+        return queue_pdf(
+            template, f'invoice{invoice_id}.pdf',
+            cache_key=DocumentService.invoice_cache_key(invoice, template), invoice=invoice,
+        )
 
     @expose('/preview/<int:invoice_id>')
     def preview_invoice(self, invoice_id):
@@ -503,30 +793,40 @@ class InvoiceView(ModelView):
     @expose('/download/<int:invoice_id>')
     def download_pdf(self, invoice_id):
         invoice = Invoice.query.get_or_404(invoice_id)
-        rendered = render_template('billing/invoice_print.html', invoice=invoice)
-        config = pdfkit.configuration(wkhtmltopdf='/usr/local/bin/wkhtmltopdf')  # if needed
-        pdf = pdfkit.from_string(rendered, False, configuration=config)
-
-        response = make_response(pdf)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=invoice_{invoice_id}.pdf'
-        return response
+        template = 'billing/invoice_print.html'
+        return queue_pdf(
+            template, f'invoice_{invoice_id}.pdf', download=True,
+            cache_key=DocumentService.invoice_cache_key(invoice, template), invoice=invoice,
+        )
 
 
-class TriageAdminView(ModelView):
+class TriageAdminView(EagerLoadingModelView):
     column_list = ['visit', 'blood_pressure', 'temperature', 'pulse', 'bmi']
+    list_loader_options = (joinedload(Triage.visit),)
     form_columns = ['visit', 'height', 'weight', 'temperature', 
                     'blood_pressure_systolic', 'blood_pressure_diastolic', 
                     'pulse', 'notes']
+    form_ajax_refs = {'visit': VisitLookup('visit')}
 
     def on_model_change(self, form, model, is_created):
         if model.height > 0 and model.weight:
             model.bmi = round(model.weight / ((model.height / 100) ** 2))
 
-class PaymentAdminView(ModelView):
+class PaymentAdminView(EagerLoadingModelView):
     column_list = ['invoice', 'amount', 'payment_method', 'payment_date']
+    list_loader_options = (joinedload(Payment.invoice),)
     form_columns = ['invoice', 'amount', 'payment_method', 'payment_date', 'transaction_reference']
 
+class StockMovementView(EagerLoadingModelView):
+    """The stock ledger is append-only; receipts go through `flask stock receive`"""
+    can_create = False
+    can_edit = False
+    can_delete = False
+    column_list = ['created_at', 'drug', 'quantity', 'reason', 'prescription_id', 'note']
+    column_filters = ['reason', 'created_at']
+    column_default_sort = ('id', True)
+    list_loader_options = (joinedload(StockMovement.drug),)
+
 def setup_admin(app):
     admin = Admin(
         app,
@@ -544,7 +844,15 @@ def setup_admin(app):
     admin.add_view(TriageAdminView(Triage, db.session, name='Triage', category='Medical'))
     admin.add_view(PrescriptionAdminView(Prescription, db.session, name='Prescriptions', category='Medical'))
     admin.add_view(ModelView(Drug, db.session, name='Drug Inventory', category='Pharmacy'))
+    admin.add_view(StockMovementView(StockMovement, db.session, name='Stock Ledger', category='Pharmacy'))
     admin.add_view(PaymentAdminView(Payment, db.session, name='Payments', category='Billing'))
     admin.add_view(ModelView(Doctor, db.session, name='Doctors', category='Staff'))
     admin.add_view(VisitReportView(VisitReport, db.session, name='Medical Form', category='Medical'))
-    admin.add_view(InvoiceView(Invoice, db.session, name='Invoices', category="Billing"))
\ No newline at end of file
+    admin.add_view(InvoiceView(Invoice, db.session, name='Invoices', category="Billing"))
+
+    # List, detail and CSV export pages of every model view read from the read engine
+    router.mark(*(
+        f'{view.endpoint}.{name}'
+        for view in admin._views if isinstance(view, ModelView)
+        for name in ('index_view', 'details_view', 'export')
+    ))
@@ -1,67 +1,138 @@
-from flask import app, request, jsonify
-from application.models.models import Patient
-from application.services.patient_service import PatientService
-from application.services.visit_service import VisitService
+import json
 
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from sqlalchemy.exc import SQLAlchemyError
 
-@app.route('/patients', methods=['POST'])
-def register_patient():
-    data = request.get_json()
+from application.extensions import db, router
+from application.models.models import Drug
+from application.services.batch_service import BatchService
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+NDJSON = 'application/x-ndjson'
+
+
+def _items():
+    """The request body as a list of objects, and whether it was a single object"""
+    data = request.get_json(silent=True)
+    single = isinstance(data, dict)
+    items = [data] if single else data
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        abort(400, description="Body must be a JSON object or an array of objects")
+    limit = current_app.config.get('API_BATCH_LIMIT', 1000)
+    if len(items) > limit:
+        abort(413, description=f"At most {limit} items per request")
+    return items, single
+
+
+def _write(apply, items, single):
+    """Run a batch write; one object gets its result back, an array gets every item's"""
     try:
-        patient = PatientService.register_patient(data)
-        return jsonify({
-            'message': 'Patient registered successfully',
-            'patient_id': patient.custom_id,
-            'public_id': patient.public_id
-        }), 201
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
-    
-@app.route('patient/<int:patient_id>')
+        results = apply(items) if items else []
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.exception("API batch write failed")
+        return jsonify({'error': f"Nothing was saved: {e.__class__.__name__}"}), 409
+    if single:
+        result = results[0]
+        return jsonify(result), 400 if result['status'] == 'error' else 201
+    failed = sum(result['status'] == 'error' for result in results)
+    return jsonify({'saved': len(results) - failed, 'failed': failed, 'results': results})
+
+
+def _read(dataset, ids):
+    """Rows for ids (or every row, NDJSON only) as one JSON document or streamed NDJSON lines.
+
+    The JSON document lists the ids that matched nothing under 'missing'.
+    """
+    ndjson = request.args.get('format') == 'ndjson' or (
+        request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+    )
+    if ids is not None:
+        limit = current_app.config.get('API_READ_LIMIT', 10000)
+        if len(ids) > limit:
+            abort(413, description=f"At most {limit} ids per request")
+    elif not ndjson:
+        abort(400, description="ids is required unless the response is NDJSON")
+
+    if not ndjson:
+        items = list(BatchService.read(dataset, ids))
+        found = {item[BatchService.CODES[dataset]] for item in items}
+        return jsonify({'items': items, 'missing': [code for code in ids if code not in found]})
+
+    def lines():
+        for row in BatchService.read(dataset, ids):
+            yield json.dumps(row, default=str) + '\n'
+
+    return Response(stream_with_context(router.stream(lines())), mimetype=NDJSON, headers={'X-Accel-Buffering': 'no'})
+
+
+def _ids():
+    """?ids=A,B&ids=C -> ['A', 'B', 'C'], None when not given"""
+    if 'ids' not in request.args:
+        return None
+    return list(dict.fromkeys(
+        value.strip() for values in request.args.getlist('ids') for value in values.split(',') if value.strip()
+    ))
+
+
+@api.route('/patients', methods=['POST'])
+def create_patients():
+    return _write(BatchService.create_patients, *_items())
+
+
+@api.route('/patients')
+@router.read_only_view
+def get_patients():
+    return _read('patients', _ids())
+
+
+@api.route('/patients/<patient_id>')
 def get_patient(patient_id):
-    patient = Patient.query.get_or_404(patient_id)
-    return {
-        'id': patient_id,
-        'full_name': patient.full_name,
-        'gender': patient.gender,
-        'address': patient.address,
-        'email': patient.email
-    }
-
-@app.route('/drug/<int:drug_id>')
+    return jsonify(next(BatchService.read('patients', [patient_id]), None) or abort(404))
+
+
+@api.route('/visits', methods=['POST'])
+def create_visits():
+    return _write(BatchService.create_visits, *_items())
+
+
+@api.route('/visits')
+@router.read_only_view
+def get_visits():
+    return _read('visits', _ids())
+
+
+@api.route('/visits/<path:visit_id>')
+def get_visit(visit_id):
+    return jsonify(next(BatchService.read('visits', [visit_id]), None) or abort(404))
+
+
+@api.route('/triage', methods=['POST'])
+def update_triage_batch():
+    return _write(BatchService.update_triage, *_items())
+
+
+@api.route('/triage')
+@router.read_only_view
+def get_triage():
+    """Triage by visit KMC ID"""
+    return _read('triage', _ids())
+
+
+@api.route('/visits/<path:visit_id>/triage', methods=['PUT'])
+def update_triage(visit_id):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, description="Body must be a JSON object")
+    return _write(BatchService.update_triage, [dict(data, visit_id=visit_id)], True)
+
+
+@api.route('/drugs/<int:drug_id>')
 def get_drug(drug_id):
-    drug = drug.qury.get_or_404(drug_id)
-    return{
+    drug = db.get_or_404(Drug, drug_id)
+    return jsonify({
         'id': drug.id,
         'name': drug.name,
-        'unit_prize': float(drug.unit_price)
-    }
-
-@app.route('/visits', methods=['POST'])
-def create_visit():
-    data = request.get_json()
-    try:
-        visit = VisitService.create_visit(
-            data['patient_id'],  # custom_id
-            data['doctor_id'],   # custom_id
-            data['visit_type']
-        )
-        return jsonify({
-            'message': 'Visit created successfully',
-            'visit_id': visit.id
-        }), 201
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
-
-@app.route('/visits/<int:visit_id>/triage', methods=['PUT'])
-def update_triage(visit_id):
-    data = request.get_json()
-    try:
-        triage = VisitService.update_triage(visit_id, data)
-        return jsonify({
-            'message': 'Triage updated successfully',
-            'bmi': triage.bmi
-        }), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
-    
\ No newline at end of file
+        'unit_price': float(drug.unit_price),
+    })
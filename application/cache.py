@@ -0,0 +1,254 @@
+from collections import OrderedDict
+from functools import wraps
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """Per-process LRU store"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return {tag: self._versions.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """File-backed store shared by every worker process on the host"""
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed ON cache_entries (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(row[0])
+
+    def set(self, key, entry):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, accessed_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(entry, pickle.HIGHEST_PROTOCOL), time.time()),
+        )
+        excess = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE key IN "
+                "(SELECT key FROM cache_entries ORDER BY accessed_at LIMIT ?)", (excess,)
+            )
+            self.evictions += excess
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def tag_versions(self, tags):
+        if not tags:
+            return {}
+        rows = self._connect().execute(
+            f"SELECT tag, version FROM cache_tags WHERE tag IN ({','.join('?' * len(tags))})", tuple(tags)
+        ).fetchall()
+        versions = dict(rows)
+        return {tag: versions.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        self._connect().executemany(
+            "INSERT INTO cache_tags (tag, version) VALUES (?, 1) "
+            "ON CONFLICT(tag) DO UPDATE SET version = version + 1",
+            [(tag,) for tag in tags],
+        )
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM cache_entries")
+        conn.execute("DELETE FROM cache_tags")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+
+class ResultCache:
+    """Caches computed results with per-key TTLs and tag invalidation.
+
+    Entries are tagged with the table names they were computed from. Every
+    commit that touched one of those tables bumps the tag's version, which
+    makes older entries stale without having to find and delete them.
+    """
+
+    def __init__(self):
+        self.backend = MemoryBackend()
+        self.default_ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self._listening = False
+
+    def init_app(self, app):
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        if backend == 'sqlite':
+            path = app.config.get('CACHE_SQLITE_PATH') or os.path.join(app.instance_path, 'cache.db')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.backend = SQLiteBackend(path, app.config.get('CACHE_MAX_ENTRIES', 10000))
+        else:
+            self.backend = MemoryBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 300)
+        self._listen()
+        app.extensions['result_cache'] = self
+
+    def get(self, key, default=None):
+        entry = self.backend.get(key)
+        if entry is not None:
+            expires_at, versions, value = entry
+            if expires_at > time.time() and self.backend.tag_versions(list(versions)) == versions:
+                self.hits += 1
+                return value
+            self.backend.delete(key)
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None, tags=(), versions=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        if versions is None:
+            versions = self.backend.tag_versions(list(tags))
+        self.backend.set(key, (time.time() + ttl, versions, value))
+
+    def get_or_set(self, key, compute, ttl=None, tags=()):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            # Versions are read before computing, so a commit that lands
+            # mid-computation leaves the stored entry already stale
+            versions = self.backend.tag_versions(list(tags))
+            value = compute()
+            self.set(key, value, ttl, versions=versions)
+        return value
+
+    def cached(self, ttl=None, tags=()):
+        """Decorator caching a function's result per argument tuple"""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = f"{fn.__module__}.{fn.__qualname__}:{args!r}:{sorted(kwargs.items())!r}"
+                return self.get_or_set(key, lambda: fn(*args, **kwargs), ttl, tags)
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        if tags:
+            self.backend.bump(tags)
+
+    def touch(self, session, *tags):
+        """Invalidate tags when session commits, for tables it wrote outside the ORM"""
+        session.info.setdefault('cache_tags', set()).update(tags)
+
+    def forget(self, session, *keys):
+        """Delete keys when session commits, for entries kept per row rather than per table"""
+        session.info.setdefault('cache_keys', set()).update(keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'max_entries': self.backend.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.backend.evictions,
+        }
+
+    def _listen(self):
+        if self._listening:
+            return
+        event.listen(Session, 'after_flush', self._collect_tags)
+        event.listen(Session, 'after_commit', self._invalidate_committed)
+        event.listen(Session, 'after_rollback', self._discard_tags)
+        self._listening = True
+
+    @staticmethod
+    def _collect_tags(session, flush_context):
+        tags = session.info.setdefault('cache_tags', set())
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            table = getattr(obj, '__tablename__', None)
+            if table:
+                tags.add(table)
+
+    def _invalidate_committed(self, session):
+        tags = session.info.pop('cache_tags', None)
+        if tags:
+            self.invalidate(*tags)
+        for key in session.info.pop('cache_keys', ()):
+            self.backend.delete(key)
+
+    @staticmethod
+    def _discard_tags(session):
+        session.info.pop('cache_tags', None)
+        session.info.pop('cache_keys', None)
@@ -0,0 +1,83 @@
+import click
+from flask.cli import AppGroup
+
+from application.extensions import cache, db
+from application.services.import_service import PatientImportService
+from application.services.rollup_service import RollupService
+from application.services.search_service import PatientSearchService
+from application.services.stock_service import StockService
+
+rollups_cli = AppGroup('rollups', help='Maintain the dashboard rollup tables.')
+search_cli = AppGroup('search', help='Maintain the patient search index.')
+patients_cli = AppGroup('patients', help='Bulk patient operations.')
+stock_cli = AppGroup('stock', help='Drug stock ledger.')
+
+
+@rollups_cli.command('rebuild')
+def rebuild_rollups():
+    """Backfill monthly_rollups and patient_activity from the source tables"""
+    periods = RollupService.rebuild()
+    cache.invalidate('monthly_rollups')
+    click.echo(f"Rebuilt rollups for {periods} period(s).")
+
+
+@search_cli.command('rebuild')
+def rebuild_search():
+    """Re-index every patient, e.g. after a bulk import"""
+    with db.engine.begin() as connection:
+        if not PatientSearchService.available(connection):
+            click.echo("Full-text search needs SQLite FTS5; searches use LIKE on this database.")
+            return
+        PatientSearchService.ensure_index(connection)
+        patients = PatientSearchService.rebuild(connection)
+    click.echo(f"Indexed {patients} patient(s).")
+
+
+@patients_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', type=int, default=None, help='Rows per transaction.')
+@click.option('--errors', 'error_path', default=None, help='Error report CSV (default: PATH.errors.csv).')
+def import_patients(path, chunk_size, error_path):
+    """Import patients from a CSV or XLSX file, resuming an interrupted run"""
+    result = PatientImportService.import_file(path, chunk_size=chunk_size, error_path=error_path)
+    click.echo(
+        f"Imported {result['imported']} patient(s), rejected {result['rejected']} "
+        f"of {result['rows_done']} row(s). Rejected rows: {result['error_report']}"
+    )
+
+
+@stock_cli.command('snapshot')
+def snapshot_stock():
+    """Fold new ledger movements into stock_snapshots; schedule this e.g. nightly"""
+    with db.engine.begin() as connection:
+        drugs = StockService.snapshot(connection)
+    click.echo(f"Snapshotted {drugs} drug(s).")
+
+
+@stock_cli.command('receive')
+@click.argument('drug_id', type=int)
+@click.argument('quantity', type=click.IntRange(min=1))
+@click.option('--note', default=None, help='Delivery note or supplier reference.')
+def receive_stock(drug_id, quantity, note):
+    """Book a delivery of QUANTITY units of DRUG_ID into stock"""
+    with db.engine.begin() as connection:
+        StockService.receive(connection, drug_id, quantity, note)
+    cache.invalidate('drugs', 'stock_movements')
+    click.echo(f"Received {quantity} unit(s) of drug {drug_id}.")
+
+
+@stock_cli.command('check')
+def check_stock():
+    """Compare drugs.stock with the ledger balance of every drug"""
+    with db.engine.connect() as connection:
+        discrepancies = StockService.discrepancies(connection)
+    for drug_id, (stock, balance) in sorted(discrepancies.items()):
+        click.echo(f"drug {drug_id}: drugs.stock={stock} ledger={balance}")
+    click.echo(f"{len(discrepancies)} discrepancy(ies).")
+
+
+def register_commands(app):
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(patients_cli)
+    app.cli.add_command(stock_cli)
@@ -0,0 +1,120 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+class DocumentCache:
+    """On-disk store for generated documents, addressed by a hash of their inputs.
+
+    Files are named <owner>-<key><suffix>, where owner is e.g. "invoice-12"
+    and key hashes everything the document was built from. Any edit to those
+    inputs yields a new key, so a stale file can never be served; the ORM
+    listeners additionally drop an owner's files to reclaim the space. Reads
+    touch the file's mtime and the least recently used files are evicted
+    once the directory grows past max_bytes.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.max_bytes = 256 * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config.get('DOCUMENT_CACHE_DIR') or os.path.join(app.instance_path, 'documents')
+        self.max_bytes = app.config.get('DOCUMENT_CACHE_MAX_BYTES', self.max_bytes)
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+        app.extensions['document_cache'] = self
+
+    @staticmethod
+    def key(*parts):
+        """Stable digest of parts (rows as dicts, mtimes, ...)"""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, owner, key, suffix):
+        """Path of the cached document, or None"""
+        path = self._path(owner, key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, owner, key, suffix, data):
+        """Store data atomically and return its path"""
+        path = self._path(owner, key, suffix)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def get_or_build(self, owner, key, suffix, build):
+        """Path of the cached document, calling build() for its bytes on a miss"""
+        return self.get(owner, key, suffix) or self.put(owner, key, suffix, build())
+
+    def invalidate(self, owner):
+        if self.directory is None:
+            return
+        for path in glob.glob(os.path.join(glob.escape(self.directory), f'{glob.escape(owner)}-*')):
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                self._size -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'directory': self.directory,
+            'bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+        }
+
+    def _path(self, owner, key, suffix):
+        return os.path.join(self.directory, f'{owner}-{key}{suffix}')
+
+    def _entries(self):
+        """(mtime, size, path) for every cached file"""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        # Rescan rather than trust _size: other worker processes share the directory
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            self.evictions += 1
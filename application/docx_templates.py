@@ -0,0 +1,222 @@
+from io import BytesIO
+import os
+import re
+import threading
+import zipfile
+
+from lxml import etree
+
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+PLACEHOLDER = re.compile(r'\[([A-Z][A-Z0-9_]*)\]')
+# Private-use delimiters marking a compiled field in the serialized XML
+FIELD = re.compile('\ue000([A-Z0-9_]+)\ue001')
+TEMPLATE_PARTS = re.compile(r'word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$')
+BODY_START, BODY_END = 'docx-body-start', 'docx-body-end'
+
+
+class CompiledPart:
+    """Serialized XML split into literal byte chunks around named fields"""
+
+    def __init__(self, xml):
+        pieces = FIELD.split(xml)
+        self.literals = [piece.encode('utf-8') for piece in pieces[0::2]]
+        self.fields = pieces[1::2]
+
+    def render(self, values):
+        out = [self.literals[0]]
+        for name, literal in zip(self.fields, self.literals[1:]):
+            value = values.get(name)
+            out.append(f'[{name}]'.encode('utf-8') if value is None else value)
+            out.append(literal)
+        return b''.join(out)
+
+
+class DocxTemplate:
+    """A DOCX file with [PLACEHOLDER] fields, parsed and compiled once.
+
+    Compiling merges every placeholder that Word split across runs into the
+    run holding its first character, serializes each part once and splits it
+    around the fields. Rendering then only joins byte strings and re-zips the
+    in-memory parts; no XML is parsed per document. Fields in the body,
+    tables, headers, footers and notes are all found. Unknown fields are
+    left as they are.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self._members = []
+        self._static = b''
+        self._compiled = {}
+        self._body = None
+        self._break = b''
+        self._newline = '</w:t><w:br/><w:t xml:space="preserve">'
+        self._compile()
+
+    @property
+    def fields(self):
+        names = set()
+        for part in self._compiled.values():
+            names.update(part.fields)
+        if self._body:
+            for part in self._body:
+                names.update(part.fields)
+        return names
+
+    def render(self, context):
+        """DOCX bytes for a single context"""
+        values = self._values(context)
+        return self._zip({name: part.render(values) for name, part in self._compiled.items()})
+
+    def render_many(self, contexts):
+        """One DOCX holding the body once per context, separated by page breaks.
+
+        Headers and footers are shared by the whole document, so they are
+        filled from the first context.
+        """
+        contexts = list(contexts)
+        if not contexts:
+            raise ValueError("render_many needs at least one context")
+        values = [self._values(context) for context in contexts]
+        parts = {name: part.render(values[0]) for name, part in self._compiled.items()}
+        head, body, tail = self._body
+        parts['word/document.xml'] = b''.join([
+            head.render(values[0]),
+            self._break.join(body.render(each) for each in values),
+            tail.render(values[0]),
+        ])
+        return self._zip(parts)
+
+    def render_zip(self, documents):
+        """Zip of one DOCX per (filename, context) pair"""
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+            for filename, context in documents:
+                archive.writestr(filename, self.render(context))
+        return buffer.getvalue()
+
+    def _compile(self):
+        with zipfile.ZipFile(self.path) as archive:
+            for info in archive.infolist():
+                self._members.append((info, archive.read(info)))
+
+        for info, data in self._members:
+            if not TEMPLATE_PARTS.match(info.filename):
+                continue
+            root = etree.fromstring(data)
+            for paragraph in root.iter(f'{{{W}}}p'):
+                self._merge_fields(paragraph)
+            if info.filename == 'word/document.xml':
+                self._body = self._split_body(root)
+            else:
+                part = CompiledPart(self._serialize(root))
+                if part.fields:
+                    self._compiled[info.filename] = part
+
+        # Parts without fields are compressed once; renders append to a copy
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for info, data in self._members:
+                if info.filename not in self._compiled:
+                    archive.writestr(info, data)
+        self._static = buffer.getvalue()
+
+    def _split_body(self, root):
+        """Compile document.xml as (head, body, tail) so bodies can be repeated"""
+        body = root.find(f'{{{W}}}body')
+        section = body.find(f'{{{W}}}sectPr')
+        body.insert(0, etree.Comment(BODY_START))
+        if section is not None:
+            section.addprevious(etree.Comment(BODY_END))
+        else:
+            body.append(etree.Comment(BODY_END))
+        xml = self._serialize(root)
+        head, rest = xml.split(f'<!--{BODY_START}-->')
+        middle, tail = rest.split(f'<!--{BODY_END}-->')
+
+        prefix = root.prefix or 'w'
+        self._break = f'<{prefix}:p><{prefix}:r><{prefix}:br {prefix}:type="page"/></{prefix}:r></{prefix}:p>'.encode()
+        self._newline = f'</{prefix}:t><{prefix}:br/><{prefix}:t xml:space="preserve">'
+        compiled = CompiledPart(head), CompiledPart(middle), CompiledPart(tail)
+        self._compiled['word/document.xml'] = CompiledPart(head + middle + tail)
+        return compiled
+
+    @staticmethod
+    def _merge_fields(paragraph):
+        """Rewrite paragraph's text nodes so each placeholder sits whole in one node"""
+        nodes = [
+            node for node in paragraph.iter(f'{{{W}}}t')
+            if next(node.iterancestors(f'{{{W}}}p')) is paragraph
+        ]
+        text = ''.join(node.text or '' for node in nodes)
+        matches = list(PLACEHOLDER.finditer(text))
+        if not matches:
+            return
+
+        start = 0
+        for node in nodes:
+            end = start + len(node.text or '')
+            out, position, has_field = [], start, False
+            for match in matches:
+                if match.end() <= start or match.start() >= end:
+                    continue
+                out.append(text[position:max(match.start(), start)])
+                if match.start() >= start:
+                    out.append(f'\ue000{match.group(1)}\ue001')
+                    has_field = True
+                position = min(match.end(), end)
+            out.append(text[position:end])
+            node.text = ''.join(out)
+            if has_field:
+                node.set(XML_SPACE, 'preserve')
+            start = end
+
+    @staticmethod
+    def _serialize(root):
+        return etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True).decode('utf-8')
+
+    def _values(self, context):
+        values = {}
+        for name, value in context.items():
+            if value is None:
+                value = ''
+            text = str(value).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            values[name] = text.replace('\n', self._newline).encode('utf-8')
+        return values
+
+    def _zip(self, parts):
+        buffer = BytesIO(self._static)
+        with zipfile.ZipFile(buffer, 'a', zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+            for info, data in self._members:
+                if info.filename in parts:
+                    archive.writestr(info, parts[info.filename], compresslevel=1)
+        return buffer.getvalue()
+
+
+class DocxTemplateLibrary:
+    """Compiled DOCX templates from DOCX_TEMPLATE_DIR, loaded at startup.
+
+    A template whose file changes on disk is recompiled on its next use.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config.get('DOCX_TEMPLATE_DIR') or os.path.join(app.root_path, 'templates', 'docs')
+        if os.path.isdir(self.directory):
+            for name in sorted(os.listdir(self.directory)):
+                if name.endswith('.docx') and not name.startswith('~$'):
+                    self.get(name)
+        app.extensions['docx_templates'] = self
+
+    def get(self, name):
+        path = os.path.join(self.directory, name)
+        template = self._templates.get(name)
+        if template is None or os.path.getmtime(path) != template.mtime:
+            with self._lock:
+                template = self._templates[name] = DocxTemplate(path)
+        return template
@@ -1,6 +1,124 @@
+from pathlib import Path
+
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+
+from application.cache import ResultCache
+from application.document_cache import DocumentCache
+from application.docx_templates import DocxTemplateLibrary
+from application.formulary import Formulary
+from application.instrumentation import Instrumentation
+from application.rendering import PdfRenderer
+from application.routing import RoutingSession, SessionRouter
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
+cache = ResultCache()
+document_cache = DocumentCache()
+docx_templates = DocxTemplateLibrary()
+formulary = Formulary()
+instrumentation = Instrumentation()
+renderer = PdfRenderer()
+router = SessionRouter()
+
+
+def engine_options(config, url=None, read=False):
+    """Build SQLAlchemy engine options from the DB_* (or DB_READ_* pool) settings in config"""
+    url = make_url(url or config['SQLALCHEMY_DATABASE_URI'])
+    pool = 'DB_READ_' if read else 'DB_'
+    options = {'pool_pre_ping': config.get('DB_POOL_PRE_PING', True)}
+
+    # In-memory SQLite uses a single shared connection, pool sizing does not apply
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return options
+
+    options.update(
+        pool_size=config.get(f'{pool}POOL_SIZE', 10),
+        max_overflow=config.get(f'{pool}MAX_OVERFLOW', 20),
+        pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+        pool_recycle=config.get('DB_POOL_RECYCLE', 1800),
+    )
+    return options
+
+
+def apply_sqlite_pragmas(pragmas):
+    """Return a connect listener that sets pragmas on each new SQLite connection"""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return on_connect
+
+
+def read_database_url(config, primary):
+    """URL for the read-only engine, or None to read from the primary.
+
+    SQLALCHEMY_READ_URI when set (a replica of a server database),
+    otherwise a mode=ro URI on the primary's file for SQLite.
+    """
+    if not config.get('DB_READ_ROUTING', True):
+        return None
+    if config.get('SQLALCHEMY_READ_URI'):
+        return make_url(config['SQLALCHEMY_READ_URI'])
+    database = primary.database
+    if primary.get_backend_name() != 'sqlite' or database in (None, '', ':memory:') or database.startswith('file:'):
+        return None
+    return primary.set(database=Path(database).resolve().as_uri(), query={**primary.query, 'mode': 'ro', 'uri': 'true'})
+
+
+def insert_ignore(connection, table, rows):
+    """INSERT rows (a dict or a list of dicts), skipping any whose primary key already exists.
+
+    PostgreSQL, SQLite and MySQL skip them in the statement itself; any
+    other database inserts each row under a SAVEPOINT and ignores the
+    IntegrityError of a row another writer got to first.
+    """
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        statement = postgresql.insert(table).on_conflict_do_nothing()
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(table).on_conflict_do_nothing()
+    elif dialect in ('mysql', 'mariadb'):
+        statement = mysql.insert(table)
+        # Setting a key column to itself leaves an existing row untouched
+        statement = statement.on_duplicate_key_update({column.name: column for column in table.primary_key})
+    else:
+        for row in [rows] if isinstance(rows, dict) else rows:
+            try:
+                with connection.begin_nested():
+                    connection.execute(table.insert(), row)
+            except IntegrityError:
+                pass
+        return
+    connection.execute(statement, rows)
+
+
+def init_db(app):
+    """Initialise db with the configured engine profile"""
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', apply_sqlite_pragmas(app.config.get('SQLITE_PRAGMAS', {})))
+            if app.config.get('ID_SEQUENCE_BLOCK_SIZE', 1) > 1:
+                # Blocks are reserved on a second connection mid-flush, which waits on
+                # the flush's own write lock until busy_timeout and then fails
+                raise RuntimeError("ID_SEQUENCE_BLOCK_SIZE must be 1 on SQLite")
 
+        read_engine = None
+        read_url = read_database_url(app.config, engine.url)
+        if read_url is not None:
+            read_engine = create_engine(read_url, **engine_options(app.config, read_url, read=True))
+            if read_engine.dialect.name == 'sqlite':
+                # journal_mode is a property of the file, which a read-only connection cannot set
+                pragmas = {name: value for name, value in app.config.get('SQLITE_PRAGMAS', {}).items()
+                           if name != 'journal_mode'}
+                event.listen(read_engine, 'connect', apply_sqlite_pragmas(dict(pragmas, query_only='ON')))
+        router.init_app(app, read_engine)
@@ -0,0 +1,165 @@
+from decimal import Decimal
+import threading
+
+import numpy as np
+from sqlalchemy import func, select
+
+
+class _Snapshot:
+    """The active drugs as parallel arrays sorted by id"""
+
+    def __init__(self, version, stock_version, ids, names, strengths, prices, stock, expiry):
+        self.version = version
+        self.stock_version = stock_version
+        self.ids = ids  # int64
+        self.names = names  # object
+        self.strengths = strengths  # object, '' when unset
+        self.prices = prices  # int64 cents
+        self.stock = stock  # int64
+        self.expiry = expiry  # datetime64[D], NaT when unset
+
+    def with_stock(self, stock_version, stock):
+        return _Snapshot(self.version, stock_version, self.ids, self.names, self.strengths,
+                         self.prices, stock, self.expiry)
+
+    def index(self, drug_id):
+        i = int(np.searchsorted(self.ids, drug_id))
+        return i if i < len(self.ids) and self.ids[i] == drug_id else None
+
+
+class Formulary:
+    """Process-wide, read-mostly copy of the active drugs for pickers and price lookups.
+
+    The snapshot is versioned by the result cache's 'formulary' tag, which
+    commits bump when they insert, delete or change the name, strength,
+    price, expiry or active flag of a drug (see the Drug listeners in
+    models.py). Stock changes far more often and is refreshed on its own,
+    by a single (id, stock) query, when the 'stock_movements' tag moves.
+    With CACHE_BACKEND='sqlite' the tags, and so the stamps, are shared by
+    every worker on the host.
+    """
+
+    VERSION_TAG = 'formulary'
+    STOCK_TAG = 'stock_movements'
+
+    def __init__(self):
+        self.loads = 0
+        self.stock_loads = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self._snapshot = None
+        app.extensions['formulary'] = self
+
+    def snapshot(self):
+        """The current snapshot, rebuilding or refreshing its stock first if stale"""
+        from application.extensions import cache
+
+        versions = cache.backend.tag_versions([self.VERSION_TAG, self.STOCK_TAG])
+        version, stock_version = versions[self.VERSION_TAG], versions[self.STOCK_TAG]
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version and snapshot.stock_version == stock_version:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = self._load(version, stock_version)
+            elif snapshot.stock_version != stock_version:
+                snapshot = self._refresh_stock(snapshot, version, stock_version)
+            self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def get(self, drug_id):
+        """{'id', 'name', 'strength', 'unit_price', 'stock', 'expiry_date'} or None if not active"""
+        snapshot = self.snapshot()
+        i = snapshot.index(drug_id)
+        if i is None:
+            return None
+        expiry = snapshot.expiry[i]
+        return {
+            'id': int(snapshot.ids[i]),
+            'name': snapshot.names[i],
+            'strength': snapshot.strengths[i] or None,
+            'unit_price': self._price(snapshot.prices[i]),
+            'stock': int(snapshot.stock[i]),
+            'expiry_date': None if np.isnat(expiry) else expiry.item(),
+        }
+
+    def price(self, drug_id):
+        snapshot = self.snapshot()
+        i = snapshot.index(drug_id)
+        return None if i is None else self._price(snapshot.prices[i])
+
+    def choices(self):
+        """[(id, label)] for a drug SelectField, by name"""
+        snapshot = self.snapshot()
+        return [
+            (int(snapshot.ids[i]), f"{snapshot.names[i]} {snapshot.strengths[i]}".rstrip())
+            for i in np.argsort(snapshot.names, kind='stable')
+        ]
+
+    def prices(self):
+        """{id: {'name', 'unit_price', 'stock'}} for the invoice form to fill lines without a request"""
+        snapshot = self.snapshot()
+        return {
+            int(drug_id): {'name': name, 'unit_price': str(self._price(price)), 'stock': int(stock)}
+            for drug_id, name, price, stock in zip(snapshot.ids, snapshot.names, snapshot.prices, snapshot.stock)
+        }
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'drugs': None if snapshot is None else len(snapshot.ids),
+            'version': None if snapshot is None else snapshot.version,
+            'loads': self.loads,
+            'stock_loads': self.stock_loads,
+        }
+
+    @staticmethod
+    def _price(cents):
+        return Decimal(int(cents)).scaleb(-2)
+
+    def _load(self, version, stock_version):
+        from application.extensions import db
+        from application.models.models import Drug
+
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(Drug.id, Drug.name, Drug.strength, Drug.unit_price,
+                       func.coalesce(Drug.stock, 0), Drug.expiry_date)
+                .where(Drug.is_active.is_(True))
+                .order_by(Drug.id)
+            ).all()
+        self.loads += 1
+        count = len(rows)
+        ids, names, strengths, prices, stock, expiry = zip(*rows) if rows else ((),) * 6
+        return _Snapshot(
+            version, stock_version,
+            np.fromiter(ids, dtype=np.int64, count=count),
+            np.array(names, dtype=object),
+            np.array([strength or '' for strength in strengths], dtype=object),
+            np.fromiter((int(price.scaleb(2)) for price in prices), dtype=np.int64, count=count),
+            np.fromiter(stock, dtype=np.int64, count=count),
+            np.array(expiry, dtype='M8[D]'),
+        )
+
+    def _refresh_stock(self, snapshot, version, stock_version):
+        from application.extensions import db
+        from application.models.models import Drug
+
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(Drug.id, func.coalesce(Drug.stock, 0))
+                .where(Drug.is_active.is_(True))
+                .order_by(Drug.id)
+            ).all()
+        self.stock_loads += 1
+        columns = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        if not np.array_equal(columns[:, 0], snapshot.ids):
+            # The drug list changed without a formulary commit (e.g. raw SQL)
+            return self._load(version, stock_version)
+        return snapshot.with_stock(stock_version, columns[:, 1].copy())
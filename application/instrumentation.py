@@ -0,0 +1,271 @@
+from bisect import bisect_left
+import heapq
+import threading
+import time
+
+from flask import before_render_template, g, has_app_context, request, template_rendered
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STATEMENTS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class RollingHistogram:
+    """Bucketed observations, cumulative for Prometheus and rolling for percentiles.
+
+    The cumulative buckets never reset, so Prometheus can rate() them over
+    any range. A ring of `slots` per-slot bucket counts covers the last
+    `window` seconds for the in-process percentiles; a slot is cleared as
+    soon as time comes back round to it.
+    """
+
+    def __init__(self, bounds, window=300, slots=10):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._slot_seconds = window / slots
+        self._ring = [[0] * (len(bounds) + 1) for _ in range(slots)]
+        self._ring_epochs = [None] * slots
+
+    def observe(self, value, now):
+        bucket = bisect_left(self.bounds, value)
+        self.counts[bucket] += 1
+        self.sum += value
+        self.count += 1
+        epoch = int(now // self._slot_seconds)
+        slot = epoch % len(self._ring)
+        if self._ring_epochs[slot] != epoch:
+            self._ring[slot] = [0] * (len(self.bounds) + 1)
+            self._ring_epochs[slot] = epoch
+        self._ring[slot][bucket] += 1
+
+    def quantile(self, q, now):
+        """q-th percentile of the window, interpolated within its bucket; None if empty"""
+        oldest = int(now // self._slot_seconds) - len(self._ring) + 1
+        window = [0] * (len(self.bounds) + 1)
+        for epoch, counts in zip(self._ring_epochs, self._ring):
+            if epoch is not None and epoch >= oldest:
+                window = [a + b for a, b in zip(window, counts)]
+        total = sum(window)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bucket, count in enumerate(window):
+            if count and seen + count >= rank:
+                low = self.bounds[bucket - 1] if bucket else 0.0
+                # The overflow bucket has no upper bound; report its floor
+                high = self.bounds[bucket] if bucket < len(self.bounds) else low
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+class _RequestMetrics:
+    """What one request spent, accumulated on g while it runs"""
+
+    def __init__(self, keep):
+        self.started = time.perf_counter()
+        self.status = None
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.slowest = []  # min-heap of (seconds, n, statement), at most keep long
+        self._keep = keep
+        self._render_started = []
+
+    def statement(self, seconds, statement):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        entry = (seconds, self.sql_count, statement)
+        if len(self.slowest) < self._keep:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+
+class Instrumentation:
+    """Per-request wall, SQL, template and PDF timings, served as Prometheus text.
+
+    Every request records its endpoint, wall time (until a streamed body is
+    exhausted), SQL statement count and time from the engine's cursor
+    events, and template render time from Flask's render signals. PDFs are
+    rendered off the request, so their wkhtmltopdf time is recorded against
+    the endpoint that queued them. Each metric keeps a RollingHistogram per
+    endpoint; METRICS_PATH serves the cumulative buckets plus percentiles
+    over the last METRICS_WINDOW seconds. Requests slower than
+    SLOW_REQUEST_MS are logged with their slowest statements.
+    """
+
+    METRICS = {
+        'ehr_request_seconds': ('Wall time per request', SECONDS),
+        'ehr_request_sql_seconds': ('Time spent in SQL per request', SECONDS),
+        'ehr_request_sql_statements': ('SQL statements per request', STATEMENTS),
+        'ehr_request_render_seconds': ('Template render time per request', SECONDS),
+        'ehr_pdf_render_seconds': ('wkhtmltopdf time per PDF, by the endpoint that queued it', SECONDS),
+    }
+
+    def __init__(self):
+        self.enabled = False
+        self.window = 300
+        self.slow_seconds = 1.0
+        self.slow_statements = 5
+        self.slow_requests = {}
+        self._histograms = {name: {} for name in self.METRICS}
+        self._lock = threading.Lock()
+        self._logger = None
+
+    def init_app(self, app):
+        self.enabled = app.config.get('INSTRUMENTATION_ENABLED', True)
+        app.extensions['instrumentation'] = self
+        if not self.enabled:
+            return
+        self.window = app.config.get('METRICS_WINDOW', 300)
+        self.slow_seconds = app.config.get('SLOW_REQUEST_MS', 1000) / 1000
+        self.slow_statements = app.config.get('SLOW_REQUEST_STATEMENTS', 5)
+        self._logger = app.logger
+
+        app.before_request(self._start_request)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish_request)
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._finish_render, app)
+        app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', self.metrics_view)
+
+        with app.app_context():
+            engines = [app.extensions['sqlalchemy'].engine, app.extensions.get('read_engine')]
+        from sqlalchemy import event
+        for engine in filter(None, engines):
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        pdf_renderer = app.extensions.get('pdf_renderer')
+        if pdf_renderer is not None:
+            pdf_renderer.on_rendered = self._record_pdf
+
+    def observe(self, name, endpoint, value):
+        now = time.time()
+        with self._lock:
+            histogram = self._histograms[name].get(endpoint)
+            if histogram is None:
+                histogram = self._histograms[name][endpoint] = RollingHistogram(self.METRICS[name][1], self.window)
+            histogram.observe(value, now)
+
+    def metrics_view(self):
+        return self.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    def render(self):
+        """Prometheus text exposition of every histogram and its rolling percentiles"""
+        now = time.time()
+        lines = []
+        with self._lock:
+            for name, (help_text, bounds) in self.METRICS.items():
+                histograms = sorted(self._histograms[name].items())
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for endpoint, histogram in histograms:
+                    label = f'endpoint="{_escape(endpoint)}"'
+                    cumulative = 0
+                    for bound, count in zip((*bounds, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{label}}} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{{{label}}} {histogram.count}")
+
+                window_name = f"{name}_window"
+                lines += [
+                    f"# HELP {window_name} {help_text}, percentiles over the last {self.window:g} s",
+                    f"# TYPE {window_name} gauge",
+                ]
+                for endpoint, histogram in histograms:
+                    for q in QUANTILES:
+                        value = histogram.quantile(q, now)
+                        if value is not None:
+                            lines.append(f'{window_name}{{endpoint="{_escape(endpoint)}",quantile="{q}"}} {value:.6f}')
+
+            lines += ["# HELP ehr_slow_requests_total Requests slower than SLOW_REQUEST_MS",
+                      "# TYPE ehr_slow_requests_total counter"]
+            for endpoint, count in sorted(self.slow_requests.items()):
+                lines.append(f'ehr_slow_requests_total{{endpoint="{_escape(endpoint)}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name in self.METRICS}
+            self.slow_requests = {}
+
+    # Request hooks
+
+    def _start_request(self):
+        g._request_metrics = _RequestMetrics(self.slow_statements)
+
+    @staticmethod
+    def _record_status(response):
+        metrics = g.get('_request_metrics')
+        if metrics is not None:
+            metrics.status = response.status_code
+        return response
+
+    def _finish_request(self, exc):
+        metrics = g.pop('_request_metrics', None)
+        if metrics is None or request.endpoint == 'metrics':
+            return
+        wall = time.perf_counter() - metrics.started
+        # Unrouted requests share one label so 404 probes cannot grow the registry
+        endpoint = request.endpoint or '<unmatched>'
+        self.observe('ehr_request_seconds', endpoint, wall)
+        self.observe('ehr_request_sql_seconds', endpoint, metrics.sql_seconds)
+        self.observe('ehr_request_sql_statements', endpoint, metrics.sql_count)
+        self.observe('ehr_request_render_seconds', endpoint, metrics.render_seconds)
+        if wall >= self.slow_seconds:
+            self._log_slow(endpoint, wall, metrics)
+
+    def _log_slow(self, endpoint, wall, metrics):
+        with self._lock:
+            self.slow_requests[endpoint] = self.slow_requests.get(endpoint, 0) + 1
+        slowest = ''.join(
+            f"\n  {seconds * 1000:8.1f} ms  {' '.join(statement.split())[:500]}"
+            for seconds, _, statement in sorted(metrics.slowest, reverse=True)
+        )
+        self._logger.warning(
+            "Slow request %s %s -> %s: %.0f ms, %d SQL statement(s) in %.0f ms, render %.0f ms%s",
+            request.method, request.path, metrics.status, wall * 1000,
+            metrics.sql_count, metrics.sql_seconds * 1000, metrics.render_seconds * 1000, slowest,
+        )
+
+    @staticmethod
+    def _start_render(sender, template, context, **extra):
+        metrics = g.get('_request_metrics')
+        if metrics is not None:
+            metrics._render_started.append(time.perf_counter())
+
+    @staticmethod
+    def _finish_render(sender, template, context, **extra):
+        metrics = g.get('_request_metrics')
+        if metrics is not None and metrics._render_started:
+            started = metrics._render_started.pop()
+            # A template rendered inside another is already inside its time
+            if not metrics._render_started:
+                metrics.render_seconds += time.perf_counter() - started
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('_query_started')
+        if not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+        # Statements from PDF workers, CLI commands and the like have no request
+        metrics = g.get('_request_metrics') if has_app_context() else None
+        if metrics is not None:
+            metrics.statement(seconds, statement)
+
+    def _record_pdf(self, endpoint, seconds):
+        self.observe('ehr_pdf_render_seconds', endpoint or '<background>', seconds)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -1,10 +1,10 @@
 from datetime import datetime, date, timezone
 import uuid
-from sqlalchemy.orm import validates
-from sqlalchemy import event, CheckConstraint, func, UniqueConstraint, text
+from sqlalchemy.orm import Session, attributes, object_session, query_expression, validates
+from sqlalchemy import event, CheckConstraint, func, Index, UniqueConstraint, select
 from sqlalchemy.ext.hybrid import hybrid_property
 
-from application.extensions import db
+from application.extensions import cache, db, document_cache
 
 class BaseModel(db.Model):
     """Base model with common columns and methods"""
@@ -12,8 +12,16 @@ class BaseModel(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     public_id = db.Column(db.String(50), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+class IdSequence(db.Model):
+    """Per-month counters backing the KMC-... patient, doctor and visit IDs"""
+    __tablename__ = 'id_sequences'
+
+    entity = db.Column(db.String(20), primary_key=True)  # patient, doctor, visit
+    period = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    last_value = db.Column(db.Integer, nullable=False, default=0)
 
 class Patient(BaseModel):
     """Patient information model with medical validation"""
@@ -36,6 +44,11 @@ class Patient(BaseModel):
     visits = db.relationship('Visit', back_populates='patient', cascade='all, delete-orphan')
     prescriptions = db.relationship('Prescription', back_populates='patient', cascade='all, delete-orphan')
     invoices = db.relationship('Invoice', back_populates='patient', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        # Keyset paging order for the admin list; SQLite appends the rowid (id)
+        Index('ix_patients_created_at', 'created_at'),
+    )
     
     @hybrid_property
     def full_name(self):
@@ -54,20 +67,8 @@ class Patient(BaseModel):
 @event.listens_for(Patient, 'before_insert')
 def generate_patient_id(mapper, connection, target):
     if not target.patient_id:
-        month = datetime.now().month
-        year = datetime.now().year
-        result = connection.execute(
-            text("SELECT patient_id FROM patients ORDER BY patient_id DESC LIMIT 1")
-        ).fetchone()
-
-        if result and result[0]:
-            try:
-                seq_num = int(result[0].split('-')[-1]) + 1
-            except:
-                seq_num = 1
-        else:
-            seq_num = 1
-        target.patient_id = f"KMC-{month:02d}-{year}-{seq_num:04d}"
+        from application.services.sequence_service import SequenceService
+        target.patient_id = SequenceService.next_id(connection, 'patient')
     
     
 class Doctor(BaseModel):
@@ -87,6 +88,12 @@ class Doctor(BaseModel):
     diagnoses = db.relationship('Diagnosis', back_populates='doctor')
     visits = db.relationship('Visit', back_populates='doctor')
     prescriptions = db.relationship('Prescription', back_populates='doctor')
+
+    __table_args__ = (
+        # Case-insensitive name prefix lookups from the admin doctor picker
+        Index('ix_doctors_last_name_lower', func.lower(last_name)),
+        Index('ix_doctors_first_name_lower', func.lower(first_name)),
+    )
     
     @hybrid_property
     def full_name(self):
@@ -99,21 +106,8 @@ class Doctor(BaseModel):
 @event.listens_for(Doctor, 'before_insert')
 def generate_doctor_id(mapper, connection, target):
     if not target.doctor_id:
-        month = datetime.now().month
-        year = datetime.now().year
-        result = connection.execute(
-            text("SELECT doctor_id FROM doctors ORDER BY doctor_id DESC LIMIT 1")
-        ).fetchone()
-        
-        if result and result[0]:
-            try:
-                seq_num = int(result[0].split('-')[-1]) + 1
-            except:
-                seq_num = 1
-        else:
-            seq_num = 1
-        target.doctor_id = f"KMC-DOC-{month:02d}-{year}-{seq_num:04d}"
-
+        from application.services.sequence_service import SequenceService
+        target.doctor_id = SequenceService.next_id(connection, 'doctor')
 
 class Visit(BaseModel):
     """Patient visit with triage data"""
@@ -133,6 +127,16 @@ class Visit(BaseModel):
     prescriptions = db.relationship('Prescription', back_populates='visit', cascade='all, delete-orphan')
     diagnoses = db.relationship('Diagnosis', back_populates='visit', cascade='all, delete-orphan')
     invoice = db.relationship('Invoice', back_populates='visit', uselist=False, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        # Active visit lookup: patient_id + status, newest first
+        Index('ix_visits_patient_status_date', 'patient_id', 'status', 'visit_date'),
+        # Date range reports; patient_id makes distinct-patient counts covering
+        Index('ix_visits_date_patient', 'visit_date', 'patient_id'),
+        Index('ix_visits_doctor_id', 'doctor_id'),
+        # Keyset paging order (visit_date, id) for the admin list
+        Index('ix_visits_visit_date', 'visit_date'),
+    )
         
     @property
     def visit_reference(self):
@@ -141,20 +145,8 @@ class Visit(BaseModel):
 @event.listens_for(Visit, 'before_insert')
 def generate_visit_id(mapper, connection, target):
     if not target.visit_id:
-        month = datetime.now().month
-        year = datetime.now().year
-        result = connection.execute(
-            text("SELECT visit_id FROM visits ORDER BY visit_id DESC LIMIT 1")
-        ).scalar()
-        
-        if result:
-            try:
-                seq_num = int(result[0].split('/')[-1]) + 1
-            except:
-                seq_num = 1
-        else:
-            seq_num = 1
-        target.visit_id = f"KMC-VIS-{month:02d}{year:02d}/{seq_num:04d}"
+        from application.services.sequence_service import SequenceService
+        target.visit_id = SequenceService.next_id(connection, 'visit')
     
 
 class VisitReport(BaseModel):
@@ -200,6 +192,19 @@ class Triage(BaseModel):
     
     # Relationships
     visit = db.relationship('Visit', back_populates='triage')
+
+    __table_args__ = (
+        Index('ix_triage_visit_id', 'visit_id'),
+    )
+
+    # Plausible human readings (inclusive); the validators below and the
+    # vitals analytics' out-of-range flags both use them
+    VALID_RANGES = {
+        'temperature': (25, 45),  # °C
+        'pulse': (30, 200),
+        'blood_pressure_systolic': (40, 250),
+        'blood_pressure_diastolic': (40, 250),
+    }
     
     @hybrid_property
     def bmi(self):
@@ -220,19 +225,22 @@ class Triage(BaseModel):
     
     @validates('temperature')
     def validate_temperature(self, key, temp):
-        if temp is not None and (temp < 25 or temp > 45):  # Reasonable human range in °C
+        low, high = self.VALID_RANGES[key]
+        if temp is not None and (temp < low or temp > high):
             raise ValueError("Invalid temperature reading")
         return temp
     
     @validates('pulse')
     def validate_pulse(self, key, pulse):
-        if pulse is not None and (pulse < 30 or pulse > 200):  # Reasonable human range
+        low, high = self.VALID_RANGES[key]
+        if pulse is not None and (pulse < low or pulse > high):
             raise ValueError("Invalid pulse reading")
         return pulse
     
     @validates('blood_pressure_systolic', 'blood_pressure_diastolic')
     def validate_blood_pressure(self, key, value):
-        if value is not None and (value < 40 or value > 250):
+        low, high = self.VALID_RANGES[key]
+        if value is not None and (value < low or value > high):
             raise ValueError(f"Invalid {key} reading")
         return value
 
@@ -253,6 +261,11 @@ class Diagnosis(BaseModel):
     patient = db.relationship('Patient', back_populates='diagnoses')
     doctor = db.relationship('Doctor', back_populates='diagnoses')
 
+    __table_args__ = (
+        Index('ix_diagnoses_visit_id', 'visit_id'),
+        Index('ix_diagnoses_patient_id', 'patient_id'),
+    )
+
 class Drug(BaseModel):
     __tablename__ = 'drugs'
 
@@ -322,6 +335,8 @@ class Prescription(BaseModel):
         CheckConstraint("status IN ('active', 'completed', 'cancelled')", name='valid_prescription_status'),
         CheckConstraint("quantity IS NULL OR quantity > 0", name='positive_quantity_if_set'),
         UniqueConstraint("visit_id", name="unique_prescription"),
+        Index('ix_prescriptions_start_date', 'start_date'),
+        Index('ix_prescriptions_patient_id', 'patient_id'),
     )
 
     @hybrid_property
@@ -344,6 +359,12 @@ class PrescriptionDrug(BaseModel):
     prescriptions = db.relationship('Prescription', back_populates='prescription_drugs')
     drug = db.relationship('Drug', back_populates='prescription_drugs')
 
+    __table_args__ = (
+        # The primary key leads with id, so it cannot serve these lookups
+        Index('ix_prescription_drugs_prescription_id', 'prescription_id'),
+        Index('ix_prescription_drugs_drug_id', 'drug_id'),
+    )
+
     @validates('quantity')
     def validate_quantity(self, key, quantity):
         if quantity <= 0:
@@ -374,14 +395,36 @@ class Invoice(BaseModel):
     patient = db.relationship('Patient', back_populates='invoices')
     invoice_items = db.relationship('InvoiceItem', back_populates='invoice', cascade='all, delete-orphan')
     payments = db.relationship('Payment', back_populates='invoice', cascade='all, delete-orphan')
+
+    # Filled by with_expression(Invoice.paid_total, Invoice.amount_paid.expression)
+    # so list pages get amount_paid without loading any payments
+    paid_total = query_expression()
     
     __table_args__ = (
         CheckConstraint("status IN ('pending', 'partial', 'paid', 'cancelled')", name='valid_invoice_status'),
+        # Monthly totals read date and amount from the index alone
+        Index('ix_invoices_date_total', 'invoice_date', 'total_amount'),
+        Index('ix_invoices_status_date', 'status', 'invoice_date'),
+        Index('ix_invoices_visit_id', 'visit_id'),
+        Index('ix_invoices_patient_id', 'patient_id'),
+        # Keyset paging order (created_at, id) for the admin list
+        Index('ix_invoices_created_at', 'created_at'),
     )
     
     @hybrid_property
     def amount_paid(self):
+        if self.paid_total is not None:
+            return self.paid_total
         return sum(payment.amount for payment in self.payments) if self.payments else 0
+
+    @amount_paid.expression
+    def amount_paid(cls):
+        return (
+            select(func.coalesce(func.sum(Payment.amount), 0))
+            .where(Payment.invoice_id == cls.id)
+            .correlate_except(Payment)
+            .scalar_subquery()
+        )
     
     @hybrid_property
     def balance_due(self):
@@ -413,11 +456,13 @@ class InvoiceItem(BaseModel):
     
     __table_args__ = (
         CheckConstraint("quantity > 0", name='positive_item_quantity'),
+        Index('ix_invoice_items_invoice_id', 'invoice_id'),
     )
     
     @validates('unit_price')
     def validate_unit_price(self, key, price):
-        assert price >= 0, "Price cannot be negative"
+        # None until InvoiceView fills in the formulary price
+        assert price is None or price >= 0, "Price cannot be negative"
         return price
 
 class Payment(BaseModel):
@@ -437,6 +482,8 @@ class Payment(BaseModel):
     
     __table_args__ = (
         CheckConstraint("amount > 0", name='positive_payment_amount'),
+        # Covers amount paid per invoice
+        Index('ix_payments_invoice_amount', 'invoice_id', 'amount'),
     )
 
 class Receipt(BaseModel):
@@ -452,19 +499,254 @@ class Receipt(BaseModel):
     # Relationships
     payment = db.relationship('Payment', back_populates='receipt')
 
+class StockMovement(db.Model):
+    """Append-only ledger of every change to a drug's stock"""
+    __tablename__ = 'stock_movements'
+
+    id = db.Column(db.Integer, primary_key=True)
+    drug_id = db.Column(db.Integer, db.ForeignKey('drugs.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)  # signed: + into stock, - out of it
+    reason = db.Column(db.String(20), nullable=False)  # receipt, dispense, return, adjustment
+    prescription_id = db.Column(db.Integer)  # no FK: the history outlives deleted prescriptions
+    note = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    drug = db.relationship('Drug')
+
+    __table_args__ = (
+        CheckConstraint("reason IN ('receipt', 'dispense', 'return', 'adjustment')", name='valid_stock_reason'),
+        # Balances sum one drug's movements after its latest snapshot
+        Index('ix_stock_movements_drug_id_id', 'drug_id', 'id'),
+        Index('ix_stock_movements_prescription_id', 'prescription_id'),
+    )
+
+class StockSnapshot(db.Model):
+    """A drug's ledger balance up to and including movement_id"""
+    __tablename__ = 'stock_snapshots'
+
+    drug_id = db.Column(db.Integer, db.ForeignKey('drugs.id'), primary_key=True)
+    movement_id = db.Column(db.Integer, primary_key=True)
+    stock = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+class MonthlyRollup(db.Model):
+    """Dashboard counters per month, maintained by the rollup listeners below"""
+    __tablename__ = 'monthly_rollups'
+
+    period = db.Column(db.String(7), primary_key=True)  # YYYY-MM, or 'all' for all-time totals
+    visit_count = db.Column(db.Integer, nullable=False, default=0)
+    prescription_count = db.Column(db.Integer, nullable=False, default=0)
+    invoice_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    active_patients = db.Column(db.Integer, nullable=False, default=0)
+
+class ImportCheckpoint(db.Model):
+    """Progress of a bulk import, committed with each chunk so a rerun resumes"""
+    __tablename__ = 'import_checkpoints'
+
+    source = db.Column(db.String(255), primary_key=True)  # file name, size and content digest
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    finished = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class PatientActivity(db.Model):
+    """Visits per patient and period, so distinct active patients can be kept incrementally"""
+    __tablename__ = 'patient_activity'
+
+    period = db.Column(db.String(7), primary_key=True)
+    patient_id = db.Column(db.Integer, primary_key=True)
+    visit_count = db.Column(db.Integer, nullable=False, default=0)
+
 # Event listeners for database operations
-@event.listens_for(Prescription, 'after_insert')
-def update_drug_stock(mapper, connection, target):
-    """Reduce drug stock when prescription is created"""
-    drug = Drug.query.get(target.drug_id)
-    if drug:
-        drug.stock -= target.quantity
-        db.session.add(drug)
-
-@event.listens_for(Prescription, 'after_delete')
-def restore_drug_stock(mapper, connection, target):
-    """Restore drug stock when prescription is deleted"""
-    drug = Drug.query.get(target.drug_id)
-    if drug:
-        drug.stock += target.quantity
-        db.session.add(drug)
\ No newline at end of file
+def _stock_listener(operation):
+    def listener(mapper, connection, target):
+        from application.services.stock_service import StockService
+        session = object_session(target)
+        if operation == 'update':
+            drug_history = attributes.get_history(target, 'drug_id')
+            quantity_history = attributes.get_history(target, 'quantity')
+            if not (drug_history.has_changes() or quantity_history.has_changes()):
+                return
+            old_drug = (drug_history.deleted or drug_history.unchanged)[0]
+            old_quantity = (quantity_history.deleted or quantity_history.unchanged)[0]
+            StockService.queue(session, old_drug, old_quantity, 'return', target.prescription_id)
+            StockService.queue(session, target.drug_id, -target.quantity, 'dispense', target.prescription_id)
+        elif operation == 'insert':
+            StockService.queue(session, target.drug_id, -target.quantity, 'dispense', target.prescription_id)
+        else:
+            StockService.queue(session, target.drug_id, target.quantity, 'return', target.prescription_id)
+    return listener
+
+# Dispensing and returns move drugs.stock atomically, batched per flush
+for _operation in ('insert', 'update', 'delete'):
+    event.listen(PrescriptionDrug, f'after_{_operation}', _stock_listener(_operation))
+
+@event.listens_for(Drug, 'after_insert')
+@event.listens_for(Drug, 'after_update')
+def _record_stock_edit(mapper, connection, target):
+    """Ledger entry for stock set directly on a drug (opening balance or a stock count)"""
+    from application.services.stock_service import StockService
+    history = attributes.get_history(target, 'stock')
+    if history.added:
+        old = (history.deleted or [0])[0] or 0
+        StockService.queue(
+            object_session(target), target.id, (history.added[0] or 0) - old, 'adjustment',
+            note='Opening balance' if not history.deleted else 'Stock edited', applied=True,
+        )
+
+def _formulary_listener(fields=None):
+    def listener(mapper, connection, target):
+        # Stock-only edits are picked up by the formulary's own stock refresh
+        if fields and not any(attributes.get_history(target, key).has_changes() for key in fields):
+            return
+        cache.touch(object_session(target), 'formulary')
+    return listener
+
+# Drug pickers and price lookups read the in-process formulary; a new
+# version is stamped when a commit changes what it holds
+event.listen(Drug, 'after_insert', _formulary_listener())
+event.listen(Drug, 'after_update', _formulary_listener(('name', 'strength', 'unit_price', 'expiry_date', 'is_active')))
+event.listen(Drug, 'after_delete', _formulary_listener())
+
+@event.listens_for(Session, 'after_flush')
+def _apply_stock_movements(session, flush_context):
+    if session.info.get('stock_movements'):
+        from application.services.stock_service import StockService
+        StockService.flush(session)
+
+def _rollup_listener(operation):
+    def listener(mapper, connection, target):
+        from application.services.rollup_service import RollupService
+        RollupService.queue(object_session(target), target, operation)
+    return listener
+
+# Keep monthly_rollups/patient_activity in step with every ORM write, batched
+# per flush. Deletes are counted before the row goes, while expired
+# attributes can still load.
+for _model in (Visit, Prescription, Invoice):
+    event.listen(_model, 'after_insert', _rollup_listener('insert'))
+    event.listen(_model, 'after_update', _rollup_listener('update'))
+    event.listen(_model, 'before_delete', _rollup_listener('delete'))
+
+@event.listens_for(Session, 'after_flush')
+def _apply_rollup_changes(session, flush_context):
+    if session.info.get('rollup_changes'):
+        from application.services.rollup_service import RollupService
+        RollupService.flush(session)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rollup_changes(session):
+    session.info.pop('rollup_changes', None)
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    """No-op; registering it with active_history keeps the old value in history"""
+
+for _attribute in (Visit.visit_date, Visit.patient_id, Prescription.start_date,
+                   Invoice.invoice_date, Invoice.total_amount):
+    event.listen(_attribute, 'set', _load_previous_value, active_history=True)
+
+def _search_listener(operation):
+    def listener(mapper, connection, target):
+        from application.services.search_service import PatientSearchService
+        getattr(PatientSearchService, operation)(connection, target)
+    return listener
+
+# Keep the patient_search FTS index in step with ORM writes to patients
+event.listen(Patient, 'after_insert', _search_listener('index_patient'))
+event.listen(Patient, 'after_update', _search_listener('index_patient'))
+event.listen(Patient, 'after_delete', _search_listener('remove_patient'))
+
+def _document_listener(owner):
+    def listener(mapper, connection, target):
+        document_cache.invalidate(owner(target))
+    return listener
+
+# Generated documents are keyed by their inputs, so edits never serve a stale
+# copy; dropping the owner's files just reclaims the space straight away
+for _model, _owner in (
+    (Invoice, lambda target: f'invoice-{target.id}'),
+    (InvoiceItem, lambda target: f'invoice-{target.invoice_id}'),
+    (Payment, lambda target: f'invoice-{target.invoice_id}'),
+    (VisitReport, lambda target: f'report-{target.id}'),
+):
+    for _operation in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _operation, _document_listener(_owner))
+
+def _journey_step_listener(step, operation):
+    def listener(mapper, connection, target):
+        from application.services.journey_service import JourneyService
+        session = object_session(target)
+        if operation == 'insert':
+            JourneyService.step_done(session, target.visit_id, step)
+            return
+        history = attributes.get_history(target, 'visit_id')
+        if operation == 'delete' or history.has_changes():
+            for visit_pk in {target.visit_id, *history.deleted}:
+                JourneyService.visit_changed(session, visit_pk=visit_pk)
+    return listener
+
+def _journey_visit_listener(operation):
+    def listener(mapper, connection, target):
+        from application.services.journey_service import JourneyService
+        patient_history = attributes.get_history(target, 'patient_id')
+        if operation == 'update' and not (patient_history.has_changes() or any(
+            attributes.get_history(target, key).has_changes() for key in ('status', 'visit_date')
+        )):
+            return
+        patients = {target.patient_id, *patient_history.deleted} - {None}
+        codes = connection.execute(select(Patient.patient_id).where(Patient.id.in_(patients))).scalars()
+        session = object_session(target)
+        JourneyService.visit_changed(session, visit_pk=target.id)
+        for code in codes:
+            JourneyService.visit_changed(session, patient_id=code)
+    return listener
+
+def _journey_patient_listener(operation):
+    def listener(mapper, connection, target):
+        from application.services.journey_service import JourneyService
+        history = attributes.get_history(target, 'patient_id')
+        if operation == 'update' and not history.has_changes():
+            return
+        for code in {*history.deleted, *history.unchanged, *history.added}:
+            JourneyService.visit_changed(object_session(target), patient_id=code)
+    return listener
+
+# The patient journey's cached per-visit state follows committed workflow
+# writes: new steps are marked done, anything else forgets the visit
+for _model, _step in ((Triage, 'triage'), (Prescription, 'prescription'), (Invoice, 'invoice')):
+    for _operation in ('insert', 'update', 'delete'):
+        event.listen(_model, f'after_{_operation}', _journey_step_listener(_step, _operation))
+for _operation in ('insert', 'update', 'delete'):
+    event.listen(Visit, f'after_{_operation}', _journey_visit_listener(_operation))
+event.listen(Patient, 'after_update', _journey_patient_listener('update'))
+event.listen(Patient, 'after_delete', _journey_patient_listener('delete'))
+
+def _vitals_listener(mapper, connection, target):
+    from application.services.vitals_service import VitalsService
+    history = attributes.get_history(target, 'visit_id')
+    visits = {target.visit_id, *history.deleted} - {None}
+    patients = connection.execute(select(Visit.patient_id).where(Visit.id.in_(visits))).scalars()
+    cache.forget(object_session(target), *map(VitalsService.patient_key, patients))
+
+def _vitals_visit_listener(mapper, connection, target):
+    from application.services.vitals_service import VitalsService
+    history = attributes.get_history(target, 'patient_id')
+    if history.has_changes() or attributes.get_history(target, 'visit_date').has_changes():
+        patients = {target.patient_id, *history.deleted} - {None}
+        cache.forget(object_session(target), *map(VitalsService.patient_key, patients))
+
+# A patient's cached vitals trend is dropped when a commit changes their readings
+for _operation in ('insert', 'update', 'delete'):
+    event.listen(Triage, f'after_{_operation}', _vitals_listener)
+event.listen(Visit, 'after_update', _vitals_visit_listener)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_journey_changes(session):
+    if session.info.get('journey_changes'):
+        from application.services.journey_service import JourneyService
+        JourneyService.apply(session)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_journey_changes(session):
+    session.info.pop('journey_changes', None)
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import threading
+import time
+
+from flask import has_request_context, request
+import pdfkit
+
+
+class QueueFull(Exception):
+    """Raised when more PDFs are waiting than PDF_MAX_PENDING allows"""
+
+
+def render_pdf(html, options, wkhtmltopdf):
+    """Run wkhtmltopdf over html; called on a renderer worker thread"""
+    configuration = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf) if wkhtmltopdf else None
+    return pdfkit.from_string(html, False, options=options or None, configuration=configuration)
+
+
+class RenderJob:
+    """A queued PDF, addressed by the digest of its HTML"""
+
+    def __init__(self, id, filename, future):
+        self.id = id
+        self.filename = filename
+        self.future = future
+        self.created_at = time.time()
+        self.finished_at = None
+        future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        self.finished_at = time.time()
+
+    @property
+    def status(self):
+        if not self.future.done():
+            return 'running' if self.future.running() else 'pending'
+        return 'failed' if self.future.exception() is not None else 'done'
+
+    @property
+    def error(self):
+        if self.future.done() and self.future.exception() is not None:
+            return str(self.future.exception())
+        return None
+
+    def result(self):
+        return self.future.result()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'filename': self.filename,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class PdfRenderer:
+    """Renders PDFs on a bounded pool of workers, off the request threads.
+
+    Each worker drives one wkhtmltopdf process, so PDF_WORKERS caps how many
+    run at once and the rest wait in the queue. Requests render their HTML,
+    submit it and get a job back straight away. Jobs are keyed by the digest
+    of their HTML: printing the same invoice twice while the first copy is
+    queued or still downloadable reuses that job.
+    """
+
+    def __init__(self):
+        self.max_workers = 2
+        self.max_pending = 100
+        self.job_ttl = 600
+        self.wkhtmltopdf = None
+        self.options = {}
+        self.submitted = 0
+        self.coalesced = 0
+        # Called as on_rendered(endpoint, seconds) after each wkhtmltopdf run
+        self.on_rendered = None
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('PDF_WORKERS', 2)
+        self.max_pending = app.config.get('PDF_MAX_PENDING', 100)
+        self.job_ttl = app.config.get('PDF_JOB_TTL', 600)
+        self.wkhtmltopdf = app.config.get('WKHTMLTOPDF_PATH')
+        self.options = app.config.get('PDF_OPTIONS', {})
+        app.extensions['pdf_renderer'] = self
+
+    def submit(self, html, filename):
+        """Queue html for rendering, or return the job already holding it"""
+        key = hashlib.sha256(
+            json.dumps([html, self.options], sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(key)
+            if job is not None and job.status != 'failed':
+                self.coalesced += 1
+                return job
+            if self._pending() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} PDFs are already waiting to render")
+            endpoint = request.endpoint if has_request_context() else None
+            future = self._pool().submit(self._render, html, endpoint)
+            job = self._jobs[key] = RenderJob(key, filename, future)
+            self.submitted += 1
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'pending': self._pending(),
+                'jobs': len(self._jobs),
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            self._jobs.clear()
+
+    def _render(self, html, endpoint):
+        started = time.perf_counter()
+        try:
+            return render_pdf(html, self.options, self.wkhtmltopdf)
+        finally:
+            if self.on_rendered is not None:
+                self.on_rendered(endpoint, time.perf_counter() - started)
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pdf')
+        return self._executor
+
+    def _pending(self):
+        return sum(1 for job in self._jobs.values() if not job.future.done())
+
+    def _expire(self):
+        cutoff = time.time() - self.job_ttl
+        for key in [key for key, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[key]
@@ -0,0 +1,74 @@
+from functools import partial
+
+from flask import Blueprint, abort, jsonify, make_response, render_template, request, send_file, url_for
+from application.extensions import document_cache, renderer
+from application.rendering import QueueFull
+
+documents = Blueprint('documents', __name__, url_prefix='/documents')
+
+
+def queue_pdf(template, filename, download=False, cache_key=None, **context):
+    """Render template to HTML and hand it to the PDF workers.
+
+    Browsers get a page that waits for the job and then opens the PDF;
+    clients asking for JSON get the job and its URLs with a 202. With a
+    cache_key of (owner, key) a cached copy is sent as-is and a fresh
+    render is stored for next time.
+    """
+    if cache_key:
+        path = document_cache.get(*cache_key, '.pdf')
+        if path:
+            return send_file(
+                path, mimetype='application/pdf', as_attachment=download,
+                download_name=filename, etag=cache_key[1],
+            )
+
+    try:
+        job = renderer.submit(render_template(template, **context), filename)
+    except QueueFull as exc:
+        response = jsonify(error=str(exc))
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    if cache_key:
+        job.future.add_done_callback(partial(_store_rendered, cache_key))
+
+    urls = {
+        'status_url': url_for('documents_bp.job_status', job_id=job.id),
+        'result_url': url_for('documents_bp.job_result', job_id=job.id, download=1 if download else None),
+    }
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(dict(job.to_dict(), **urls)), 202
+    return render_template('documents/pdf_job.html', job=job, **urls), 202
+
+
+def _store_rendered(cache_key, future):
+    if future.exception() is None:
+        document_cache.put(*cache_key, '.pdf', future.result())
+
+
+@documents.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = renderer.get(job_id) or abort(404)
+    return jsonify(job.to_dict())
+
+
+@documents.route('/jobs/<job_id>/pdf')
+def job_result(job_id):
+    """The rendered PDF, or 202 with Retry-After while it is still queued"""
+    job = renderer.get(job_id) or abort(404)
+    if job.status in ('pending', 'running'):
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers['Retry-After'] = '1'
+        return response
+    if job.status == 'failed':
+        response = jsonify(job.to_dict())
+        response.status_code = 500
+        return response
+
+    response = make_response(job.result())
+    disposition = 'attachment' if request.args.get('download') else 'inline'
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'{disposition}; filename={job.filename}'
+    return response
@@ -0,0 +1,30 @@
+from datetime import date
+
+from flask import Blueprint, Response, abort, request, stream_with_context
+from application.extensions import router
+from application.services.export_service import ExportService
+
+exports = Blueprint('exports', __name__, url_prefix='/exports')
+
+
+@exports.route('/<dataset>.<fmt>')
+@router.read_only_view
+def export(dataset, fmt):
+    """Stream dataset as a chunked download, optionally limited to ?start=&end= (YYYY-MM-DD)"""
+    if dataset not in ExportService.DATASETS or fmt not in ExportService.FORMATS:
+        abort(404)
+    try:
+        start, end = (date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                      for name in ('start', 'end'))
+    except ValueError:
+        abort(400, description="start and end must be dates in YYYY-MM-DD form")
+
+    # No Content-Length, so the server sends the body chunked as it is produced
+    return Response(
+        stream_with_context(router.stream(ExportService.stream(dataset, fmt, start, end))),
+        mimetype=ExportService.FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename={ExportService.filename(dataset, fmt, start, end)}',
+            'X-Accel-Buffering': 'no',
+        },
+    )
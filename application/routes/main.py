@@ -1,25 +1,73 @@
-from flask import Blueprint, redirect, url_for
-from application.models.models import Patient, Visit
+from flask import Blueprint, abort, jsonify, redirect, request, url_for
+from application.models.models import Patient
+from application.services.chart_service import PatientChartService
+from application.services.journey_service import JourneyService
+from application.services.search_service import PatientSearchService
+from application.services.vitals_service import VitalsService
 
 main = Blueprint('main', __name__, url_prefix='/main')
 
 
+# The admin form that takes a journey to its next stage, and what it is prefilled with
+NEXT_STEP = {
+    'visit': ('visit.create_view', 'patient_id', 'patient'),
+    'triage': ('triage.create_view', 'visit_id', 'visit'),
+    'prescription': ('prescription.create_view', 'visit_id', 'visit'),
+    'invoice': ('invoice.create_view', 'visit_id', 'visit'),
+}
+
+
+def _next_url(state):
+    if state['stage'] == 'done':
+        return url_for('admin.index')
+    endpoint, arg, key = NEXT_STEP[state['stage']]
+    return url_for(endpoint, **{arg: state[key]})
+
+
 @main.route('/patient-journey/<patient_id>')
 def patient_journey(patient_id):
     """Central hub for patient's clinical journey"""
-    patient = Patient.query.filter_by(patient_id=patient_id).first_or_404()
-    active_visit = Visit.query.filter_by(patient_id=patient.id, status='in-progress').first()
-    
-    if not active_visit:
-        return redirect(url_for('admin.create_view', url='/admin/visit', patient_id=patient.id))
-    
-    if not active_visit.triage:
-        return redirect(url_for('admin.create_view', url='/admin/triage', visit_id=active_visit.id))
-    
-    if not active_visit.prescriptions:
-        return redirect(url_for('admin.create_view', url='/admin/prescription', visit_id=active_visit.id))
-    
-    if not active_visit.invoice:
-        return redirect(url_for('admin.create_view', url='/admin/invoice', visit_id=active_visit.id))
-    
-    return redirect(url_for('admin.index'))
+    state = JourneyService.resolve(patient_id) or abort(404)
+    return redirect(_next_url(state))
+
+
+@main.route('/patient-journey/<patient_id>/state')
+def patient_journey_state(patient_id):
+    """The journey's stage, completed steps and next form as JSON"""
+    state = JourneyService.resolve(patient_id) or abort(404)
+    return jsonify(dict(state, next_url=_next_url(state)))
+
+
+@main.route('/patient-chart/<patient_id>')
+def patient_chart(patient_id):
+    """Visit history, newest first; ?before=<next cursor> pages back"""
+    try:
+        chart = PatientChartService.chart(
+            patient_id, before=request.args.get('before'), limit=request.args.get('limit', type=int),
+        )
+    except ValueError:
+        abort(400, description='Malformed cursor')
+    return jsonify(chart or abort(404))
+
+
+@main.route('/patient-vitals/<patient_id>')
+def patient_vitals(patient_id):
+    """Triage readings over time with BMI trajectory, BP moving averages and out-of-range flags"""
+    patient = Patient.query.with_entities(Patient.id).filter_by(patient_id=patient_id).first_or_404()
+    return jsonify(VitalsService.patient_trend(patient.id))
+
+
+@main.route('/patient-search')
+def patient_search():
+    """Typeahead lookup by name, KMC ID or phone number"""
+    term = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    patients = PatientSearchService.search(term, limit=limit) if term.strip() else []
+    return jsonify([{
+        'id': patient.id,
+        'patient_id': patient.patient_id,
+        'full_name': patient.full_name,
+        'phone': patient.phone,
+        'age': patient.age,
+        'gender': patient.gender,
+    } for patient in patients])
@@ -8,7 +8,7 @@ triage = Blueprint('triage', __name__, url_prefix='/triage')
 @triage.route('/<string:patient_custom_id>', methods=['GET', 'POST'])
 def manage_triage(patient_custom_id):
     # Get patient by custom ID
-    patient = Patient.query.filter_by(custom_id=patient_custom_id).first_or_404()
+    patient = Patient.query.filter_by(patient_id=patient_custom_id).first_or_404()
     
     # Get active visit or create a new one if none exists
     active_visit = Visit.query.filter_by(
@@ -50,7 +50,7 @@ def manage_triage(patient_custom_id):
             VisitService.update_triage(active_visit.id, triage_data)
             
             flash('Triage data saved successfully', 'success')
-            return redirect(url_for('visit.generate_medical_form', visit_id=active_visit.id))
+            return redirect(url_for('visit_bp.generate_medical_form', visit_id=active_visit.id))
             
         except ValueError as e:
             db.session.rollback()
@@ -0,0 +1,112 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, g, request
+from flask_sqlalchemy.session import Session
+
+_read_only = ContextVar('read_only', default=False)
+
+
+class RoutingSession(Session):
+    """Session that sends reads inside SessionRouter.read_only() to the read engine.
+
+    Flushes, and everything outside read_only(), keep using the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _read_only.get():
+            engine = current_app.extensions.get('read_engine')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class SessionRouter:
+    """Routes report and list reads to a read-only engine with its own pool.
+
+    The read engine is built by init_db: a mode=ro URI on the same file for
+    SQLite (readers never hold the writer's connections, and query_only
+    rejects any stray write), or SQLALCHEMY_READ_URI for a server database
+    replica. Without one, everything reads from the primary as before.
+
+    Work is marked three ways: read_only() as a context manager or
+    decorator around services, read_only_view on a view function, and
+    mark() for endpoints registered elsewhere (the admin list views). A
+    marked GET or HEAD request is read-only from before_request until
+    teardown, so its templates read from the same engine; a streamed body
+    runs after teardown and keeps the mode by going through stream().
+    Raw connections taken through .engine follow the same switch.
+    """
+
+    def __init__(self):
+        self.endpoints = set()
+
+    def init_app(self, app, read_engine=None):
+        app.extensions['read_engine'] = read_engine
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+
+    @staticmethod
+    @contextmanager
+    def read_only():
+        token = _read_only.set(True)
+        try:
+            yield
+        finally:
+            _read_only.reset(token)
+
+    @staticmethod
+    def read_only_view(view):
+        view.read_only = True
+        return view
+
+    def mark(self, *endpoints):
+        self.endpoints.update(endpoints)
+
+    @staticmethod
+    def stream(iterable):
+        """iterable, advanced read-only if it is created read-only (for streamed response bodies)"""
+        if not _read_only.get():
+            return iterable
+
+        def generate():
+            iterator = iter(iterable)
+            try:
+                while True:
+                    # Set and reset within each step: the server may resume the body from another context
+                    token = _read_only.set(True)
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        _read_only.reset(token)
+                    yield item
+            finally:
+                # A client that goes away mid-body still releases the cursor's connection
+                close = getattr(iterator, 'close', None)
+                if close is not None:
+                    close()
+
+        return generate()
+
+    @property
+    def engine(self):
+        """The engine for a raw connection here: the read engine inside read_only(), else the primary"""
+        engine = current_app.extensions['sqlalchemy'].engine
+        if _read_only.get():
+            return current_app.extensions.get('read_engine') or engine
+        return engine
+
+    def _start_request(self):
+        if request.method not in ('GET', 'HEAD'):
+            return
+        view = current_app.view_functions.get(request.endpoint)
+        if request.endpoint in self.endpoints or getattr(view, 'read_only', False):
+            g.read_only_token = _read_only.set(True)
+
+    @staticmethod
+    def _finish_request(exc=None):
+        token = g.pop('read_only_token', None)
+        if token is not None:
+            _read_only.reset(token)
@@ -1,32 +1,223 @@
-from application.models import db, Invoice, Prescription
-from datetime import datetime, timedelta
-import pandas as pd
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import Float, String, func, select, type_coerce
+
+from application.extensions import cache, db, router
+from application.models.models import Doctor, Drug, Invoice, Prescription, PrescriptionDrug, Visit
+
+# One row per prescribed drug, as pulled by AnalyticsService.load
+ROW_DTYPE = np.dtype([
+    ('day', 'M8[D]'),
+    ('drug_id', 'i8'),
+    ('quantity', 'i8'),
+    ('unit_price', 'f8'),
+    ('patient_id', 'i8'),
+    ('doctor_id', 'i8'),
+    ('visit_id', 'i8'),
+    ('visit_type', 'O'),
+])
+PERIODS = {'day': 'M8[D]', 'week': 'M8[W]', 'month': 'M8[M]', 'year': 'M8[Y]'}
+TAGS = ('prescriptions', 'prescription_drugs', 'drugs', 'visits', 'doctors')
+
 
 class AnalyticsService:
+    """Drug, revenue and visit analytics computed column-wise with NumPy.
+
+    A date window's prescribed drugs are pulled by one Core query straight
+    into a typed structured array; every report is then a handful of
+    vectorized group-bys (bincount / unique) over its columns. The whole
+    summary for a window is cached until one of its tables changes.
+    """
+
+    CHUNK_ROWS = 100000
+    # Largest (group, value) bitmap _distinct builds before falling back to sorting
+    BITMAP_LIMIT = 256 * 1024 * 1024
+
     @staticmethod
+    @cache.cached(ttl=600, tags=('invoices',))
+    @router.read_only()
     def get_financial_report(start_date=None, end_date=None):
-        """Generate financial summary"""
-        if not start_date:
-            start_date = datetime.now() - timedelta(days=30)
-        if not end_date:
-            end_date = datetime.now()
-            
-        query = db.session.query(
-            Invoice.status,
-            db.func.sum(Invoice.total_amount).label('total'),
-            db.func.count().label('count')
-        ).filter(
-            Invoice.created_at.between(start_date, end_date)
-        ).group_by(Invoice.status)
-        
-        return pd.DataFrame(query.all(), columns=['status', 'total', 'count'])
-    
-    @staticmethod
-    def get_prescription_analytics():
+        """Invoice count and total per status for the window (default: last 30 days)"""
+        end_date = end_date or date.today()
+        start_date = start_date or end_date - timedelta(days=30)
+        rows = db.session.execute(
+            select(Invoice.status, func.sum(Invoice.total_amount), func.count())
+            .where(Invoice.invoice_date.between(start_date, end_date))
+            .group_by(Invoice.status)
+        ).all()
+        return [{'status': status, 'total': total, 'count': count} for status, total, count in rows]
+
+    @classmethod
+    def get_prescription_analytics(cls, start_date=None, end_date=None):
         """Top prescribed medications"""
-        query = db.session.query(
-            Prescription.medication,
-            db.func.count().label('prescription_count')
-        ).group_by(Prescription.medication).order_by(db.desc('prescription_count')).limit(10)
-        
-        return pd.DataFrame(query.all(), columns=['medication', 'count'])
\ No newline at end of file
+        return cls.summary(start_date, end_date)['top_drugs']
+
+    @classmethod
+    @router.read_only()
+    def summary(cls, start_date=None, end_date=None, period='month', limit=10):
+        """Every report for the window (default: the last 365 days), cached per window"""
+        end_date = end_date or date.today()
+        start_date = start_date or end_date - timedelta(days=365)
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+        return cache.get_or_set(
+            f"analytics:summary:{start_date}:{end_date}:{period}:{limit}",
+            lambda: cls.compute(cls.load(start_date, end_date), period, limit),
+            ttl=600,
+            tags=TAGS,
+        )
+
+    @classmethod
+    def compute(cls, rows, period='month', limit=10):
+        revenue = rows['quantity'] * rows['unit_price']
+        return {
+            'rows': len(rows),
+            'revenue': round(float(revenue.sum()), 2),
+            'top_drugs': cls.top_drugs(rows, revenue, limit),
+            'revenue_by_period': cls.revenue_by_period(rows, revenue, period),
+            'revenue_by_doctor': cls.revenue_by_doctor(rows, revenue),
+            'visit_type_mix': cls.visit_type_mix(rows, revenue),
+        }
+
+    @classmethod
+    def load(cls, start_date, end_date):
+        """Prescribed drugs dated within [start_date, end_date] as a ROW_DTYPE array"""
+        query = (
+            select(
+                # Raw column values: NumPy parses the dates and the prices stay floats
+                type_coerce(Prescription.start_date, String),
+                PrescriptionDrug.drug_id,
+                PrescriptionDrug.quantity,
+                type_coerce(Drug.unit_price, Float),
+                Prescription.patient_id,
+                Prescription.doctor_id,
+                func.coalesce(Prescription.visit_id, 0),
+                func.coalesce(Visit.visit_type, ''),
+            )
+            .select_from(PrescriptionDrug)
+            .join(Prescription, Prescription.id == PrescriptionDrug.prescription_id)
+            .join(Drug, Drug.id == PrescriptionDrug.drug_id)
+            .outerjoin(Visit, Visit.id == Prescription.visit_id)
+            .where(Prescription.start_date.between(start_date, end_date))
+        )
+        chunks = []
+        with router.engine.connect() as connection:
+            result = connection.execution_options(yield_per=cls.CHUNK_ROWS).execute(query)
+            for partition in result.partitions():
+                chunks.append(np.fromiter(map(tuple, partition), dtype=ROW_DTYPE, count=len(partition)))
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=ROW_DTYPE)
+
+    @classmethod
+    def top_drugs(cls, rows, revenue, limit=10):
+        """Drugs by quantity prescribed, with revenue and distinct patients"""
+        if not len(rows):
+            return []
+        drug_ids, index = cls._groups(rows['drug_id'])
+        quantity = np.bincount(index, weights=rows['quantity'])
+        totals = np.bincount(index, weights=revenue)
+        patients = cls._distinct(index, rows['patient_id'], len(drug_ids))
+        top = np.lexsort((-totals, -quantity))[:limit]
+        names = dict(db.session.execute(
+            select(Drug.id, Drug.name).where(Drug.id.in_(drug_ids[top].tolist()))
+        ).all())
+        return [{
+            'drug_id': int(drug_ids[i]),
+            'name': names.get(int(drug_ids[i])),
+            'quantity': int(quantity[i]),
+            'revenue': round(float(totals[i]), 2),
+            'patients': int(patients[i]),
+        } for i in top]
+
+    @classmethod
+    def revenue_by_period(cls, rows, revenue, period='month'):
+        """Revenue and quantity dispensed per day/week/month/year, oldest first"""
+        if not len(rows):
+            return []
+        if period == 'week':
+            # NumPy weeks start on Thursday 1970-01-01; shift them to start on Monday
+            keys, index = cls._groups((rows['day'].view('i8') + 3) // 7)
+            starts = (keys * 7 - 3).view('M8[D]')
+        else:
+            keys, index = cls._groups(rows['day'].astype(PERIODS[period]).view('i8'))
+            starts = keys.view(PERIODS[period]).astype('M8[D]')
+        totals = np.bincount(index, weights=revenue)
+        quantity = np.bincount(index, weights=rows['quantity'])
+        return [{
+            'period': str(start),
+            'revenue': round(float(total), 2),
+            'quantity': int(count),
+        } for start, total, count in zip(starts, totals, quantity)]
+
+    @classmethod
+    def revenue_by_doctor(cls, rows, revenue):
+        """Revenue and distinct patients per prescribing doctor, highest first"""
+        if not len(rows):
+            return []
+        doctor_ids, index = cls._groups(rows['doctor_id'])
+        totals = np.bincount(index, weights=revenue)
+        patients = cls._distinct(index, rows['patient_id'], len(doctor_ids))
+        names = {
+            id: f"{first_name} {last_name}" for id, first_name, last_name in db.session.execute(
+                select(Doctor.id, Doctor.first_name, Doctor.last_name).where(Doctor.id.in_(doctor_ids.tolist()))
+            )
+        }
+        return [{
+            'doctor_id': int(doctor_ids[i]),
+            'name': names.get(int(doctor_ids[i])),
+            'revenue': round(float(totals[i]), 2),
+            'patients': int(patients[i]),
+        } for i in np.argsort(-totals, kind='stable')]
+
+    @classmethod
+    def visit_type_mix(cls, rows, revenue):
+        """Distinct visits, their share and revenue per visit type, most visits first.
+
+        Prescriptions without a visit (or a visit without a type) fall under ''.
+        """
+        if not len(rows):
+            return []
+        # The type belongs to the visit, so only one row per visit needs decoding
+        visit_ids, visit_index = cls._groups(rows['visit_id'])
+        first = np.empty(len(visit_ids), dtype=np.int64)
+        first[visit_index[::-1]] = np.arange(len(rows) - 1, -1, -1)
+        types, visit_types = cls._factorize(rows['visit_type'][first])
+        totals = np.bincount(visit_types[visit_index], weights=revenue, minlength=len(types))
+        visits = np.bincount(visit_types[visit_ids > 0], minlength=len(types))
+        total_visits = int(visits.sum())
+        return [{
+            'visit_type': types[i],
+            'visits': int(visits[i]),
+            'share': round(float(visits[i]) / total_visits, 4) if total_visits else 0.0,
+            'revenue': round(float(totals[i]), 2),
+        } for i in np.argsort(-visits, kind='stable')]
+
+    @staticmethod
+    def _groups(keys):
+        """(distinct keys, dense group number per row) for integer keys, without sorting"""
+        low = keys.min()
+        offset = keys - low
+        present = np.bincount(offset) > 0
+        return np.flatnonzero(present) + low, (np.cumsum(present) - 1)[offset]
+
+    @staticmethod
+    def _factorize(values):
+        """(distinct labels, code per value) for a low-cardinality object column"""
+        labels = list(dict.fromkeys(values.tolist()))
+        codes = {label: code for code, label in enumerate(labels)}
+        return labels, np.fromiter(map(codes.__getitem__, values), dtype=np.int64, count=len(values))
+
+    @classmethod
+    def _distinct(cls, index, values, groups):
+        """Number of distinct values in each of groups groups"""
+        if not len(values):
+            return np.zeros(groups, dtype=np.int64)
+        low = values.min()
+        span = int(values.max() - low) + 1
+        keys = index * span + (values - low)
+        if groups * span <= cls.BITMAP_LIMIT:
+            # A seen-bitmap over every (group, value) pair is linear; unique() would sort
+            seen = np.zeros(groups * span, dtype=bool)
+            seen[keys] = True
+            return seen.reshape(groups, span).sum(axis=1)
+        return np.bincount(np.unique(keys) // span, minlength=groups)
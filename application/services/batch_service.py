@@ -0,0 +1,250 @@
+from datetime import datetime
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased, selectinload
+
+from application.extensions import db
+from application.models.models import Doctor, Patient, Triage, Visit
+from application.services.sequence_service import SequenceService
+from application.services.visit_service import VisitService
+
+PATIENT_FIELDS = ('first_name', 'last_name', 'age', 'gender', 'phone', 'email', 'address', 'blood_type', 'allergies')
+PATIENT_REQUIRED = ('first_name', 'last_name', 'age', 'gender', 'phone')
+VISIT_STATUSES = ('scheduled', 'in-progress', 'completed', 'cancelled')
+TRIAGE_FIELDS = ('height', 'weight', 'temperature', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+                 'pulse', 'oxygen_saturation', 'notes')
+
+# Item errors: bad input and the model validators' rejections
+INVALID = (KeyError, TypeError, ValueError, AssertionError)
+
+
+def _patients():
+    return select(
+        Patient.id, Patient.patient_id, Patient.public_id, Patient.first_name, Patient.last_name, Patient.age,
+        Patient.gender, Patient.phone, Patient.email, Patient.address, Patient.blood_type, Patient.allergies,
+    ), Patient.patient_id, Patient.id
+
+
+def _visits():
+    patient, doctor = aliased(Patient), aliased(Doctor)
+    return select(
+        Visit.id, Visit.visit_id, Visit.public_id, patient.patient_id, doctor.doctor_id,
+        Visit.visit_date, Visit.visit_type, Visit.status,
+    ).join(patient, patient.id == Visit.patient_id).join(doctor, doctor.id == Visit.doctor_id), Visit.visit_id, Visit.id
+
+
+def _triage():
+    return select(
+        Visit.visit_id, *(getattr(Triage, field) for field in TRIAGE_FIELDS), Triage.bmi.label('bmi'),
+    ).join(Visit, Visit.id == Triage.visit_id), Visit.visit_id, Triage.id
+
+
+class BatchService:
+    """Batched writes and reads behind the integration API (/api).
+
+    A write takes a list of items and applies every valid one in a single
+    transaction: references (patients, doctors, visits) are resolved with
+    one query per batch, KMC IDs are reserved as one block from
+    id_sequences, and the new objects go out in one flush, so the ORM
+    listeners (search index, rollups, journey and vitals caches) still see
+    every row. Each item gets its own result; an item that fails validation
+    is reported and skipped without affecting the rest.
+
+    Reads are Core selects over an id list, READ_CHUNK ids per round trip,
+    yielded as plain dicts so the caller can stream them.
+    """
+
+    READ_CHUNK = 500
+
+    # name -> () -> (select, code column the ids match, primary key to order by)
+    DATASETS = {
+        'patients': _patients,
+        'visits': _visits,
+        'triage': _triage,
+    }
+    # name -> the field of each row its ids are matched against
+    CODES = {
+        'patients': 'patient_id',
+        'visits': 'visit_id',
+        'triage': 'visit_id',
+    }
+
+    @classmethod
+    def create_patients(cls, items):
+        results, patients = [], []
+        for index, item in enumerate(items):
+            try:
+                patient = Patient(public_id=str(uuid.uuid4()), **cls._patient_values(item))
+            except INVALID as e:
+                results.append(cls._error(index, e))
+                continue
+            patients.append((index, patient))
+            results.append(None)
+
+        codes = cls._reserve('patient', len(patients))
+        for (index, patient), code in zip(patients, codes):
+            patient.patient_id = code
+            db.session.add(patient)
+        db.session.flush()
+        for index, patient in patients:
+            results[index] = {
+                'index': index, 'status': 'created', 'id': patient.id,
+                'patient_id': patient.patient_id, 'public_id': patient.public_id,
+            }
+        db.session.commit()
+        return results
+
+    @classmethod
+    def create_visits(cls, items):
+        patients = cls._lookup(Patient, Patient.patient_id, (item.get('patient_id') for item in items))
+        doctors = cls._lookup(Doctor, Doctor.doctor_id, (item.get('doctor_id') for item in items))
+        results, visits = [], []
+        for index, item in enumerate(items):
+            try:
+                visit = Visit(public_id=str(uuid.uuid4()), **cls._visit_values(item, patients, doctors))
+            except INVALID as e:
+                results.append(cls._error(index, e))
+                continue
+            visits.append((index, visit))
+            results.append(None)
+
+        codes = cls._reserve('visit', len(visits))
+        for (index, visit), code in zip(visits, codes):
+            visit.visit_id = code
+            db.session.add(visit)
+        db.session.flush()
+        for index, visit in visits:
+            results[index] = {
+                'index': index, 'status': 'created', 'id': visit.id,
+                'visit_id': visit.visit_id, 'public_id': visit.public_id,
+            }
+        db.session.commit()
+        return results
+
+    @classmethod
+    def update_triage(cls, items):
+        """Create or update each item's visit's triage; only the fields an item carries are changed"""
+        codes = {item.get('visit_id') for item in items} - {None}
+        visits = {}
+        if codes:
+            visits = {
+                visit.visit_id: visit for visit in db.session.execute(
+                    select(Visit).where(Visit.visit_id.in_(codes)).options(selectinload(Visit.triage))
+                ).scalars()
+            }
+
+        results, written = [], []
+        for index, item in enumerate(items):
+            try:
+                visit = visits.get(item.get('visit_id'))
+                if visit is None:
+                    raise ValueError(f"Unknown visit {item.get('visit_id')!r}")
+                values = cls._triage_values(item)
+                # Constructing a detached Triage runs the validators before anything is changed
+                Triage(**values)
+            except INVALID as e:
+                results.append(cls._error(index, e))
+                continue
+            created = visit.triage is None
+            if created:
+                visit.triage = Triage(**values)
+            else:
+                for field, value in values.items():
+                    setattr(visit.triage, field, value)
+            written.append((index, visit, created))
+            results.append(None)
+
+        db.session.flush()
+        for index, visit, created in written:
+            results[index] = {
+                'index': index, 'status': 'created' if created else 'updated',
+                'visit_id': visit.visit_id, 'bmi': visit.triage.bmi,
+            }
+        db.session.commit()
+        return results
+
+    @classmethod
+    def read(cls, dataset, ids=None):
+        """Yield dataset rows as dicts, for the given KMC IDs (in chunks) or every row"""
+        query, code, pk = cls.DATASETS[dataset]()
+        if ids is None:
+            result = db.session.execute(query.order_by(pk).execution_options(yield_per=cls.READ_CHUNK))
+            for row in result.mappings():
+                yield cls._row(row)
+            return
+        for start in range(0, len(ids), cls.READ_CHUNK):
+            chunk = ids[start:start + cls.READ_CHUNK]
+            for row in db.session.execute(query.where(code.in_(chunk)).order_by(pk)).mappings():
+                yield cls._row(row)
+
+    # Item validation: each raises one of INVALID with a message for the item's result
+
+    @staticmethod
+    def _patient_values(item):
+        missing = [field for field in PATIENT_REQUIRED if item.get(field) in (None, '')]
+        if missing:
+            raise ValueError(f"{', '.join(missing)} required")
+        values = {field: item[field] for field in PATIENT_FIELDS if item.get(field) not in (None, '')}
+        age = values['age']
+        if isinstance(age, str) and age.strip().isdigit():
+            age = int(age)
+        if isinstance(age, bool) or not isinstance(age, int) or not 0 <= age <= 150:
+            raise ValueError("age must be a whole number 0-150")
+        values['age'] = age
+        return values
+
+    @staticmethod
+    def _visit_values(item, patients, doctors):
+        patient = patients.get(item.get('patient_id'))
+        if patient is None:
+            raise ValueError(f"Unknown patient {item.get('patient_id')!r}")
+        doctor = doctors.get(item.get('doctor_id'))
+        if doctor is None:
+            raise ValueError(f"Unknown doctor {item.get('doctor_id')!r}")
+        values = {'patient_id': patient, 'doctor_id': doctor, 'visit_type': item.get('visit_type')}
+        if item.get('visit_date'):
+            values['visit_date'] = datetime.fromisoformat(item['visit_date'])
+        if item.get('status'):
+            if item['status'] not in VISIT_STATUSES:
+                raise ValueError(f"status must be one of {', '.join(VISIT_STATUSES)}")
+            values['status'] = item['status']
+        return values
+
+    @staticmethod
+    def _triage_values(item):
+        values = {field: item[field] for field in TRIAGE_FIELDS if field in item}
+        if 'blood_pressure' in item:
+            values['blood_pressure_systolic'], values['blood_pressure_diastolic'] = \
+                VisitService._split_blood_pressure(item['blood_pressure'])
+        for field, value in values.items():
+            if field != 'notes' and value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"{field} must be a number")
+        return values
+
+    @staticmethod
+    def _lookup(model, code, values):
+        """{KMC ID: primary key} for the given codes, in one query"""
+        codes = {value for value in values if isinstance(value, str)}
+        if not codes:
+            return {}
+        return dict(db.session.execute(select(code, model.id).where(code.in_(codes))).all())
+
+    @staticmethod
+    def _reserve(entity, count):
+        """count KMC IDs from one id_sequences bump inside the batch's transaction"""
+        if not count:
+            return []
+        now = datetime.now()
+        last = SequenceService.reserve(db.session.connection(), entity, SequenceService.period(now), count, now=now)
+        prefix = SequenceService.prefix(entity, now)
+        return [f"{prefix}{seq:04d}" for seq in range(last - count + 1, last + 1)]
+
+    @staticmethod
+    def _error(index, error):
+        message = f"{error.args[0]} is required" if isinstance(error, KeyError) else str(error)
+        return {'index': index, 'status': 'error', 'error': message or type(error).__name__}
+
+    @staticmethod
+    def _row(row):
+        return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in row.items()}
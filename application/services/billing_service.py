@@ -25,10 +25,10 @@ def download_invoice(invoice_id):
             mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
         )
     except Exception as e:
-        # Fallback to PDF
-        pdf_stream = DocumentService.generate_pdf_invoice(invoice)
+        # Fallback to PDF, served straight from the document cache
+        pdf_path = DocumentService.pdf_invoice_path(invoice)
         return send_file(
-            pdf_stream,
+            pdf_path,
             as_attachment=True,
             download_name=f"Invoice_{invoice.id}.pdf",
             mimetype='application/pdf'
@@ -1,28 +1,91 @@
-from docx import Document
+from flask import current_app
 from io import BytesIO
 from datetime import datetime
 import os
 
+from application.extensions import docx_templates, document_cache
+
 class DocumentService:
-    TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), '../templates/docs')
+    @classmethod
+    def invoice_cache_key(cls, invoice, template):
+        """(owner, key) addressing invoice as rendered by template in the document cache"""
+        visit = invoice.visit
+        key = document_cache.key(
+            cls._row(invoice), cls._row(invoice.patient),
+            # The printed invoice names the visit's doctor as the provider
+            cls._row(visit), cls._row(visit.doctor if visit is not None else None),
+            [cls._row(item) for item in invoice.invoice_items],
+            [cls._row(payment) for payment in invoice.payments],
+            template, cls._template_mtime(template),
+        )
+        return f'invoice-{invoice.id}', key
+
+    @classmethod
+    def report_cache_key(cls, report, template):
+        """(owner, key) addressing a visit report as rendered by template"""
+        key = document_cache.key(
+            cls._row(report), cls._row(report.patient), cls._row(report.doctor),
+            template, cls._template_mtime(template),
+        )
+        return f'report-{report.id}', key
+
+    @classmethod
+    def pdf_invoice_path(cls, invoice):
+        """Path of the cached ReportLab invoice, generating it on a miss"""
+        owner, key = cls.invoice_cache_key(invoice, __file__)
+        return document_cache.get_or_build(
+            owner, key, '.pdf', lambda: cls.generate_pdf_invoice(invoice).getvalue()
+        )
+
+    @staticmethod
+    def _row(obj):
+        if obj is None:
+            return None
+        return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+    @staticmethod
+    def _template_mtime(template):
+        """mtime of a Jinja template name, or of a file path for code-built documents"""
+        if os.path.isabs(template):
+            return os.path.getmtime(template)
+        source, filename, _ = current_app.jinja_env.loader.get_source(current_app.jinja_env, template)
+        # Templates that do not come from a file are keyed on their source
+        return os.path.getmtime(filename) if filename else source
     
+    PRESCRIPTION_TEMPLATE = 'prescription_template.docx'
+
     @classmethod
     def generate_prescription(cls, prescription):
         """Generate prescription as Word doc"""
-        doc = Document(os.path.join(cls.TEMPLATE_PATH, 'prescription_template.docx'))
-        
-        # Replace placeholders
-        for paragraph in doc.paragraphs:
-            paragraph.text = paragraph.text.replace('[PATIENT_NAME]', prescription.patient.full_name())
-            paragraph.text = paragraph.text.replace('[MEDICATION]', prescription.medication)
-            paragraph.text = paragraph.text.replace('[DOSAGE]', prescription.dosage)
-            paragraph.text = paragraph.text.replace('[DATE]', datetime.now().strftime('%Y-%m-%d'))
-        
-        # Save to memory
-        output = BytesIO()
-        doc.save(output)
-        output.seek(0)
-        return output
+        template = docx_templates.get(cls.PRESCRIPTION_TEMPLATE)
+        return BytesIO(template.render(cls.prescription_context(prescription)))
+
+    @classmethod
+    def generate_prescriptions(cls, prescriptions, as_zip=False):
+        """Batch of prescriptions as one Word doc (a page each) or a zip of docs"""
+        template = docx_templates.get(cls.PRESCRIPTION_TEMPLATE)
+        if as_zip:
+            return BytesIO(template.render_zip(
+                (f'prescription_{prescription.id}.docx', cls.prescription_context(prescription))
+                for prescription in prescriptions
+            ))
+        return BytesIO(template.render_many(cls.prescription_context(p) for p in prescriptions))
+
+    @staticmethod
+    def prescription_context(prescription):
+        """Values for the [PLACEHOLDER] fields of the prescription template"""
+        drugs = prescription.prescription_drugs
+        return {
+            'PATIENT_NAME': prescription.patient.full_name,
+            'PATIENT_ID': prescription.patient.patient_id,
+            'DOCTOR_NAME': prescription.doctor.full_name if prescription.doctor else '',
+            'MEDICATION': '\n'.join(item.drug.name for item in drugs),
+            'DOSAGE': prescription.dosage or '\n'.join(
+                f"{item.drug.name}: {item.dosage}, {item.frequency} x{item.quantity}" for item in drugs
+            ),
+            'INSTRUCTIONS': prescription.instructions,
+            'DATE': datetime.now().strftime('%Y-%m-%d'),
+        }
     
     @classmethod
     def generate_pdf_invoice(cls, invoice):
@@ -38,7 +101,7 @@ class DocumentService:
         p.drawString(100, 750, f"Invoice #{invoice.id}")
         
         p.setFont("Helvetica", 12)
-        p.drawString(100, 720, f"Patient: {invoice.patient.full_name()}")
+        p.drawString(100, 720, f"Patient: {invoice.patient.full_name}")
         p.drawString(100, 700, f"Date: {invoice.created_at.strftime('%Y-%m-%d')}")
         p.drawString(100, 680, f"Amount Due: ${invoice.total_amount:,.2f}")
         
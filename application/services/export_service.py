@@ -0,0 +1,213 @@
+import csv
+from datetime import datetime, time, timedelta
+import io
+import tempfile
+
+from flask import current_app
+from sqlalchemy import Date, DateTime, Integer, Numeric, select
+
+from application.extensions import router
+from application.models.models import Doctor, Drug, Invoice, InvoiceItem, Patient, Payment, Receipt, Visit
+
+
+def _visits():
+    return select(
+        Visit.visit_id,
+        Visit.visit_date,
+        Visit.visit_type,
+        Visit.status,
+        Patient.patient_id,
+        (Patient.first_name + ' ' + Patient.last_name).label('patient_name'),
+        Doctor.doctor_id,
+        (Doctor.first_name + ' ' + Doctor.last_name).label('doctor_name'),
+    ).join(Visit.patient).join(Visit.doctor).order_by(Visit.visit_date, Visit.id), Visit.visit_date
+
+
+def _invoices():
+    return select(
+        Invoice.id.label('invoice_id'),
+        Invoice.invoice_date,
+        Invoice.due_date,
+        Patient.patient_id,
+        (Patient.first_name + ' ' + Patient.last_name).label('patient_name'),
+        Visit.visit_id,
+        Invoice.subtotal,
+        Invoice.professional_fee,
+        Invoice.sundries,
+        Invoice.tax_amount,
+        Invoice.discount_amount,
+        Invoice.total_amount,
+        Invoice.amount_paid.label('amount_paid'),
+        Invoice.balance_due.label('balance_due'),
+        Invoice.status,
+    ).join(Invoice.patient).join(Invoice.visit).order_by(Invoice.invoice_date, Invoice.id), Invoice.invoice_date
+
+
+def _invoice_items():
+    return select(
+        InvoiceItem.invoice_id,
+        Invoice.invoice_date,
+        InvoiceItem.id.label('item_id'),
+        InvoiceItem.item_type,
+        InvoiceItem.description,
+        Drug.name.label('drug'),
+        InvoiceItem.quantity,
+        InvoiceItem.unit_price,
+        InvoiceItem.total_price,
+    ).join(InvoiceItem.invoice).outerjoin(InvoiceItem.drugs).order_by(
+        Invoice.invoice_date, InvoiceItem.invoice_id, InvoiceItem.id
+    ), Invoice.invoice_date
+
+
+def _payments():
+    return select(
+        Payment.id.label('payment_id'),
+        Payment.payment_date,
+        Payment.invoice_id,
+        Patient.patient_id,
+        Payment.amount,
+        Payment.payment_method,
+        Payment.transaction_reference,
+        Receipt.receipt_number,
+    ).join(Payment.invoice).join(Invoice.patient).outerjoin(Payment.receipt).order_by(
+        Payment.payment_date, Payment.id
+    ), Payment.payment_date
+
+
+class ExportService:
+    """Streams visits, invoices, invoice items and payments to CSV, XLSX or Parquet.
+
+    Rows come off a server-side cursor EXPORT_BATCH_SIZE at a time and each
+    batch is encoded and handed to the response before the next is fetched,
+    so memory stays flat however wide the date range is.
+    """
+
+    DATASETS = {
+        'visits': _visits,
+        'invoices': _invoices,
+        'invoice_items': _invoice_items,
+        'payments': _payments,
+    }
+    FORMATS = {
+        'csv': 'text/csv; charset=utf-8',
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'parquet': 'application/vnd.apache.parquet',
+    }
+    CHUNK_BYTES = 64 * 1024
+
+    @classmethod
+    def stream(cls, dataset, fmt, start=None, end=None, batch_size=None):
+        """Generator of the encoded file's bytes; start and end are inclusive dates"""
+        if dataset not in cls.DATASETS:
+            raise ValueError(f"Unknown dataset {dataset!r}")
+        if fmt not in cls.FORMATS:
+            raise ValueError(f"Unknown format {fmt!r}")
+        query, date_column = cls.DATASETS[dataset]()
+        if start:
+            query = query.where(date_column >= cls._bound(date_column, start))
+        if end:
+            query = query.where(date_column < cls._bound(date_column, end + timedelta(days=1)))
+        batch_size = batch_size or current_app.config.get('EXPORT_BATCH_SIZE', 2000)
+        return getattr(cls, f'_write_{fmt}')(query, cls._batches(query, batch_size))
+
+    @staticmethod
+    def filename(dataset, fmt, start=None, end=None):
+        span = '_'.join(day.isoformat() for day in (start, end) if day)
+        return f"{dataset}{'_' + span if span else ''}.{fmt}"
+
+    @staticmethod
+    def _batches(query, batch_size):
+        """Yield lists of row tuples from a streaming cursor on its own connection"""
+        with router.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+            for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+
+    @staticmethod
+    def _bound(column, day):
+        return datetime.combine(day, time.min) if isinstance(column.type, DateTime) else day
+
+    @classmethod
+    def _write_csv(cls, query, batches):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM so Excel opens the file as UTF-8
+        buffer.write('\ufeff')
+        writer.writerow([column.name for column in query.selected_columns])
+        for rows in batches:
+            writer.writerows(rows)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    @classmethod
+    def _write_xlsx(cls, query, batches):
+        from openpyxl import Workbook
+
+        # Write-only sheets spool their rows to a temp file as they are appended;
+        # the zip container can only be sent once the last row is in
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append([column.name for column in query.selected_columns])
+        for rows in batches:
+            for row in rows:
+                sheet.append(row)
+        with tempfile.TemporaryFile() as handle:
+            workbook.save(handle)
+            handle.seek(0)
+            while chunk := handle.read(cls.CHUNK_BYTES):
+                yield chunk
+
+    @classmethod
+    def _write_parquet(cls, query, batches):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([(column.name, cls._arrow_type(pa, column.type)) for column in query.selected_columns])
+        sink = _Spool()
+        with pq.ParquetWriter(sink, schema) as writer:
+            for rows in batches:
+                # One row group per batch, flushed to the client straight away
+                columns = list(zip(*rows))
+                writer.write_batch(pa.record_batch(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema,
+                ))
+                yield sink.drain()
+        yield sink.drain()
+
+    @staticmethod
+    def _arrow_type(pa, column_type):
+        if isinstance(column_type, Numeric) and column_type.scale is not None:
+            return pa.decimal128(column_type.precision or 38, column_type.scale)
+        if isinstance(column_type, Integer):
+            return pa.int64()
+        if isinstance(column_type, DateTime):
+            return pa.timestamp('us')
+        if isinstance(column_type, Date):
+            return pa.date32()
+        return pa.string()
+
+
+class _Spool(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
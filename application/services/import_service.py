@@ -0,0 +1,221 @@
+import csv
+from datetime import datetime, timezone
+import hashlib
+import os
+import uuid
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import insert, select, update
+
+from application.extensions import cache, db, insert_ignore
+from application.models.models import ImportCheckpoint, Patient
+from application.services.search_service import PatientSearchService
+from application.services.sequence_service import SequenceService
+
+
+class PatientImportService:
+    """Bulk-loads patient registries from CSV or XLSX.
+
+    Rows are streamed in chunks, validated a column at a time with NumPy and
+    written with one executemany INSERT per chunk. Each chunk's KMC IDs are
+    reserved from id_sequences, its rows inserted and indexed for search and
+    the checkpoint advanced in a single transaction, so an interrupted
+    import rerun on the same file continues after the last committed chunk.
+    Rejected rows go to an error report CSV next to the source.
+    """
+
+    COLUMNS = ('first_name', 'last_name', 'age', 'gender', 'phone', 'email', 'address', 'blood_type', 'allergies')
+    REQUIRED = ('first_name', 'last_name', 'age', 'gender', 'phone')
+    ALIASES = {
+        'firstname': 'first_name', 'given_name': 'first_name',
+        'lastname': 'last_name', 'surname': 'last_name', 'family_name': 'last_name',
+        'sex': 'gender', 'phone_number': 'phone', 'telephone': 'phone', 'mobile': 'phone',
+        'email_address': 'email',
+    }
+    GENDERS = {'male': 'male', 'm': 'male', 'female': 'female', 'f': 'female'}
+    MAX_AGE = 150
+
+    @classmethod
+    def import_file(cls, path, chunk_size=None, error_path=None):
+        """Import path, resuming from its checkpoint; returns the checkpoint totals"""
+        chunk_size = chunk_size or current_app.config.get('PATIENT_IMPORT_CHUNK_SIZE', 5000)
+        error_path = error_path or f"{path}.errors.csv"
+        source = cls.source_key(path)
+        checkpoint = cls._checkpoint(source)
+        skip = checkpoint['rows_done']
+        limits = {column.name: column.type.length for column in Patient.__table__.columns
+                  if column.name in cls.COLUMNS and getattr(column.type, 'length', None)}
+
+        with open(error_path, 'a' if skip else 'w', newline='', encoding='utf-8') as errors:
+            report = csv.writer(errors)
+            if not skip:
+                report.writerow(['row', *cls.COLUMNS, 'errors'])
+
+            for start, chunk in cls._chunks(cls.read_rows(path), chunk_size, skip):
+                valid, rejected = cls.validate(chunk, limits)
+                with db.engine.begin() as connection:
+                    cls._insert(connection, valid)
+                    checkpoint = cls._advance(
+                        connection, source, start + len(chunk['first_name']) - 1, len(valid), len(rejected)
+                    )
+                # Only after the commit, so a chunk that is retried is not reported twice
+                for index, reason in rejected:
+                    report.writerow([start + index, *[chunk[name][index] for name in cls.COLUMNS], reason])
+                errors.flush()
+
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(ImportCheckpoint.__table__)
+                .where(ImportCheckpoint.source == source)
+                .values(finished=True)
+            )
+        cache.invalidate('patients')
+        return dict(checkpoint, finished=True, error_report=error_path)
+
+    @classmethod
+    def read_rows(cls, path):
+        """Yield each data row as {column: str}, streaming CSV or read-only XLSX"""
+        if path.lower().endswith(('.xlsx', '.xlsm')):
+            from openpyxl import load_workbook
+            workbook = load_workbook(path, read_only=True, data_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = [cls._column(name) for name in next(rows, ())]
+                for values in rows:
+                    yield {name: cls._text(value) for name, value in zip(header, values) if name}
+            finally:
+                workbook.close()
+        else:
+            with open(path, newline='', encoding='utf-8-sig') as handle:
+                reader = csv.reader(handle)
+                header = [cls._column(name) for name in next(reader, [])]
+                for values in reader:
+                    yield {name: value.strip() for name, value in zip(header, values) if name}
+
+    @classmethod
+    def validate(cls, chunk, limits):
+        """Split a chunk of column arrays into insertable rows and (index, reason) rejections"""
+        size = len(chunk['first_name'])
+        reasons = np.full(size, '', dtype=object)
+
+        def reject(failed, message):
+            reasons[failed] += message + '; '
+
+        for name in cls.REQUIRED:
+            reject(chunk[name] == '', f"{name} is required")
+        for name, limit in limits.items():
+            reject(np.char.str_len(chunk[name].astype(str)) > limit, f"{name} longer than {limit}")
+
+        gender = np.char.lower(chunk['gender'].astype(str))
+        known = np.isin(gender, list(cls.GENDERS))
+        reject((chunk['gender'] != '') & ~known, "gender must be male or female")
+
+        age_text = chunk['age'].astype(str)
+        numeric = np.char.isdigit(age_text) & (np.char.str_len(age_text) <= 3)
+        ages = np.where(numeric, age_text, '0').astype(np.int64)
+        reject((chunk['age'] != '') & ~(numeric & (ages <= cls.MAX_AGE)), f"age must be a whole number 0-{cls.MAX_AGE}")
+
+        email = chunk['email'].astype(str)
+        reject((chunk['email'] != '') & (np.char.find(email, '@') < 1), "email is not valid")
+
+        ok = reasons == ''
+        genders = np.array([cls.GENDERS.get(value, value) for value in gender[ok]], dtype=object)
+        columns = {name: chunk[name][ok] for name in cls.COLUMNS}
+        columns.update(age=ages[ok], gender=genders)
+        valid = [
+            {name: (columns[name][i] if columns[name][i] != '' else None) for name in cls.COLUMNS}
+            for i in range(int(ok.sum()))
+        ]
+        for row in valid:
+            row['age'] = int(row['age'])
+        rejected = [(int(i), reasons[i].rstrip('; ')) for i in np.flatnonzero(~ok)]
+        return valid, rejected
+
+    @staticmethod
+    def source_key(path):
+        """Identifies a source file by name, size and a digest of its first 1 MB"""
+        with open(path, 'rb') as handle:
+            digest = hashlib.sha1(handle.read(1024 * 1024)).hexdigest()
+        return f"{os.path.basename(path)[:180]}:{os.path.getsize(path)}:{digest}"
+
+    @staticmethod
+    def progress(limit=20):
+        """Most recently updated import checkpoints"""
+        return ImportCheckpoint.query.order_by(ImportCheckpoint.updated_at.desc()).limit(limit).all()
+
+    @classmethod
+    def _chunks(cls, rows, size, skip):
+        """Yield (first row number, {column: ndarray}) per chunk, after skipping skip rows"""
+        batch, number, start = [], 0, skip + 1
+        for row in rows:
+            number += 1
+            if number <= skip:
+                continue
+            batch.append(row)
+            if len(batch) == size:
+                yield start, cls._columns(batch)
+                batch, start = [], number + 1
+        if batch:
+            yield start, cls._columns(batch)
+
+    @classmethod
+    def _columns(cls, batch):
+        return {name: np.array([row.get(name) or '' for row in batch], dtype=object) for name in cls.COLUMNS}
+
+    @staticmethod
+    def _insert(connection, rows):
+        if not rows:
+            return
+        now = datetime.now()
+        last = SequenceService.reserve(connection, 'patient', SequenceService.period(now), len(rows), now=now)
+        prefix = SequenceService.prefix('patient', now)
+        created = datetime.now(timezone.utc)
+        for seq, row in enumerate(rows, start=last - len(rows) + 1):
+            row.update(
+                patient_id=f"{prefix}{seq:04d}", public_id=str(uuid.uuid4()),
+                created_at=created, updated_at=created,
+            )
+        connection.execute(insert(Patient.__table__), rows)
+
+        patients = Patient.__table__.c
+        PatientSearchService.index_rows(connection, connection.execute(
+            select(patients.id, patients.patient_id, patients.first_name, patients.last_name, patients.phone)
+            .where(patients.patient_id.in_([row['patient_id'] for row in rows]))
+        ).all())
+
+    @staticmethod
+    def _checkpoint(source):
+        with db.engine.begin() as connection:
+            table = ImportCheckpoint.__table__
+            insert_ignore(connection, table, {
+                'source': source, 'rows_done': 0, 'imported': 0, 'rejected': 0, 'finished': False,
+            })
+            row = connection.execute(select(table).where(table.c.source == source)).mappings().one()
+        return dict(row)
+
+    @staticmethod
+    def _advance(connection, source, rows_done, imported, rejected):
+        table = ImportCheckpoint.__table__
+        connection.execute(
+            update(table).where(table.c.source == source).values(
+                rows_done=rows_done,
+                imported=table.c.imported + imported,
+                rejected=table.c.rejected + rejected,
+                updated_at=datetime.now(timezone.utc),
+            )
+        )
+        return dict(connection.execute(select(table).where(table.c.source == source)).mappings().one())
+
+    @classmethod
+    def _column(cls, name):
+        name = str(name or '').strip().lower().replace(' ', '_').replace('-', '_')
+        return cls.ALIASES.get(name, name)
+
+    @staticmethod
+    def _text(value):
+        if value is None:
+            return ''
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value).strip()
@@ -0,0 +1,61 @@
+from sqlalchemy import func, select
+from sqlalchemy.orm import with_expression
+
+from application.models.models import Drug, Invoice, Patient, Prescription, PrescriptionDrug, Visit, db
+
+
+class InvoiceService:
+    @staticmethod
+    def with_balances(query):
+        """Load amount_paid (and so balance_due) in query's own SELECT"""
+        return query.options(with_expression(Invoice.paid_total, Invoice.amount_paid.expression))
+
+    @staticmethod
+    def outstanding(query=None):
+        """query (default: every invoice) narrowed to invoices with money still owed"""
+        query = Invoice.query if query is None else query
+        return query.filter(Invoice.status != 'cancelled', Invoice.balance_due > 0)
+
+    @staticmethod
+    def assemble(visit_id):
+        """Visit, patient, invoice, drug line items and totals in one round trip.
+
+        Returns None if the visit does not exist.
+        """
+        line_total = PrescriptionDrug.quantity * Drug.unit_price
+        rows = db.session.execute(
+            select(
+                Visit, Patient, Invoice,
+                Drug.name, PrescriptionDrug.dosage, PrescriptionDrug.quantity, Drug.unit_price,
+                line_total.label('subtotal'),
+                func.coalesce(func.sum(line_total).over(), 0).label('drug_total'),
+            )
+            .join(Visit.patient)
+            .outerjoin(Visit.invoice)
+            .outerjoin(Prescription, Prescription.visit_id == Visit.id)
+            .outerjoin(PrescriptionDrug, PrescriptionDrug.prescription_id == Prescription.id)
+            .outerjoin(Drug, Drug.id == PrescriptionDrug.drug_id)
+            .where(Visit.id == visit_id)
+            .order_by(PrescriptionDrug.id)
+        ).all()
+        if not rows:
+            return None
+
+        visit, patient, invoice = rows[0][:3]
+        drug_items = [{
+            'drug': row.name,
+            'dosage': row.dosage,
+            'quantity': row.quantity,
+            'unit_price': row.unit_price,
+            'subtotal': row.subtotal,
+        } for row in rows if row.name is not None]
+        drug_total = rows[0].drug_total
+        fees = (invoice.professional_fee or 0) + (invoice.sundries or 0) if invoice else 0
+        return {
+            'visit': visit,
+            'patient': patient,
+            'invoice': invoice,
+            'drug_items': drug_items,
+            'drug_total': drug_total,
+            'total': drug_total + fees,
+        }
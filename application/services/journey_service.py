@@ -0,0 +1,151 @@
+import zlib
+
+from flask import current_app
+from sqlalchemy import exists, select
+
+from application.extensions import cache, db
+from application.models.models import Invoice, Patient, Prescription, Triage, Visit
+
+# Workflow stages in the order the front desk works through them
+STAGES = ('visit', 'triage', 'prescription', 'invoice', 'done')
+STEPS = ('triage', 'prescription', 'invoice')
+
+# Entries are versioned by one of this many cache tags per kind, and every
+# workflow commit also bumps JOURNEY_TAG
+STRIPES = 1024
+JOURNEY_TAG = 'journey'
+
+
+class JourneyService:
+    """Where a patient is in the visit -> triage -> prescription -> invoice workflow.
+
+    A miss resolves the patient, their newest in-progress visit and whether
+    that visit has triage, a prescription and an invoice in one query. The
+    answer is kept in the result cache as two small entries: the patient's
+    open visit (journey:patient:<KMC ID>) and that visit's completed steps
+    (journey:visit:<id>). Workflow writes do not bump a table-wide tag;
+    the listeners in models.py queue their visit here and, once the
+    session commits, a new step is marked done on the cached visit and
+    anything that moves the open visit drops the patient's entry. With
+    CACHE_BACKEND='sqlite' every worker on the host sees the same state.
+
+    Entries are versioned rather than deleted: each is stored against a
+    striped tag (journey:visit:<n>, journey:patient:<n>) that every commit
+    touching it bumps, and a lookup caches nothing if any workflow commit
+    was applied while its query ran. So an answer read before a commit
+    landed can never be cached after it.
+    """
+
+    @classmethod
+    def resolve(cls, patient_id):
+        """State of the patient with KMC ID patient_id, or None if there is no such patient"""
+        ttl = current_app.config.get('JOURNEY_STATE_TTL', 600)
+        patient = cache.get(cls._patient_key(patient_id))
+        if patient is not None:
+            patient_pk, visit_pk, visit_code = patient
+            steps = cache.get(cls._visit_key(visit_pk)) if visit_pk else {}
+            if steps is not None:
+                return cls._state(patient_id, patient_pk, visit_pk, visit_code, steps)
+
+        # A commit that lands while the query runs bumps JOURNEY_TAG, and the answer
+        # is then returned without being cached
+        started = cache.backend.tag_versions([JOURNEY_TAG, cls._patient_tag(patient_id)])
+        row = db.session.execute(cls.state_query(patient_id)).first()
+        if row is None:
+            return None
+        patient_pk, visit_pk, visit_code, *done = row
+        steps = dict(zip(STEPS, map(bool, done))) if visit_pk else {}
+        visit_versions = cache.backend.tag_versions([cls._visit_tag(visit_pk)]) if visit_pk else {}
+        if cache.backend.tag_versions([JOURNEY_TAG])[JOURNEY_TAG] == started[JOURNEY_TAG]:
+            if visit_pk:
+                cache.set(cls._visit_key(visit_pk), steps, ttl, versions=visit_versions)
+            patient_tag = cls._patient_tag(patient_id)
+            cache.set(cls._patient_key(patient_id), (patient_pk, visit_pk, visit_code), ttl,
+                      versions={patient_tag: started[patient_tag]})
+        return cls._state(patient_id, patient_pk, visit_pk, visit_code, steps)
+
+    @staticmethod
+    def state_query(patient_id):
+        """(patient pk, open visit pk, visit code, has triage, has prescription, has invoice)"""
+        open_visit = (
+            select(Visit.id)
+            .where(Visit.patient_id == Patient.id, Visit.status == 'in-progress')
+            .order_by(Visit.visit_date.desc())
+            .limit(1)
+            .correlate(Patient)
+            .scalar_subquery()
+        )
+        return (
+            select(
+                Patient.id, Visit.id, Visit.visit_id,
+                exists().where(Triage.visit_id == Visit.id),
+                exists().where(Prescription.visit_id == Visit.id),
+                exists().where(Invoice.visit_id == Visit.id),
+            )
+            .select_from(Patient)
+            .outerjoin(Visit, Visit.id == open_visit)
+            .where(Patient.patient_id == patient_id)
+        )
+
+    @staticmethod
+    def _state(patient_id, patient_pk, visit_pk, visit_code, steps):
+        if not visit_pk:
+            stage = 'visit'
+        else:
+            stage = next((step for step in STEPS if not steps.get(step)), 'done')
+        return {
+            'patient_id': patient_id,
+            'patient': patient_pk,
+            'visit': visit_pk,
+            'visit_id': visit_code,
+            'steps': {step: bool(steps.get(step)) for step in STEPS},
+            'stage': stage,
+        }
+
+    # ORM integration: the models.py listeners queue changes per commit
+
+    @staticmethod
+    def step_done(session, visit_pk, step):
+        """A step was added to visit_pk; mark it on the cached state after commit"""
+        if visit_pk:
+            session.info.setdefault('journey_changes', []).append((visit_pk, step, None))
+
+    @staticmethod
+    def visit_changed(session, visit_pk=None, patient_id=None):
+        """Forget visit_pk's steps and/or patient_id's open visit after commit"""
+        session.info.setdefault('journey_changes', []).append((visit_pk, None, patient_id))
+
+    @classmethod
+    def apply(cls, session):
+        changes = session.info.pop('journey_changes', None)
+        if not changes:
+            return
+        ttl = current_app.config.get('JOURNEY_STATE_TTL', 600)
+        for visit_pk, step, patient_id in changes:
+            if patient_id:
+                cache.invalidate(JOURNEY_TAG, cls._patient_tag(patient_id))
+            if not visit_pk:
+                continue
+            tag = cls._visit_tag(visit_pk)
+            before = cache.backend.tag_versions([tag])[tag]
+            steps = cache.get(cls._visit_key(visit_pk)) if step else None
+            cache.invalidate(JOURNEY_TAG, tag)
+            if steps is not None and not steps.get(step):
+                # Stored at the version this bump produced; a concurrent commit's bump leaves it stale
+                cache.set(cls._visit_key(visit_pk), dict(steps, **{step: True}), ttl, versions={tag: before + 1})
+
+    @staticmethod
+    def _patient_key(patient_id):
+        return f"journey:patient:{patient_id}"
+
+    @staticmethod
+    def _visit_key(visit_pk):
+        return f"journey:visit:{visit_pk}"
+
+    @staticmethod
+    def _patient_tag(patient_id):
+        return f"journey:patient:{zlib.crc32(patient_id.encode()) % STRIPES}"
+
+    @staticmethod
+    def _visit_tag(visit_pk):
+        return f"journey:visit:{visit_pk % STRIPES}"
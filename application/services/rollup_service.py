@@ -0,0 +1,214 @@
+from collections import defaultdict
+
+from sqlalchemy import bindparam, delete, func, inspect, select, update
+
+from application.extensions import db, insert_ignore, router
+from application.models.models import Invoice, MonthlyRollup, PatientActivity, Prescription, Visit
+
+ALL_TIME = 'all'
+
+
+class RollupService:
+    """Maintains monthly_rollups so the dashboard never scans its source tables.
+
+    Every tracked row contributes to the rollup of its own month and to the
+    ALL_TIME row. Visits also keep a per (period, patient) count in
+    patient_activity, which is how active_patients stays a distinct count.
+    ORM writes are queued by the listeners in models.py and applied in one
+    batch per flush, so a flush of many visits costs a few statements per
+    month touched rather than several per visit.
+    """
+
+    # model -> (date attribute, rollup column, amount attribute or None to count rows)
+    TRACKED = {
+        Visit: ('visit_date', 'visit_count', None),
+        Prescription: ('start_date', 'prescription_count', None),
+        Invoice: ('invoice_date', 'invoice_total', 'total_amount'),
+    }
+
+    @classmethod
+    def apply(cls, connection, changes):
+        """Apply (model, period, amount, patient_id, sign) contributions as one batch"""
+        totals = defaultdict(lambda: defaultdict(int))  # period -> rollup column -> change
+        visits = defaultdict(int)  # (period, patient_id) -> change in visit count
+        for model, period, amount, patient_id, sign in changes:
+            column = cls.TRACKED[model][1]
+            for key in (period, ALL_TIME):
+                totals[key][column] += sign * amount
+                if patient_id is not None:
+                    visits[key, patient_id] += sign
+        for key, active in cls._track_patients(connection, visits).items():
+            totals[key]['active_patients'] += active
+
+        for key, columns in totals.items():
+            values = {
+                column: getattr(MonthlyRollup, column) + change for column, change in columns.items() if change
+            }
+            if values:
+                cls._upsert(connection, MonthlyRollup.__table__, {'period': key}, values)
+
+    @classmethod
+    @router.read_only()
+    def dashboard(cls, since):
+        """Monthly rollup rows from since's month onwards, plus the all-time row"""
+        months = (
+            MonthlyRollup.query
+            .filter(MonthlyRollup.period >= since.strftime('%Y-%m'), MonthlyRollup.period != ALL_TIME)
+            .order_by(MonthlyRollup.period)
+            .all()
+        )
+        return months, db.session.get(MonthlyRollup, ALL_TIME)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every rollup from the source tables"""
+        rollups, activity = MonthlyRollup.__table__, PatientActivity.__table__
+        totals = {}
+
+        def row(period):
+            return totals.setdefault(period, {
+                'period': period, 'visit_count': 0, 'prescription_count': 0,
+                'invoice_total': 0, 'active_patients': 0,
+            })
+
+        with db.engine.begin() as connection:
+            connection.execute(delete(activity))
+            connection.execute(delete(rollups))
+
+            month = cls._month(connection, Visit.visit_date)
+            per_month = connection.execute(
+                select(month, Visit.patient_id, func.count()).group_by(month, Visit.patient_id)
+            ).all()
+            per_patient = connection.execute(
+                select(Visit.patient_id, func.count()).group_by(Visit.patient_id)
+            ).all()
+            activity_rows = [
+                {'period': period, 'patient_id': patient_id, 'visit_count': count}
+                for period, patient_id, count in per_month
+            ] + [
+                {'period': ALL_TIME, 'patient_id': patient_id, 'visit_count': count}
+                for patient_id, count in per_patient
+            ]
+            if activity_rows:
+                connection.execute(activity.insert(), activity_rows)
+
+            for period, patients, visits in connection.execute(
+                select(activity.c.period, func.count(), func.sum(activity.c.visit_count))
+                .group_by(activity.c.period)
+            ):
+                row(period).update(active_patients=patients, visit_count=visits)
+
+            for model, (date_attr, column, amount_attr) in cls.TRACKED.items():
+                if model is Visit:
+                    continue
+                month = cls._month(connection, getattr(model, date_attr))
+                value = func.sum(getattr(model, amount_attr)) if amount_attr else func.count()
+                for period, total in connection.execute(
+                    select(month, value).where(month.is_not(None)).group_by(month)
+                ):
+                    row(period)[column] += total or 0
+                    row(ALL_TIME)[column] += total or 0
+
+            if totals:
+                connection.execute(rollups.insert(), list(totals.values()))
+        return len(totals)
+
+    @classmethod
+    def _contribution(cls, target, committed=False):
+        """(period, amount, patient_id) that target adds to the rollups, or None"""
+        date_attr, _, amount_attr = cls.TRACKED[type(target)]
+
+        def value(name):
+            if committed:
+                history = inspect(target).attrs[name].history
+                if history.deleted:
+                    return history.deleted[0]
+            return getattr(target, name)
+
+        when = value(date_attr)
+        if when is None:
+            return None
+        amount = (value(amount_attr) or 0) if amount_attr else 1
+        patient_id = value('patient_id') if type(target) is Visit else None
+        return when.strftime('%Y-%m'), amount, patient_id
+
+    @staticmethod
+    def _track_patients(connection, visits):
+        """Apply {(period, patient_id): change} to patient_activity.
+
+        Returns {period: change in active patients}, counting patients whose
+        visit count rose from zero or fell to it; rows left at zero are deleted.
+        """
+        table = PatientActivity.__table__
+        visits = {key: change for key, change in visits.items() if change}
+        if not visits:
+            return {}
+        added = [{'period': period, 'patient_id': patient_id, 'visit_count': 0}
+                 for (period, patient_id), change in visits.items() if change > 0]
+        if added:
+            insert_ignore(connection, table, added)
+        match = (table.c.period == bindparam('key_period'), table.c.patient_id == bindparam('key_patient'))
+        connection.execute(
+            update(table).where(*match).values(visit_count=table.c.visit_count + bindparam('change')),
+            [{'key_period': period, 'key_patient': patient_id, 'change': change}
+             for (period, patient_id), change in visits.items()],
+        )
+
+        by_period = defaultdict(list)
+        for period, patient_id in visits:
+            by_period[period].append(patient_id)
+        active, emptied = defaultdict(int), []
+        for period, patient_ids in by_period.items():
+            for start in range(0, len(patient_ids), 500):
+                for patient_id, count in connection.execute(
+                    select(table.c.patient_id, table.c.visit_count)
+                    .where(table.c.period == period, table.c.patient_id.in_(patient_ids[start:start + 500]))
+                ):
+                    before = count - visits[period, patient_id]
+                    active[period] += (count > 0) - (before > 0)
+                    if count <= 0:
+                        emptied.append({'key_period': period, 'key_patient': patient_id})
+        if emptied:
+            connection.execute(delete(table).where(*match), emptied)
+        return active
+
+    # ORM integration: the models.py listeners queue contributions per flush
+
+    @classmethod
+    def queue(cls, session, target, operation):
+        """Record how an ORM insert, update or delete moves target's contribution"""
+        old = cls._contribution(target, committed=True) if operation != 'insert' else None
+        new = cls._contribution(target) if operation != 'delete' else None
+        if old == new:
+            return
+        queued = session.info.setdefault('rollup_changes', [])
+        if old:
+            queued.append((type(target), *old, -1))
+        if new:
+            queued.append((type(target), *new, 1))
+
+    @classmethod
+    def flush(cls, session):
+        """Apply the contributions queued during this flush as one batch"""
+        queued = session.info.pop('rollup_changes', None)
+        if queued:
+            cls.apply(session.connection(), queued)
+
+    @staticmethod
+    def _upsert(connection, table, keys, changes, returning=None):
+        """Apply changes to the row at keys, creating a zeroed row first if needed"""
+        condition = [table.c[name] == value for name, value in keys.items()]
+        bump = update(table).where(*condition).values(changes)
+        if connection.execute(bump).rowcount == 0:
+            insert_ignore(connection, table, keys)
+            connection.execute(bump)
+        if returning is not None:
+            return connection.execute(select(returning).where(*condition)).scalar_one()
+
+    @staticmethod
+    def _month(connection, column):
+        if connection.dialect.name == 'postgresql':
+            return func.to_char(column, 'YYYY-MM')
+        if connection.dialect.name == 'mysql':
+            return func.date_format(column, '%Y-%m')
+        return func.strftime('%Y-%m', column)
@@ -0,0 +1,153 @@
+import re
+
+from flask import current_app
+from sqlalchemy import Integer, and_, false, or_, select, text
+
+from application.extensions import db
+from application.models.models import Patient
+
+
+class PatientSearchService:
+    """Patient lookup backed by the patient_search FTS5 table.
+
+    The index holds the KMC patient ID, the full name and the phone number
+    reduced to its national significant digits, so "+256 772 123456",
+    "0772123456" and "772 123" all find the same patient. Rows are kept in
+    step by the Patient ORM listeners; bulk Core writes should call
+    rebuild() afterwards. On databases without FTS5 every lookup falls back
+    to LIKE.
+    """
+
+    TABLE = 'patient_search'
+    # bm25 weights for patient_id, name, phone
+    WEIGHTS = (10.0, 5.0, 3.0)
+
+    @staticmethod
+    def available(connection=None):
+        connection = connection or db.session.connection()
+        return connection.dialect.name == 'sqlite'
+
+    @classmethod
+    def ensure_index(cls, connection):
+        """Create the FTS table if missing and backfill it; return True if created"""
+        if not cls.available(connection):
+            return False
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': cls.TABLE}
+        ).first()
+        if exists:
+            return False
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {cls.TABLE} USING fts5("
+            "patient_id, name, phone, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+        ))
+        cls.rebuild(connection)
+        return True
+
+    @classmethod
+    def rebuild(cls, connection):
+        """Re-index every patient; returns the number of rows indexed"""
+        connection.execute(text(f"DELETE FROM {cls.TABLE}"))
+        rows = connection.execute(text(
+            "SELECT id, patient_id, first_name, last_name, phone FROM patients"
+        )).all()
+        cls.index_rows(connection, rows)
+        return len(rows)
+
+    @classmethod
+    def index_rows(cls, connection, rows):
+        """Index new (id, patient_id, first_name, last_name, phone) rows, e.g. after a Core bulk insert"""
+        if rows and cls.available(connection):
+            connection.execute(
+                text(f"INSERT INTO {cls.TABLE} (rowid, patient_id, name, phone) VALUES (:id, :patient_id, :name, :phone)"),
+                [cls._document(*row) for row in rows],
+            )
+
+    @classmethod
+    def index_patient(cls, connection, patient):
+        if not cls.available(connection):
+            return
+        cls.remove_patient(connection, patient)
+        connection.execute(
+            text(f"INSERT INTO {cls.TABLE} (rowid, patient_id, name, phone) VALUES (:id, :patient_id, :name, :phone)"),
+            cls._document(patient.id, patient.patient_id, patient.first_name, patient.last_name, patient.phone),
+        )
+
+    @classmethod
+    def remove_patient(cls, connection, patient):
+        if cls.available(connection):
+            connection.execute(text(f"DELETE FROM {cls.TABLE} WHERE rowid = :id"), {'id': patient.id})
+
+    @classmethod
+    def search(cls, term, limit=10):
+        """Patients matching every word of term, best match first"""
+        ids = [row.id for row in db.session.execute(cls.matching_ids(term, ranked=True, limit=limit))]
+        patients = {patient.id: patient for patient in Patient.query.filter(Patient.id.in_(ids))}
+        return [patients[id] for id in ids if id in patients]
+
+    @classmethod
+    def filter_condition(cls, term):
+        """WHERE clause restricting a Patient query to term's matches"""
+        if not cls.available():
+            return cls._like_condition(term)
+        return Patient.id.in_(cls.matching_ids(term))
+
+    @classmethod
+    def matching_ids(cls, term, ranked=False, limit=None, offset=None):
+        """SELECT of the ids of patients matching term, optionally by relevance"""
+        query = cls.match_expression(term)
+        if not query:
+            return select(Patient.id).where(false())
+        if not cls.available():
+            statement = select(Patient.id).where(cls._like_condition(term)).order_by(Patient.last_name, Patient.first_name)
+            return statement.limit(limit).offset(offset)
+
+        sql = f"SELECT rowid AS id FROM {cls.TABLE} WHERE {cls.TABLE} MATCH :query"
+        params = {'query': query}
+        if ranked:
+            sql += f" ORDER BY bm25({cls.TABLE}, {', '.join(str(weight) for weight in cls.WEIGHTS)})"
+        if limit or offset:
+            sql += " LIMIT :limit OFFSET :offset"
+            params.update(limit=limit or -1, offset=offset or 0)
+        return text(sql).bindparams(**params).columns(id=Integer)
+
+    @classmethod
+    def match_expression(cls, term):
+        """FTS5 query requiring every word of term as a prefix"""
+        clauses = []
+        # "0772 123 456" is one phone number, not three words
+        term = re.sub(r'(?<=\d)\s+(?=\d)', '', term or '')
+        for word in re.findall(r'[\w+()\-]+', term):
+            variants = {word.strip('+()-').lower()}
+            phone = cls.normalize_phone(word) if re.fullmatch(r'[\d+()\-]+', word) else ''
+            if len(phone) >= 3:
+                variants.add(phone)
+            variants = [v for v in variants if v]
+            if variants:
+                clauses.append('(' + ' OR '.join(f'"{variant}"*' for variant in sorted(variants)) + ')')
+        return ' AND '.join(clauses)
+
+    @staticmethod
+    def normalize_phone(phone):
+        """National significant digits: drops formatting, the country code and the trunk 0"""
+        digits = re.sub(r'\D', '', phone or '')
+        country_code = current_app.config.get('PHONE_COUNTRY_CODE', '')
+        if country_code and digits.startswith(country_code) and len(digits) > len(country_code) + 6:
+            digits = digits[len(country_code):]
+        return digits.lstrip('0')
+
+    @classmethod
+    def _document(cls, id, patient_id, first_name, last_name, phone):
+        return {
+            'id': id,
+            'patient_id': patient_id or '',
+            'name': f"{first_name or ''} {last_name or ''}".strip(),
+            'phone': cls.normalize_phone(phone),
+        }
+
+    @staticmethod
+    def _like_condition(term):
+        words = (term or '').split()
+        columns = (Patient.patient_id, Patient.first_name, Patient.last_name, Patient.phone)
+        return and_(*[or_(*[column.ilike(f"%{word}%") for column in columns]) for word in words])
+
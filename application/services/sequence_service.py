@@ -0,0 +1,107 @@
+from datetime import datetime
+import threading
+
+from flask import current_app
+from sqlalchemy import cast, select, update, func
+
+from application.extensions import db, insert_ignore
+from application.models.models import IdSequence
+
+
+class SequenceService:
+    """Allocates KMC-... identifiers from the id_sequences counter table.
+
+    Each (entity, period) pair owns one counter row that is bumped with a
+    single UPDATE, so allocation never sorts the entity table and two
+    writers can never read the same value. Counters restart every month
+    because the month is part of the identifier.
+    """
+
+    # entity -> (table, column, prefix format)
+    ENTITIES = {
+        'patient': ('patients', 'patient_id', 'KMC-{month:02d}-{year}-'),
+        'doctor': ('doctors', 'doctor_id', 'KMC-DOC-{month:02d}-{year}-'),
+        'visit': ('visits', 'visit_id', 'KMC-VIS-{month:02d}{year}/'),
+    }
+
+    _blocks = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def prefix(cls, entity, now=None):
+        now = now or datetime.now()
+        return cls.ENTITIES[entity][2].format(month=now.month, year=now.year)
+
+    @staticmethod
+    def period(now=None):
+        return (now or datetime.now()).strftime('%Y-%m')
+
+    @classmethod
+    def next_id(cls, connection, entity, now=None):
+        """Return the next identifier for entity.
+
+        With ID_SEQUENCE_BLOCK_SIZE > 1 the value comes from an in-process
+        block reserved in its own transaction (server databases only, see
+        init_db); otherwise the counter is bumped on the caller's
+        connection, inside the insert transaction.
+        """
+        now = now or datetime.now()
+        block_size = current_app.config.get('ID_SEQUENCE_BLOCK_SIZE', 1)
+        if block_size > 1:
+            seq = cls._next_from_block(entity, now, block_size)
+        else:
+            seq = cls.reserve(connection, entity, cls.period(now), 1, now=now)
+        return f"{cls.prefix(entity, now)}{seq:04d}"
+
+    @classmethod
+    def reserve(cls, connection, entity, period, count, now=None):
+        """Atomically advance the (entity, period) counter by count.
+
+        Returns the last value of the reserved range.
+        """
+        table = IdSequence.__table__
+        bump = (
+            update(table)
+            .where(table.c.entity == entity, table.c.period == period)
+            .values(last_value=table.c.last_value + count)
+        )
+        if connection.execute(bump).rowcount == 0:
+            seed = cls._existing_max(connection, entity, now or datetime.now())
+            insert_ignore(connection, table, {'entity': entity, 'period': period, 'last_value': seed})
+            connection.execute(bump)
+
+        return connection.execute(
+            select(table.c.last_value)
+            .where(table.c.entity == entity, table.c.period == period)
+        ).scalar_one()
+
+    @classmethod
+    def _next_from_block(cls, entity, now, block_size):
+        key = (entity, cls.period(now))
+        with cls._lock:
+            block = cls._blocks.get(key)
+            if not block or block[0] > block[1]:
+                with db.engine.begin() as connection:
+                    last = cls.reserve(connection, entity, key[1], block_size, now=now)
+                block = cls._blocks[key] = [last - block_size + 1, last]
+            seq = block[0]
+            block[0] += 1
+            return seq
+
+    @classmethod
+    def _existing_max(cls, connection, entity, now):
+        """Highest sequence already issued this period, for the first counter row.
+
+        Only runs once per entity and month, so databases that predate the
+        counter table keep issuing IDs after their existing ones.
+        """
+        table_name, column_name, _ = cls.ENTITIES[entity]
+        table = db.metadata.tables[table_name]
+        column = table.c[column_name]
+        prefix = cls.prefix(entity, now)
+        result = connection.execute(
+            select(func.max(cast(func.substr(column, len(prefix) + 1), db.Integer)))
+            .where(column.like(f"{prefix}%"))
+        ).scalar()
+        return result or 0
+
@@ -0,0 +1,195 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import case, func, insert, select, update
+
+from application.extensions import cache
+from application.models.models import Drug, StockMovement, StockSnapshot
+
+
+class InsufficientStock(ValueError):
+    """Raised when a reservation asks for more of a drug than is in stock"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages  # {drug_id: (requested, available)}
+        super().__init__("Insufficient stock for " + ", ".join(
+            f"drug {drug_id} ({requested} requested, {available} available)"
+            for drug_id, (requested, available) in sorted(shortages.items())
+        ))
+
+
+class StockService:
+    """Drug stock as an append-only ledger of movements.
+
+    drugs.stock is the running balance and is only ever changed by one
+    conditional UPDATE per batch (stock = stock - q WHERE stock >= q), so
+    concurrent dispensing cannot lose updates or oversell. Every change is
+    also written to stock_movements; stock_snapshots periodically fold the
+    ledger per drug so a balance is the latest snapshot plus the movements
+    after it, never a scan of the whole ledger.
+
+    ORM writes to prescription drugs and to Drug.stock are picked up by the
+    listeners in models.py and applied in one batch per flush.
+    """
+
+    REASONS = ('receipt', 'dispense', 'return', 'adjustment')
+
+    @classmethod
+    def reserve(cls, connection, items, prescription_id=None):
+        """Take [(drug_id, quantity), ...] out of stock in one UPDATE, all or nothing.
+
+        Raises InsufficientStock if any drug is short. Other drugs in the
+        batch may already be decremented by then, so the caller's
+        transaction must roll back (a failed flush or engine.begin() does).
+        """
+        cls.apply(connection, [(drug_id, -quantity, 'dispense', prescription_id, None) for drug_id, quantity in items])
+
+    @classmethod
+    def release(cls, connection, items, prescription_id=None):
+        """Put [(drug_id, quantity), ...] back into stock, e.g. for a cancelled prescription"""
+        cls.apply(connection, [(drug_id, quantity, 'return', prescription_id, None) for drug_id, quantity in items])
+
+    @classmethod
+    def receive(cls, connection, drug_id, quantity, note=None):
+        """Book a delivery of quantity units into stock"""
+        cls.apply(connection, [(drug_id, quantity, 'receipt', None, note)])
+
+    @classmethod
+    def apply(cls, connection, movements, applied=False):
+        """Update drugs.stock and append the ledger rows for a batch of movements.
+
+        movements are (drug_id, quantity, reason, prescription_id, note)
+        tuples with signed quantities. With applied=True drugs.stock already
+        holds the change (an edit through the ORM) and only the ledger is
+        written.
+        """
+        movements = [movement for movement in movements if movement[1]]
+        if not movements:
+            return
+        if not applied:
+            change = defaultdict(int)
+            for drug_id, quantity, *_ in movements:
+                change[drug_id] += quantity
+            cls._update_stock(connection, {drug_id: q for drug_id, q in change.items() if q})
+
+        now = datetime.now(timezone.utc)
+        connection.execute(insert(StockMovement.__table__), [{
+            'drug_id': drug_id, 'quantity': quantity, 'reason': reason,
+            'prescription_id': prescription_id, 'note': note, 'created_at': now,
+        } for drug_id, quantity, reason, prescription_id, note in movements])
+
+    @staticmethod
+    def _update_stock(connection, change):
+        """stock += change[id] for every drug, failing if any would go negative"""
+        if not change:
+            return
+        drugs = Drug.__table__
+        ids = list(change)
+        delta = case(change, value=drugs.c.id)
+        stock = func.coalesce(drugs.c.stock, 0)
+        result = connection.execute(
+            update(drugs)
+            .where(drugs.c.id.in_(ids), stock + delta >= 0)
+            .values(stock=stock + delta)
+        )
+        if result.rowcount != len(ids):
+            available = dict(connection.execute(select(drugs.c.id, drugs.c.stock).where(drugs.c.id.in_(ids))).all())
+            raise InsufficientStock({
+                drug_id: (-quantity, available.get(drug_id) or 0)
+                for drug_id, quantity in change.items()
+                if (available.get(drug_id) or 0) + quantity < 0
+            })
+
+    @staticmethod
+    def snapshot(connection):
+        """Fold each drug's movements since its last snapshot into a new one; returns drugs snapshotted"""
+        latest = StockService._latest_snapshots()
+        movements = StockMovement.__table__.c
+        rows = connection.execute(
+            select(
+                movements.drug_id,
+                func.max(movements.id),
+                func.coalesce(func.max(latest.c.stock), 0) + func.sum(movements.quantity),
+            )
+            .select_from(StockMovement.__table__)
+            .outerjoin(latest, latest.c.drug_id == movements.drug_id)
+            .where(movements.id > func.coalesce(latest.c.movement_id, 0))
+            .group_by(movements.drug_id)
+        ).all()
+        if rows:
+            now = datetime.now(timezone.utc)
+            connection.execute(insert(StockSnapshot.__table__), [
+                {'drug_id': drug_id, 'movement_id': movement_id, 'stock': stock, 'taken_at': now}
+                for drug_id, movement_id, stock in rows
+            ])
+        return len(rows)
+
+    @staticmethod
+    def balances(connection, drug_ids=None):
+        """{drug_id: stock} from the ledger: latest snapshot plus the movements after it"""
+        latest = StockService._latest_snapshots()
+        drugs = Drug.__table__.c
+        movements = StockMovement.__table__.c
+        since = (
+            select(func.coalesce(func.sum(movements.quantity), 0))
+            .where(movements.drug_id == drugs.id, movements.id > func.coalesce(latest.c.movement_id, 0))
+            .scalar_subquery()
+        )
+        query = (
+            select(drugs.id, func.coalesce(latest.c.stock, 0) + since)
+            .select_from(Drug.__table__)
+            .outerjoin(latest, latest.c.drug_id == drugs.id)
+        )
+        if drug_ids is not None:
+            query = query.where(drugs.id.in_(list(drug_ids)))
+        return dict(connection.execute(query).all())
+
+    @classmethod
+    def discrepancies(cls, connection):
+        """{drug_id: (drugs.stock, ledger balance)} wherever the two disagree"""
+        drugs = Drug.__table__.c
+        stock = dict(connection.execute(select(drugs.id, func.coalesce(drugs.stock, 0))).all())
+        return {
+            drug_id: (stock[drug_id], balance)
+            for drug_id, balance in cls.balances(connection).items()
+            if stock.get(drug_id) != balance
+        }
+
+    @staticmethod
+    def _latest_snapshots():
+        snapshots = StockSnapshot.__table__.c
+        newest = (
+            select(snapshots.drug_id, func.max(snapshots.movement_id).label('movement_id'))
+            .group_by(snapshots.drug_id)
+            .subquery()
+        )
+        return (
+            select(snapshots.drug_id, snapshots.movement_id, snapshots.stock)
+            .join(newest, (newest.c.drug_id == snapshots.drug_id) & (newest.c.movement_id == snapshots.movement_id))
+            .subquery('latest_snapshot')
+        )
+
+    # ORM integration: the models.py listeners queue movements per flush
+
+    @staticmethod
+    def queue(session, drug_id, quantity, reason, prescription_id=None, note=None, applied=False):
+        session.info.setdefault('stock_movements', []).append(
+            (applied, (drug_id, quantity, reason, prescription_id, note))
+        )
+
+    @classmethod
+    def flush(cls, session):
+        """Apply the movements queued during this flush as one batch"""
+        queued = session.info.pop('stock_movements', None)
+        if not queued:
+            return
+        connection = session.connection()
+        cls.apply(connection, [movement for applied, movement in queued if not applied])
+        cls.apply(connection, [movement for applied, movement in queued if applied], applied=True)
+
+        # Loaded drugs now hold a stale stock value
+        touched = {movement[0] for applied, movement in queued if not applied}
+        for drug in [obj for obj in session.identity_map.values() if isinstance(obj, Drug)]:
+            if drug.id in touched:
+                session.expire(drug, ['stock'])
+        cache.touch(session, 'drugs', 'stock_movements')
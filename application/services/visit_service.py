@@ -21,6 +21,7 @@ class VisitService:
     def update_triage(visit_id, triage_data):
         """Update or create triage record for a visit"""
         visit = Visit.query.get_or_404(visit_id)
+        systolic, diastolic = VisitService._split_blood_pressure(triage_data.get('blood_pressure'))
         
         if visit.triage:
             # Update existing triage
@@ -28,7 +29,9 @@ class VisitService:
             triage.height = triage_data.get('height', triage.height)
             triage.weight = triage_data.get('weight', triage.weight)
             triage.temperature = triage_data.get('temperature', triage.temperature)
-            triage.blood_pressure = triage_data.get('blood_pressure', triage.blood_pressure)
+            if systolic is not None:
+                triage.blood_pressure_systolic = systolic
+                triage.blood_pressure_diastolic = diastolic
             triage.pulse = triage_data.get('pulse', triage.pulse)
             triage.notes = triage_data.get('notes', triage.notes)
         else:
@@ -38,11 +41,25 @@ class VisitService:
                 height=triage_data.get('height'),
                 weight=triage_data.get('weight'),
                 temperature=triage_data.get('temperature'),
-                blood_pressure=triage_data.get('blood_pressure'),
+                blood_pressure_systolic=systolic,
+                blood_pressure_diastolic=diastolic,
                 pulse=triage_data.get('pulse'),
                 notes=triage_data.get('notes')
             )
             db.session.add(triage)
         
         db.session.commit()
-        return triage
\ No newline at end of file
+        return triage
+
+    @staticmethod
+    def _split_blood_pressure(value):
+        """(systolic, diastolic) from a '120/80' reading, (None, None) if blank"""
+        if value is not None and not isinstance(value, str):
+            raise ValueError("Blood pressure must look like 120/80")
+        if not value or not value.strip():
+            return None, None
+        systolic, _, diastolic = value.partition('/')
+        try:
+            return int(systolic), int(diastolic)
+        except ValueError:
+            raise ValueError("Blood pressure must look like 120/80")
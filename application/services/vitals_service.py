@@ -0,0 +1,278 @@
+from datetime import datetime, time as clock
+
+import numpy as np
+from sqlalchemy import String, select, type_coerce
+
+from application.extensions import cache, router
+from application.models.models import Triage, Visit
+
+# One row per triage reading, as pulled by VitalsService.load; NaN where not recorded
+ROW_DTYPE = np.dtype([
+    ('patient_id', 'i8'),
+    ('visit_id', 'i8'),
+    ('taken', 'M8[s]'),
+    ('height', 'f8'),
+    ('weight', 'f8'),
+    ('temperature', 'f8'),
+    ('systolic', 'f8'),
+    ('diastolic', 'f8'),
+    ('pulse', 'f8'),
+    ('spo2', 'f8'),
+])
+# ROW_DTYPE field -> Triage column
+COLUMNS = {
+    'height': 'height',
+    'weight': 'weight',
+    'temperature': 'temperature',
+    'systolic': 'blood_pressure_systolic',
+    'diastolic': 'blood_pressure_diastolic',
+    'pulse': 'pulse',
+    'spo2': 'oxygen_saturation',
+}
+# Fields checked against Triage.VALID_RANGES, in flag bit order
+FLAGGED = [field for field, column in COLUMNS.items() if column in Triage.VALID_RANGES]
+DISTRIBUTED = ('bmi', 'temperature', 'systolic', 'diastolic', 'pulse', 'spo2')
+PERCENTILES = (5, 25, 50, 75, 95)
+# WHO adult BMI bands and ACC/AHA blood pressure stages
+BMI_BANDS = ((18.5, 'underweight'), (25.0, 'normal'), (30.0, 'overweight'), (np.inf, 'obese'))
+BP_STAGES = ('normal', 'elevated', 'stage_1', 'stage_2')
+HISTOGRAM_BINS = {
+    'bmi': np.arange(10, 52, 2),
+    'systolic': np.arange(70, 230, 10),
+}
+
+
+class VitalsService:
+    """Triage history as NumPy columns: per-patient trends and cohort distributions.
+
+    One Core query pulls the readings (with their visit's patient and date)
+    straight into a ROW_DTYPE array; BMI, moving averages, out-of-range
+    flags and every cohort statistic are then array expressions over its
+    columns, never per-object Python. The out-of-range bounds are the ones
+    Triage's validators enforce (Triage.VALID_RANGES), so a flag marks a
+    reading that bypassed them. A patient's trend is cached under its own
+    key and forgotten when a triage write for that patient commits (see
+    the listeners in models.py); cohort reports are cached per window
+    until triage or visits change.
+    """
+
+    CHUNK_ROWS = 100000
+    MOVING_AVERAGE_READINGS = 3
+
+    @classmethod
+    def load(cls, patient_ids=None, start_date=None, end_date=None):
+        """Readings ordered by patient then time, optionally for some patients or a date window"""
+        query = (
+            select(
+                Visit.patient_id,
+                Triage.visit_id,
+                # Raw column values: NumPy parses the timestamps, NULLs become NaN
+                type_coerce(Visit.visit_date, String),
+                *(getattr(Triage, column) for column in COLUMNS.values()),
+            )
+            .join(Visit, Visit.id == Triage.visit_id)
+        )
+        if patient_ids is not None:
+            query = query.where(Visit.patient_id.in_(list(patient_ids)))
+        if start_date:
+            query = query.where(Visit.visit_date >= datetime.combine(start_date, clock.min))
+        if end_date:
+            query = query.where(Visit.visit_date <= datetime.combine(end_date, clock.max))
+
+        chunks = []
+        with router.engine.connect() as connection:
+            result = connection.execution_options(yield_per=cls.CHUNK_ROWS).execute(query)
+            for partition in result.partitions():
+                chunks.append(np.fromiter(map(tuple, partition), dtype=ROW_DTYPE, count=len(partition)))
+        rows = np.concatenate(chunks) if chunks else np.empty(0, dtype=ROW_DTYPE)
+        # Sorting here is cheaper than an ORDER BY over the join
+        return rows[np.lexsort((rows['visit_id'], rows['taken'], rows['patient_id']))]
+
+    @staticmethod
+    def bmi(rows):
+        """Same formula as Triage.bmi, NaN without both height and weight"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bmi = rows['weight'] / (rows['height'] / 100) ** 2
+        bmi[~np.isfinite(bmi)] = np.nan
+        return np.round(bmi, 1)
+
+    @staticmethod
+    def out_of_range(rows):
+        """Bit i set where FLAGGED[i] is outside Triage.VALID_RANGES"""
+        flags = np.zeros(len(rows), dtype=np.int64)
+        for bit, field in enumerate(FLAGGED):
+            low, high = Triage.VALID_RANGES[COLUMNS[field]]
+            values = rows[field]
+            # NaN compares False both ways, so missing readings are never flagged
+            flags |= ((values < low) | (values > high)).astype(np.int64) << bit
+        return flags
+
+    @staticmethod
+    def moving_average(values, readings):
+        """Mean of the recorded values among each reading and the readings-1 before it"""
+        present = ~np.isnan(values)
+        sums = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+        counts = np.concatenate(([0], np.cumsum(present)))
+        ends = np.arange(1, len(values) + 1)
+        starts = np.maximum(ends - readings, 0)
+        window = counts[ends] - counts[starts]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average = (sums[ends] - sums[starts]) / window
+        return np.where(window > 0, np.round(average, 1), np.nan)
+
+    @classmethod
+    def patient_trend(cls, patient_pk):
+        """One patient's readings, BMI trajectory and BP moving averages, cached until their triage changes"""
+        return cache.get_or_set(
+            cls.patient_key(patient_pk),
+            lambda: cls.trend(cls.load(patient_ids=[patient_pk])),
+            ttl=600,
+        )
+
+    @staticmethod
+    def patient_key(patient_pk):
+        return f"vitals:patient:{patient_pk}"
+
+    @classmethod
+    def trend(cls, rows):
+        """Series and summary for readings of a single patient, oldest first"""
+        bmi = cls.bmi(rows)
+        systolic_average = cls.moving_average(rows['systolic'], cls.MOVING_AVERAGE_READINGS)
+        diastolic_average = cls.moving_average(rows['diastolic'], cls.MOVING_AVERAGE_READINGS)
+        flags = cls.out_of_range(rows)
+
+        recorded = ~np.isnan(bmi)
+        bmi_summary = None
+        if recorded.any():
+            first, last = bmi[recorded][0], bmi[recorded][-1]
+            bmi_summary = {'first': float(first), 'last': float(last), 'change': round(float(last - first), 1),
+                           'per_year': None}
+            if recorded.sum() > 1:
+                years = (rows['taken'][recorded] - rows['taken'][recorded][0]) / np.timedelta64(1, 'D') / 365.25
+                if years[-1] > 0:
+                    bmi_summary['per_year'] = round(float(np.polyfit(years, bmi[recorded], 1)[0]), 2)
+
+        def value(array, i):
+            return None if np.isnan(array[i]) else float(array[i])
+
+        return {
+            'readings': len(rows),
+            'bmi': bmi_summary,
+            'out_of_range': {field: int(np.count_nonzero(flags & (1 << bit))) for bit, field in enumerate(FLAGGED)},
+            'series': [{
+                'visit': int(rows['visit_id'][i]),
+                'date': str(rows['taken'][i]),
+                'bmi': value(bmi, i),
+                'temperature': value(rows['temperature'], i),
+                'systolic': value(rows['systolic'], i),
+                'diastolic': value(rows['diastolic'], i),
+                'systolic_avg': value(systolic_average, i),
+                'diastolic_avg': value(diastolic_average, i),
+                'pulse': value(rows['pulse'], i),
+                'spo2': value(rows['spo2'], i),
+                'flags': [field for bit, field in enumerate(FLAGGED) if flags[i] & (1 << bit)],
+            } for i in range(len(rows))],
+        }
+
+    @classmethod
+    @router.read_only()
+    def cohort(cls, start_date=None, end_date=None):
+        """Population report for readings in the window, cached until triage or visits change"""
+        return cache.get_or_set(
+            f"vitals:cohort:{start_date}:{end_date}",
+            lambda: cls.cohort_report(cls.load(start_date=start_date, end_date=end_date)),
+            ttl=600,
+            tags=('triage', 'visits'),
+        )
+
+    @classmethod
+    def cohort_report(cls, rows):
+        """Distributions over every reading; BMI bands and BP stages on each patient's latest"""
+        if not len(rows):
+            return {'readings': 0, 'patients': 0}
+        bmi = cls.bmi(rows)
+        flags = cls.out_of_range(rows)
+        patients = rows['patient_id']
+        last = np.flatnonzero(np.append(patients[1:] != patients[:-1], True))
+
+        columns = {'bmi': bmi, **{field: rows[field] for field in DISTRIBUTED if field != 'bmi'}}
+        distributions = {}
+        for field, values in columns.items():
+            recorded = values[~np.isnan(values)]
+            distributions[field] = {
+                'count': len(recorded),
+                'mean': round(float(recorded.mean()), 1) if len(recorded) else None,
+                **{f'p{q}': round(float(value), 1) for q, value in zip(
+                    PERCENTILES, np.percentile(recorded, PERCENTILES) if len(recorded) else [np.nan] * len(PERCENTILES)
+                )},
+            }
+
+        histograms = {}
+        for field, edges in HISTOGRAM_BINS.items():
+            counts, _ = np.histogram(columns[field][~np.isnan(columns[field])], bins=edges)
+            histograms[field] = {'edges': edges.tolist(), 'counts': counts.tolist()}
+
+        return {
+            'readings': len(rows),
+            'patients': len(last),
+            'distributions': distributions,
+            'histograms': histograms,
+            'bmi_bands': cls._bmi_bands(cls._latest_recorded(bmi, patients)),
+            'bp_stages': cls._bp_stages(
+                cls._latest_recorded(rows['systolic'], patients), cls._latest_recorded(rows['diastolic'], patients),
+            ),
+            'bmi_change': cls._bmi_change(bmi, patients),
+            'out_of_range': {field: int(np.count_nonzero(flags & (1 << bit))) for bit, field in enumerate(FLAGGED)},
+        }
+
+    @staticmethod
+    def _latest_recorded(values, patients):
+        """Each patient's most recent recorded value (NaN if they have none)"""
+        recorded = ~np.isnan(values)
+        index = np.flatnonzero(recorded)
+        owners = patients[index]
+        # Positions of each patient's last recorded value, then spread back over every patient
+        last = index[np.append(owners[1:] != owners[:-1], True)]
+        ids = np.unique(patients)
+        latest = np.full(len(ids), np.nan)
+        latest[np.searchsorted(ids, patients[last])] = values[last]
+        return latest
+
+    @staticmethod
+    def _bmi_bands(latest):
+        latest = latest[~np.isnan(latest)]
+        bands = np.searchsorted([limit for limit, _ in BMI_BANDS[:-1]], latest, side='right')
+        counts = np.bincount(bands, minlength=len(BMI_BANDS))
+        return {name: int(count) for (_, name), count in zip(BMI_BANDS, counts)}
+
+    @staticmethod
+    def _bp_stages(systolic, diastolic):
+        recorded = ~(np.isnan(systolic) | np.isnan(diastolic))
+        systolic, diastolic = systolic[recorded], diastolic[recorded]
+        stages = np.select(
+            [(systolic >= 140) | (diastolic >= 90), (systolic >= 130) | (diastolic >= 80), systolic >= 120],
+            [3, 2, 1],
+            default=0,
+        )
+        counts = np.bincount(stages, minlength=len(BP_STAGES))
+        return {name: int(count) for name, count in zip(BP_STAGES, counts)}
+
+    @staticmethod
+    def _bmi_change(bmi, patients):
+        """First to latest BMI per patient with two or more, bucketed by direction"""
+        recorded = ~np.isnan(bmi)
+        values, owners = bmi[recorded], patients[recorded]
+        if not len(values):
+            return {'patients': 0}
+        boundary = np.append(owners[1:] != owners[:-1], True)
+        last = np.flatnonzero(boundary)
+        first = np.concatenate(([0], last[:-1] + 1))
+        repeated = last > first
+        change = values[last[repeated]] - values[first[repeated]]
+        return {
+            'patients': int(repeated.sum()),
+            'mean': round(float(change.mean()), 2) if len(change) else None,
+            'gained': int(np.count_nonzero(change > 0.5)),
+            'stable': int(np.count_nonzero(np.abs(change) <= 0.5)),
+            'lost': int(np.count_nonzero(change < -0.5)),
+        }
@@ -0,0 +1,138 @@
+"""AnalyticsService at scale: one columnar load plus NumPy group-bys vs SQL GROUP BYs.
+
+Seeds a temporary SQLite database with --rows prescription_drugs rows
+(three drugs per prescription, one visit per prescription), then times
+the single Core query into a structured array, the vectorized reports
+over it, the equivalent per-report GROUP BY queries and a cached call.
+
+    python -m benchmarks.bench_analytics --rows 10000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select
+
+from application import create_app
+from application.extensions import db
+from application.models.models import Drug, Prescription, PrescriptionDrug, Visit
+from application.services.analytics_service import AnalyticsService
+
+DRUGS = 400
+DOCTORS = 40
+PATIENTS = 200000
+VISIT_TYPES = ('Checkup', 'Emergency', 'Follow-up', 'Consultation', None)
+START = date(2023, 1, 1)
+DAYS = 730
+
+
+def seed(rows):
+    prescriptions = (rows + 2) // 3
+    random.seed(7)
+    now = datetime(2024, 1, 1).isoformat(' ')
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.executemany(
+            "INSERT INTO patients (id, public_id, patient_id, first_name, last_name, age, gender, phone, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'Akello', 'Nakato', 30, 'female', '0772000000', ?, ?)",
+            ((i, f'p{i}', f'P{i}', now, now) for i in range(1, PATIENTS + 1)),
+        )
+        cursor.executemany(
+            "INSERT INTO doctors (id, public_id, doctor_id, first_name, last_name, license_number, specialty, phone, is_active) "
+            "VALUES (?, ?, ?, 'Okello', ?, ?, 'GP', '0772000001', 1)",
+            ((i, f'd{i}', f'D{i}', f'Mukasa{i}', f'L{i}') for i in range(1, DOCTORS + 1)),
+        )
+        cursor.executemany(
+            "INSERT INTO drugs (id, public_id, name, unit_price, stock, is_active) VALUES (?, ?, ?, ?, 0, 1)",
+            ((i, f'g{i}', f'Drug {i}', round(random.uniform(0.5, 80), 2)) for i in range(1, DRUGS + 1)),
+        )
+        days = [(START + timedelta(days=day)).isoformat() for day in range(DAYS)]
+        cursor.executemany(
+            "INSERT INTO visits (id, public_id, visit_id, patient_id, doctor_id, visit_date, visit_type, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 'completed')",
+            ((i, f'v{i}', f'V{i}', i % PATIENTS + 1, i % DOCTORS + 1, days[i % DAYS] + ' 09:00:00',
+              VISIT_TYPES[i % len(VISIT_TYPES)]) for i in range(1, prescriptions + 1)),
+        )
+        cursor.executemany(
+            "INSERT INTO prescriptions (id, public_id, visit_id, patient_id, doctor_id, start_date, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'active')",
+            ((i, f'r{i}', i, i % PATIENTS + 1, i % DOCTORS + 1, days[i % DAYS]) for i in range(1, prescriptions + 1)),
+        )
+        cursor.executemany(
+            "INSERT INTO prescription_drugs (id, public_id, prescription_id, drug_id, dosage, frequency, quantity) "
+            "VALUES (?, ?, ?, ?, '1 tab', 'tds', ?)",
+            ((i, f'x{i}', (i - 1) // 3 + 1, (i * 7919) % DRUGS + 1, i % 5 + 1) for i in range(1, rows + 1)),
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def group_by_queries(start, end):
+    """The same reports as four GROUP BY queries, for comparison"""
+    revenue = func.sum(PrescriptionDrug.quantity * Drug.unit_price)
+    base = (
+        select()
+        .select_from(PrescriptionDrug)
+        .join(Prescription, Prescription.id == PrescriptionDrug.prescription_id)
+        .join(Drug, Drug.id == PrescriptionDrug.drug_id)
+        .where(Prescription.start_date.between(start, end))
+    )
+    session = db.session
+    session.execute(
+        base.add_columns(PrescriptionDrug.drug_id, func.sum(PrescriptionDrug.quantity), revenue,
+                         func.count(Prescription.patient_id.distinct()))
+        .group_by(PrescriptionDrug.drug_id).order_by(func.sum(PrescriptionDrug.quantity).desc()).limit(10)
+    ).all()
+    session.execute(
+        base.add_columns(func.strftime('%Y-%m', Prescription.start_date), revenue)
+        .group_by(func.strftime('%Y-%m', Prescription.start_date))
+    ).all()
+    session.execute(
+        base.add_columns(Prescription.doctor_id, revenue, func.count(Prescription.patient_id.distinct()))
+        .group_by(Prescription.doctor_id)
+    ).all()
+    session.execute(
+        base.outerjoin(Visit, Visit.id == Prescription.visit_id)
+        .add_columns(Visit.visit_type, func.count(Visit.id.distinct()), revenue)
+        .group_by(Visit.visit_type)
+    ).all()
+
+
+def timed(label, run):
+    started = time.perf_counter()
+    result = run()
+    print(f"{label:<28} {time.perf_counter() - started:8.2f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'analytics.db')}"})
+        with app.app_context():
+            timed(f'seed {args.rows} rows', lambda: seed(args.rows))
+            start, end = START, START + timedelta(days=DAYS)
+
+            rows = timed('load (one Core query)', lambda: AnalyticsService.load(start, end))
+            print(f"{'':<28} {len(rows)} rows, {rows.nbytes / 2 ** 20:.0f} MB")
+            summary = timed('vectorized reports', lambda: AnalyticsService.compute(rows))
+            timed('GROUP BY queries', lambda: group_by_queries(start, end))
+            timed('summary, first call', lambda: AnalyticsService.summary(start, end))
+            timed('summary, cached', lambda: AnalyticsService.summary(start, end))
+
+            print('top drug:', summary['top_drugs'][0])
+            print('visit mix:', [(mix['visit_type'], mix['share']) for mix in summary['visit_type_mix']])
+            db.session.remove()
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Integration API: one call per record versus batched calls.
+
+Registers --records patients, opens a visit for each and records their
+triage through /api, first one request (and commit) per record, then in
+batches of --batch, and reads them back per id and by id list, timing
+each way on its own temporary SQLite database.
+
+    python -m benchmarks.bench_api --records 2000 --batch 500
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from application import create_app
+from application.extensions import db
+from application.models.models import Doctor
+
+
+def patient(rng, i):
+    return {
+        'first_name': rng.choice(('Akello', 'Nakato', 'Okello', 'Namubiru')), 'last_name': f'Mukasa{i}',
+        'age': rng.randint(1, 90), 'gender': rng.choice(('male', 'female')), 'phone': f'0772{i:06d}',
+    }
+
+
+def triage(rng, visit_id):
+    return {
+        'visit_id': visit_id, 'height': round(rng.uniform(150, 185), 1), 'weight': round(rng.uniform(45, 95), 1),
+        'temperature': round(rng.uniform(36, 38.5), 1), 'blood_pressure': f'{rng.randint(100, 150)}/{rng.randint(60, 95)}',
+        'pulse': rng.randint(60, 110),
+    }
+
+
+def run(records, batch):
+    """{step: seconds} for records sent singly (batch=1) or batch at a time"""
+    rng = random.Random(3)
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'api.db')}"})
+        with app.app_context():
+            db.session.add(Doctor(first_name='Okello', last_name='Mukasa', license_number='L1',
+                                  specialty='GP', phone='0772000001'))
+            db.session.commit()
+            doctor = db.session.execute(db.select(Doctor.doctor_id)).scalar()
+            db.session.remove()
+        client = app.test_client()
+
+        def send(url, items):
+            results = []
+            started = time.perf_counter()
+            for start in range(0, len(items), batch):
+                chunk = items[start:start + batch]
+                response = client.post(url, json=chunk[0] if batch == 1 else chunk)
+                assert response.status_code in (200, 201), response.data
+                results.extend([response.json] if batch == 1 else response.json['results'])
+            return results, time.perf_counter() - started
+
+        patients, timings['patients'] = send('/api/patients', [patient(rng, i) for i in range(records)])
+        codes = [result['patient_id'] for result in patients]
+        visits, timings['visits'] = send('/api/visits', [
+            {'patient_id': code, 'doctor_id': doctor, 'visit_type': 'Checkup', 'status': 'in-progress'}
+            for code in codes
+        ])
+        visit_ids = [result['visit_id'] for result in visits]
+        _, timings['triage'] = send('/api/triage', [triage(rng, visit_id) for visit_id in visit_ids])
+
+        started = time.perf_counter()
+        if batch == 1:
+            for code in codes:
+                client.get(f'/api/patients/{code}')
+        else:
+            for start in range(0, len(codes), batch):
+                client.get('/api/patients', query_string={'ids': ','.join(codes[start:start + batch])})
+        timings['read'] = time.perf_counter() - started
+        with app.app_context():
+            db.engine.dispose()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    single = run(args.records, 1)
+    batched = run(args.records, args.batch)
+    print(f"{args.records:,} records{'one per call':>20}{f'{args.batch} per call':>16}{'speedup':>10}")
+    for step in single:
+        print(f"{step:<16}{single[step]:>19.3f}s{batched[step]:>15.3f}s{single[step] / batched[step]:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Prescription DOCX rendering: python-docx replace passes vs the compiled template.
+
+Builds a sample prescription template with placeholders in the body, a
+table and the header (some split across differently formatted runs),
+then times both approaches per document and the batch APIs.
+
+    python -m benchmarks.bench_docx_templates --documents 500
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+from io import BytesIO
+
+from docx import Document
+
+from application.docx_templates import DocxTemplate
+
+CONTEXT = {
+    'PATIENT_NAME': 'Akello Nakato',
+    'PATIENT_ID': 'KMC-10-2026-0001',
+    'DOCTOR_NAME': 'Dr. Okello Mukasa',
+    'MEDICATION': 'Amoxicillin 500mg\nParacetamol 1g',
+    'DOSAGE': '1 capsule three times daily\n2 tablets when needed',
+    'INSTRUCTIONS': 'Complete the course & return if fever persists > 3 days',
+    'DATE': date.today().isoformat(),
+}
+
+
+def build_template(path):
+    document = Document()
+    document.sections[0].header.paragraphs[0].text = 'Kampala Medical Centre - [DATE]'
+    document.add_heading('Prescription', level=1)
+    paragraph = document.add_paragraph('Patient: ')
+    # Word often splits a placeholder across runs when formatting changes mid-word
+    paragraph.add_run('[PATIENT_').bold = True
+    paragraph.add_run('NAME]').italic = True
+    paragraph.add_run(' ([PATIENT_ID])')
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).text, table.cell(0, 1).text = 'Medication', 'Dosage'
+    table.cell(1, 0).text, table.cell(1, 1).text = '[MEDICATION]', '[DOSAGE]'
+    document.add_paragraph('Instructions: [INSTRUCTIONS]')
+    for line in range(20):
+        document.add_paragraph(f'Clinic terms and conditions, paragraph {line}.')
+    document.add_paragraph('Prescribed by [DOCTOR_NAME] on [DATE]')
+    document.save(path)
+
+
+def replace_passes(path, context):
+    """What generate_prescription did before: reopen and str.replace every paragraph"""
+    document = Document(path)
+    paragraphs = list(document.paragraphs)
+    for table in document.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                paragraphs.extend(cell.paragraphs)
+    paragraphs.extend(document.sections[0].header.paragraphs)
+    for paragraph in paragraphs:
+        for name, value in context.items():
+            if f'[{name}]' in paragraph.text:
+                paragraph.text = paragraph.text.replace(f'[{name}]', value)
+    output = BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def per_document(fn, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - started) * 1000 / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'prescription_template.docx')
+        build_template(path)
+
+        started = time.perf_counter()
+        template = DocxTemplate(path)
+        print(f"compiled in {(time.perf_counter() - started) * 1000:.1f} ms, fields: {sorted(template.fields)}")
+
+        rendered = Document(BytesIO(template.render(CONTEXT)))
+        text = '\n'.join(p.text for p in rendered.paragraphs)
+        assert 'Akello Nakato' in text and '[' not in text, text
+        assert 'Amoxicillin' in rendered.tables[0].cell(1, 0).text
+        assert CONTEXT['DATE'] in rendered.sections[0].header.paragraphs[0].text
+
+        baseline = per_document(lambda: replace_passes(path, CONTEXT), max(args.documents // 10, 10))
+        compiled = per_document(lambda: template.render(CONTEXT), args.documents)
+        print(f"python-docx replace  {baseline:8.2f} ms/doc")
+        print(f"compiled template    {compiled:8.2f} ms/doc  ({baseline / compiled:.0f}x)")
+
+        contexts = [dict(CONTEXT, PATIENT_NAME=f'Patient {i}') for i in range(args.documents)]
+        started = time.perf_counter()
+        merged = template.render_many(contexts)
+        print(f"render_many          {(time.perf_counter() - started) * 1000:8.1f} ms for {args.documents} "
+              f"({len(merged) // 1024} KB)")
+        assert len(Document(BytesIO(merged)).tables) == args.documents
+        started = time.perf_counter()
+        archive = template.render_zip((f'{i}.docx', context) for i, context in enumerate(contexts))
+        print(f"render_zip           {(time.perf_counter() - started) * 1000:8.1f} ms for {args.documents} "
+              f"({len(archive) // 1024} KB)")
+
+
+if __name__ == '__main__':
+    main()
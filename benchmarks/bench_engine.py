@@ -0,0 +1,128 @@
+"""Read/write concurrency benchmark for the SQLite engine profile.
+
+Runs the same mixed workload (front-desk writers inserting visits while
+admin readers page through the visit list) against a stock SQLite engine
+and against the profile from config.Config.SQLITE_PRAGMAS, then prints
+throughput for both.
+
+    python -m benchmarks.bench_engine --seconds 10 --readers 8 --writers 2
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.exc import OperationalError
+
+from application.extensions import apply_sqlite_pragmas, db
+from application.models.models import Doctor, Patient, Visit
+from config import Config
+
+
+def build_engine(path, pragmas):
+    engine = create_engine(f"sqlite:///{path}", pool_size=16, max_overflow=0)
+    if pragmas:
+        event.listen(engine, 'connect', apply_sqlite_pragmas(pragmas))
+    return engine
+
+
+def seed(engine, patients):
+    db.metadata.create_all(engine)
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(Doctor.__table__), [{
+            'public_id': 'bench-doctor', 'doctor_id': 'KMC-DOC-BENCH-0001', 'first_name': 'Bench',
+            'last_name': 'Doctor', 'license_number': 'BENCH-0001', 'specialty': 'general',
+            'phone': '0700000000', 'is_active': True,
+        }])
+        conn.execute(insert(Patient.__table__), [{
+            'public_id': f'bench-patient-{i}', 'patient_id': f'KMC-BENCH-{i:07d}', 'first_name': 'Bench',
+            'last_name': f'Patient{i}', 'age': 30, 'gender': 'female', 'phone': '0700000000',
+        } for i in range(patients)])
+        conn.execute(insert(Visit.__table__), [{
+            'public_id': f'bench-visit-{i}', 'visit_id': f'KMC-VIS-BENCH/{i:07d}', 'patient_id': i + 1,
+            'doctor_id': 1, 'visit_date': now, 'visit_type': 'walk-in', 'status': 'completed',
+        } for i in range(patients)])
+
+
+def run(engine, seconds, readers, writers, patients):
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    sequence = iter(range(10**9))
+
+    def reader():
+        while not stop.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(select(func.count(Visit.id))).scalar()
+                    conn.execute(
+                        select(Visit.__table__).order_by(Visit.id.desc())
+                        .limit(20).offset(random.randrange(0, patients, 20))
+                    ).all()
+                key = 'reads'
+            except OperationalError:
+                key = 'errors'
+            with lock:
+                counts[key] += 1
+
+    def writer():
+        while not stop.is_set():
+            n = next(sequence)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(Visit.__table__).values(
+                        public_id=f'bench-new-visit-{threading.get_ident()}-{n}',
+                        visit_id=f'KMC-VIS-NEW/{threading.get_ident()}-{n}',
+                        patient_id=random.randint(1, patients), doctor_id=1,
+                        visit_date=datetime.now(), visit_type='walk-in', status='in-progress',
+                    ))
+                key = 'writes'
+            except OperationalError:
+                key = 'errors'
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {k: v / seconds for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--patients', type=int, default=20000)
+    args = parser.parse_args()
+
+    profiles = [('stock', {}), ('tuned', Config.SQLITE_PRAGMAS)]
+    results = {}
+    for name, pragmas in profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = build_engine(os.path.join(tmp, 'bench.db'), pragmas)
+            seed(engine, args.patients)
+            results[name] = run(engine, args.seconds, args.readers, args.writers, args.patients)
+            engine.dispose()
+
+    print(f"{'profile':<8} {'reads/s':>10} {'writes/s':>10} {'errors/s':>10}")
+    for name, r in results.items():
+        print(f"{name:<8} {r['reads']:>10.1f} {r['writes']:>10.1f} {r['errors']:>10.1f}")
+    stock, tuned = results['stock'], results['tuned']
+    if stock['reads'] and stock['writes']:
+        print(f"read speedup x{tuned['reads'] / stock['reads']:.2f}, "
+              f"write speedup x{tuned['writes'] / stock['writes']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Invoice export: loading every row up front vs the streaming exporter.
+
+Seeds a temporary SQLite database with visits, invoices, items and
+payments, then reports time and peak Python memory for a full-range
+invoice export, once materialized and once through ExportService.
+Times include tracemalloc overhead, which weighs most on openpyxl.
+
+    python -m benchmarks.bench_export --invoices 20000
+"""
+import argparse
+import csv
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import insert
+from sqlalchemy.orm import joinedload, selectinload
+
+from application import create_app
+from application.extensions import db
+from application.models.models import Doctor, Drug, Invoice, InvoiceItem, Patient, Payment, Visit
+from application.services.export_service import ExportService
+
+
+def seed(count):
+    now = datetime.now(timezone.utc)
+
+    def base():
+        return {'public_id': str(uuid.uuid4()), 'created_at': now, 'updated_at': now}
+
+    with db.engine.begin() as connection:
+        connection.execute(insert(Patient.__table__), [
+            dict(base(), patient_id=f'P{i}', first_name='Akello', last_name=f'Nakato{i}',
+                 age=30, gender='female', phone='0772000000')
+            for i in range(1000)
+        ])
+        connection.execute(insert(Doctor.__table__), [dict(
+            base(), doctor_id='D1', first_name='Okello', last_name='Mukasa',
+            license_number='L1', specialty='GP', phone='0772000001',
+        )])
+        connection.execute(insert(Drug.__table__), [dict(base(), name='Paracetamol', unit_price=Decimal('1.50'))])
+        for offset in range(0, count, 10000):
+            ids = range(offset, min(count, offset + 10000))
+            day = lambda i: date(2024, 1, 1) + timedelta(days=i // 300)
+            connection.execute(insert(Visit.__table__), [dict(
+                base(), visit_id=f'V{i}', patient_id=i % 1000 + 1, doctor_id=1,
+                visit_date=datetime(2024, 1, 1) + timedelta(minutes=i * 5),
+            ) for i in ids])
+            connection.execute(insert(Invoice.__table__), [dict(
+                base(), visit_id=i + 1, patient_id=i % 1000 + 1, invoice_date=day(i),
+                subtotal=Decimal('10.00'), total_amount=Decimal('15.00'), professional_fee=Decimal('5.00'),
+            ) for i in ids])
+            connection.execute(insert(InvoiceItem.__table__), [dict(
+                base(), invoice_id=i + 1, drug_id=1, item_type='medication', description='Paracetamol',
+                quantity=2, unit_price=Decimal('1.50'), total_price=Decimal('3.00'),
+            ) for i in ids])
+            connection.execute(insert(Payment.__table__), [dict(
+                base(), invoice_id=i + 1, payment_date=day(i), amount=Decimal('7.50'), payment_method='cash',
+            ) for i in ids])
+
+
+def materialized():
+    """What exporting from the admin list amounts to: every invoice loaded, then written"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    invoices = (
+        Invoice.query
+        .options(joinedload(Invoice.patient), joinedload(Invoice.visit), selectinload(Invoice.payments))
+        .order_by(Invoice.invoice_date, Invoice.id)
+        .all()
+    )
+    for invoice in invoices:
+        writer.writerow([
+            invoice.id, invoice.invoice_date, invoice.patient.patient_id, invoice.visit.visit_id,
+            invoice.total_amount, invoice.amount_paid, invoice.balance_due, invoice.status,
+        ])
+    return len(buffer.getvalue().encode('utf-8'))
+
+
+def measure(label, run):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = run()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<22} {elapsed:7.2f} s  peak {peak / 2 ** 20:7.1f} MB  {size / 2 ** 20:7.1f} MB out")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=20000)
+    parser.add_argument('--formats', default='csv,xlsx,parquet')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'export.db')}"})
+        with app.app_context():
+            seed(args.invoices)
+            print(f"{args.invoices} invoices")
+            measure('materialized csv', materialized)
+            db.session.remove()
+            for fmt in args.formats.split(','):
+                measure(f'streamed {fmt}', lambda: sum(len(chunk) for chunk in ExportService.stream('invoices', fmt)))
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
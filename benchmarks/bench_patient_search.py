@@ -0,0 +1,88 @@
+"""Patient lookup latency: LIKE scans vs the patient_search FTS5 index.
+
+Seeds a throwaway SQLite database with synthetic patients, then times the
+same name, KMC ID and phone lookups through both paths.
+
+    python -m benchmarks.bench_patient_search --patients 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import insert, select
+
+from application import create_app
+from application.extensions import db
+from application.models.models import Patient
+from application.services.search_service import PatientSearchService
+
+FIRST_NAMES = ['Akello', 'Nakato', 'Okello', 'Mukasa', 'Namubiru', 'Ssemanda', 'Atim', 'Kato', 'Nansubuga', 'Opio']
+LAST_NAMES = ['Achieng', 'Byaruhanga', 'Kiggundu', 'Lubega', 'Mugisha', 'Nalwoga', 'Ochieng', 'Tumusiime', 'Wasswa']
+
+
+def seed_patients(count, seed=0, batch=50000):
+    rng = random.Random(seed)
+    for start in range(1, count + 1, batch):
+        db.session.execute(insert(Patient.__table__), [dict(
+            public_id=f'patient-{i}', patient_id=f'KMC-{i % 12 + 1:02d}-2025-{i:07d}',
+            first_name=rng.choice(FIRST_NAMES), last_name=f'{rng.choice(LAST_NAMES)}{i}',
+            age=rng.randint(1, 90), gender=rng.choice(['male', 'female']),
+            phone=rng.choice(['+256 7{:08d}', '07{:08d}', '2567{:08d}']).format(i),
+        ) for i in range(start, min(start + batch, count + 1))])
+    db.session.commit()
+
+
+def timed(fn, terms):
+    samples = []
+    for term in terms:
+        started = time.perf_counter()
+        fn(term)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    ids = [rng.randint(1, args.patients) for _ in range(args.lookups)]
+    lookups = {
+        'name': [f'{rng.choice(FIRST_NAMES)[:4]} {rng.choice(LAST_NAMES)}{i}' for i in ids],
+        'patient id': [f'{i:07d}' for i in ids],
+        'phone': [f'07{i:08d}'[:8] for i in ids],
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'search.db')}"})
+        with app.app_context():
+            seed_patients(args.patients)
+            started = time.perf_counter()
+            with db.engine.begin() as connection:
+                PatientSearchService.rebuild(connection)
+            print(f"indexed {args.patients} patients in {time.perf_counter() - started:.1f}s")
+
+            def like(term):
+                db.session.execute(
+                    select(Patient.id).where(PatientSearchService._like_condition(term)).limit(10)
+                ).all()
+
+            def fts(term):
+                db.session.execute(PatientSearchService.matching_ids(term, ranked=True, limit=10)).all()
+
+            print(f"{'lookup':<12}{'LIKE p50':>10}{'p95':>10}{'FTS p50':>10}{'p95':>10}  (ms)")
+            for name, terms in lookups.items():
+                like_p50, like_p95 = timed(like, terms)
+                fts_p50, fts_p95 = timed(fts, terms)
+                print(f"{name:<12}{like_p50:>10.2f}{like_p95:>10.2f}{fts_p50:>10.2f}{fts_p95:>10.2f}")
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Triage-save latency while reports run, with and without read routing.
+
+Saves triage one visit at a time through PUT /api/visits/<visit_id>/triage
+(one request and commit each) on a database filled by benchmarks.datagen:
+first with no other load, then while --report-threads clients loop over
+the CSV visit export, the analytics report and the admin visit list. The
+loaded run is repeated with DB_READ_ROUTING off, where reports share the
+primary pool with the writes, and on, where they read through their own
+read-only pool. Both pools get --pool-size connections and no overflow,
+so the run shows what a handful of slow reports does to the writer pool.
+
+    python -m benchmarks.bench_routing
+    python -m benchmarks.bench_routing --database sqlite:////tmp/ehr-medium.db --saves 500
+"""
+import argparse
+from datetime import date, timedelta
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import select
+
+from application import create_app
+from application.extensions import cache, db
+from application.models.models import Visit
+from benchmarks.datagen import generate
+
+
+def reports(client, rng):
+    """One report request, as a reporting user would issue them"""
+    start = date(2023, 1, 1) + timedelta(days=rng.randrange(600))
+    choice = rng.randrange(3)
+    if choice == 0:
+        return client.get('/exports/visits.csv')
+    if choice == 1:
+        # A fresh window each time, so the result cache does not answer it
+        return client.get('/admin/analytics', query_string={
+            'start': start.isoformat(), 'end': (start + timedelta(days=rng.randrange(30, 365))).isoformat(),
+        })
+    return client.get('/admin/visit/')
+
+
+def run(uri, visit_ids, saves, report_threads, pool_size, routing):
+    """Triage-save latencies (ms) and reports served, for one configuration"""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'DB_READ_ROUTING': routing,
+        'DB_POOL_SIZE': pool_size, 'DB_MAX_OVERFLOW': 0,
+        'DB_READ_POOL_SIZE': pool_size, 'DB_READ_MAX_OVERFLOW': 0,
+        'SLOW_REQUEST_MS': 10 ** 9,
+    })
+    cache.clear()
+    stop = threading.Event()
+    served = []
+
+    def load(seed):
+        client, rng, count = app.test_client(), random.Random(seed), 0
+        while not stop.is_set():
+            response = reports(client, rng)
+            response.get_data()
+            response.close()
+            assert response.status_code == 200, response.status_code
+            count += 1
+        served.append(count)
+
+    threads = [threading.Thread(target=load, args=(seed,)) for seed in range(report_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(1 if report_threads else 0)  # let the reports get going
+
+    client, rng, samples = app.test_client(), random.Random(7), []
+    for i in range(saves):
+        started = time.perf_counter()
+        response = client.put(f'/api/visits/{visit_ids[i % len(visit_ids)]}/triage', json={
+            'temperature': round(rng.uniform(36, 38.5), 1), 'pulse': rng.randint(60, 110),
+            'blood_pressure': f'{rng.randint(100, 150)}/{rng.randint(60, 95)}',
+        })
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 201, response.data
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    with app.app_context():
+        db.engine.dispose()
+        if app.extensions.get('read_engine') is not None:
+            app.extensions['read_engine'].dispose()
+    return sorted(samples), sum(served)
+
+
+def percentile(samples, q):
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLAlchemy URL of a SQLite database filled by benchmarks.datagen')
+    parser.add_argument('--patients', type=int, default=10000, help='generated when --database is not given')
+    parser.add_argument('--visits', type=int, default=50000)
+    parser.add_argument('--saves', type=int, default=200)
+    parser.add_argument('--report-threads', type=int, default=6)
+    parser.add_argument('--pool-size', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = args.database or f"sqlite:///{os.path.join(tmp, 'routing.db')}"
+        app = create_app({'SQLALCHEMY_DATABASE_URI': uri})
+        with app.app_context():
+            if not args.database:
+                generate(args.patients, args.visits, seed=0)
+            visit_ids = db.session.execute(
+                select(Visit.visit_id).order_by(Visit.id.desc()).limit(args.saves)
+            ).scalars().all()
+            db.engine.dispose()
+
+        print(f"{args.saves} triage saves, {args.report_threads} report clients, pools of {args.pool_size}")
+        print(f"{'':<24}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>10}{'reports':>9}")
+        for label, threads, routing in (
+            ('no report load', 0, True),
+            ('reports, no routing', args.report_threads, False),
+            ('reports, read routing', args.report_threads, True),
+        ):
+            samples, served = run(uri, visit_ids, args.saves, threads, args.pool_size, routing)
+            print(f"{label:<24}{percentile(samples, 0.5):>9.1f}{percentile(samples, 0.9):>9.1f}"
+                  f"{percentile(samples, 0.99):>9.1f}{samples[-1]:>10.1f}{served:>9}")
+
+
+if __name__ == '__main__':
+    main()
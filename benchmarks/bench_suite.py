@@ -0,0 +1,252 @@
+"""End-to-end latency and throughput of the app's main entry points.
+
+Drives the real routes through the Flask test client against a database
+filled by benchmarks.datagen: the admin dashboard, patient search (admin
+list and typeahead), triage POST, invoice summary, print and download, and
+the patient journey (redirect and JSON) and chart. Each scenario reports
+p50/p90/p99 latency, requests per second, server errors and SQL statements
+per request.
+
+Every run is appended to benchmarks/results/<label>.jsonl with the git
+commit it ran on and compared with the latest earlier run of the same
+label, so a slowdown between commits shows up as a flagged regression.
+
+    python -m benchmarks.bench_suite --scale small
+    python -m benchmarks.bench_suite --database sqlite:////tmp/ehr-large.db --label large --requests 500
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+from sqlalchemy import func, make_url, select
+
+from application import create_app
+from application.extensions import db, instrumentation
+from application.models.models import Invoice, Patient, Visit
+from benchmarks.datagen import FIRST_NAMES, LAST_NAMES, SCALES, TABLES, generate
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def sample_keys(rng, count):
+    """Deterministic request targets drawn from what the database holds"""
+    def pick(column, *where):
+        rows = db.session.execute(select(column).where(*where).order_by(column)).scalars().all()
+        return [rng.choice(rows) for _ in range(count)] if rows else []
+
+    last_patient = db.session.execute(select(func.max(Patient.id))).scalar() or 0
+    patient_ids = db.session.execute(
+        select(Patient.patient_id).where(Patient.id.in_([rng.randint(1, last_patient) for _ in range(count)]))
+    ).scalars().all()
+    last_invoice = db.session.execute(select(func.max(Invoice.id))).scalar() or 0
+    invoices = db.session.execute(
+        select(Invoice.id, Invoice.visit_id).where(Invoice.id.in_([rng.randint(1, last_invoice) for _ in range(count)]))
+    ).all()
+    return {
+        'patients': patient_ids,
+        # Patients with a visit still open, as triage and the journey see them
+        'open_patients': pick(Patient.patient_id, Patient.id.in_(
+            select(Visit.patient_id).where(Visit.status == 'in-progress'))),
+        'invoices': [invoice_id for invoice_id, _ in invoices],
+        'invoiced_visits': [visit_id for _, visit_id in invoices],
+    }
+
+
+def scenarios(keys, rng):
+    """name -> callable(client, i) issuing the i-th request of the scenario"""
+    def nth(values, i):
+        return values[i % len(values)]
+
+    def triage_form(i):
+        return {
+            'height': f'{rng.uniform(150, 185):.1f}', 'weight': f'{rng.uniform(45, 95):.1f}',
+            'temperature': f'{rng.uniform(36, 39):.1f}',
+            'blood_pressure': f'{rng.randint(100, 150)}/{rng.randint(60, 95)}',
+            'pulse': str(rng.randint(60, 110)), 'notes': f'benchmark {i}',
+        }
+
+    names = [f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}' for _ in range(64)]
+    json_accept = {'Accept': 'application/json'}
+    return {
+        'admin_dashboard': lambda client, i: client.get('/admin/'),
+        'patient_list_search': lambda client, i: client.get('/admin/patient/', query_string={'search': nth(names, i)}),
+        'patient_typeahead': lambda client, i: client.get(
+            '/main/patient-search', query_string={'q': nth(names, i)[:6]}),
+        'patient_id_lookup': lambda client, i: client.get(
+            '/main/patient-search', query_string={'q': nth(keys['patients'], i)}),
+        'triage_post': lambda client, i: client.post(
+            f"/triage/{nth(keys['open_patients'] or keys['patients'], i)}", data=triage_form(i)),
+        'invoice_summary': lambda client, i: client.get(f"/billing/invoice/{nth(keys['invoiced_visits'], i)}"),
+        'invoice_print': lambda client, i: client.get(
+            f"/admin/invoice/print/{nth(keys['invoices'], i)}", headers=json_accept),
+        'invoice_download': lambda client, i: client.get(
+            f"/admin/invoice/download/{nth(keys['invoices'], i)}", headers=json_accept),
+        'patient_journey': lambda client, i: client.get(
+            f"/main/patient-journey/{nth(keys['open_patients'] or keys['patients'], i)}"),
+        'patient_journey_state': lambda client, i: client.get(
+            f"/main/patient-journey/{nth(keys['patients'], i)}/state"),
+        'patient_chart': lambda client, i: client.get(f"/main/patient-chart/{nth(keys['patients'], i)}"),
+    }
+
+
+def run_scenario(app, request, count, warmup, concurrency):
+    """Latencies (ms) of count requests over concurrency clients, plus wall time and errors"""
+    clients = [app.test_client() for _ in range(concurrency)]
+    for i in range(warmup):
+        request(clients[0], i)
+    instrumentation.reset()
+
+    def worker(n):
+        samples, errors = [], 0
+        for i in range(n, count, concurrency):
+            started = time.perf_counter()
+            response = request(clients[n], warmup + i)
+            response.close()
+            samples.append((time.perf_counter() - started) * 1000)
+            errors += response.status_code >= 500
+        return samples, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - started
+    samples = sorted(sample for worker_samples, _ in results for sample in worker_samples)
+    return samples, wall, sum(errors for _, errors in results)
+
+
+def percentile(samples, q):
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def sql_per_request():
+    """(statements, ms) per request since the last instrumentation reset"""
+    totals = {}
+    for name in ('ehr_request_sql_statements', 'ehr_request_sql_seconds'):
+        histograms = instrumentation._histograms[name].values()
+        count = sum(histogram.count for histogram in histograms)
+        totals[name] = sum(histogram.sum for histogram in histograms) / count if count else 0.0
+    return totals['ehr_request_sql_statements'], totals['ehr_request_sql_seconds'] * 1000
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(('git', *args), capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    return git('rev-parse', '--short', 'HEAD') or None, bool(git('status', '--porcelain', '--untracked-files=no'))
+
+
+def previous_run(path, commit):
+    """The latest stored run from another commit, else the latest run"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as results:
+        runs = [json.loads(line) for line in results if line.strip()]
+    others = [run for run in runs if run['commit'] != commit]
+    return (others or runs or [None])[-1]
+
+
+def compare(current, previous, threshold, floor_ms):
+    """Scenarios whose p50 or p90 grew by more than threshold (and floor_ms) since previous"""
+    regressions = []
+    for name, result in current['scenarios'].items():
+        before = previous['scenarios'].get(name)
+        if not before:
+            continue
+        for stat in ('p50_ms', 'p90_ms'):
+            grown = result[stat] - before[stat]
+            if before[stat] and grown > floor_ms and grown / before[stat] > threshold:
+                regressions.append((name, stat, before[stat], result[stat]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLAlchemy URL of a database filled by benchmarks.datagen')
+    parser.add_argument('--scale', choices=SCALES, default='small', help='generated when --database is not given')
+    parser.add_argument('--label', help='results file name (default: the scale)')
+    parser.add_argument('--requests', type=int, default=200, help='per scenario')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--only', nargs='*', help='scenario names to run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown flagged as a regression')
+    parser.add_argument('--floor-ms', type=float, default=1.0, help='ignore slowdowns smaller than this')
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--check', action='store_true', help='exit 1 on a regression')
+    args = parser.parse_args()
+
+    label = args.label or args.scale
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = args.database or f"sqlite:///{os.path.join(tmp, 'suite.db')}"
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': uri,
+            'DOCUMENT_CACHE_DIR': os.path.join(tmp, 'documents'),
+            'SLOW_REQUEST_MS': 10 ** 9,  # the suite reports latency itself
+        })
+        with app.app_context():
+            if not args.database:
+                patients, visits = SCALES[args.scale]
+                generate(patients, visits, seed=args.seed)
+            rows = {
+                model.__tablename__: db.session.execute(select(func.count()).select_from(model.__table__)).scalar()
+                for model in TABLES
+            }
+            rng = random.Random(args.seed)
+            keys = sample_keys(rng, max(args.requests, 64))
+            db.session.remove()
+
+        commit, dirty = git_revision()
+        current = {
+            'commit': commit, 'dirty': dirty, 'label': label,
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'database': make_url(uri).get_backend_name(),
+            'requests': args.requests, 'concurrency': args.concurrency, 'rows': rows, 'scenarios': {},
+        }
+
+        print(f"{'scenario':<22}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'req/s':>9}{'5xx':>6}{'SQL':>7}{'SQL ms':>8}")
+        for name, request in scenarios(keys, rng).items():
+            if args.only and name not in args.only:
+                continue
+            samples, wall, errors = run_scenario(app, request, args.requests, args.warmup, args.concurrency)
+            statements, sql_ms = sql_per_request()
+            result = current['scenarios'][name] = {
+                'p50_ms': round(percentile(samples, 0.5), 3),
+                'p90_ms': round(percentile(samples, 0.9), 3),
+                'p99_ms': round(percentile(samples, 0.99), 3),
+                'max_ms': round(samples[-1], 3),
+                'rps': round(len(samples) / wall, 1),
+                'errors': errors,
+                'sql_statements': round(statements, 1),
+                'sql_ms': round(sql_ms, 3),
+            }
+            print(f"{name:<22}{result['p50_ms']:>9.2f}{result['p90_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                  f"{result['max_ms']:>9.2f}{result['rps']:>9.1f}{errors:>6}{statements:>7.1f}{sql_ms:>8.2f}")
+        with app.app_context():
+            db.engine.dispose()
+
+    path = os.path.join(RESULTS_DIR, f'{label}.jsonl')
+    previous = previous_run(path, commit)
+    regressions = compare(current, previous, args.threshold, args.floor_ms) if previous else []
+    if previous:
+        print(f"\ncompared with {previous['commit']} ({previous['date']}): "
+              f"{len(regressions) or 'no'} regression(s) over {args.threshold:.0%}")
+        for name, stat, before, after in regressions:
+            print(f"  {name:<22}{stat:<8}{before:>9.2f} -> {after:.2f} ms")
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(path, 'a') as results:
+            results.write(json.dumps(current, sort_keys=True) + '\n')
+        print(f"saved to {os.path.relpath(path)}")
+    if args.check and regressions:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
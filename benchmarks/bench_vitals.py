@@ -0,0 +1,105 @@
+"""VitalsService at scale: cohort reports and patient trends over --rows triage readings.
+
+Seeds a temporary SQLite database with one visit per triage reading
+spread over --patients patients, then times the columnar load, the
+vectorized cohort report, a per-patient trend cold and from its cache, and
+for comparison the same BMI bands computed from ORM objects.
+
+    python -m benchmarks.bench_vitals --rows 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from application import create_app
+from application.extensions import cache, db
+from application.models.models import Triage
+from application.services.vitals_service import VitalsService
+
+DOCTORS = 40
+START = date(2023, 1, 1)
+DAYS = 730
+
+
+def seed(rows, patients):
+    rng = random.Random(11)
+    now = datetime(2024, 1, 1).isoformat(' ')
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.executemany(
+            "INSERT INTO patients (id, public_id, patient_id, first_name, last_name, age, gender, phone, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'Akello', 'Nakato', 30, 'female', '0772000000', ?, ?)",
+            ((i, f'p{i}', f'P{i}', now, now) for i in range(1, patients + 1)),
+        )
+        cursor.executemany(
+            "INSERT INTO doctors (id, public_id, doctor_id, first_name, last_name, license_number, specialty, phone, is_active) "
+            "VALUES (?, ?, ?, 'Okello', ?, ?, 'GP', '0772000001', 1)",
+            ((i, f'd{i}', f'D{i}', f'Mukasa{i}', f'L{i}') for i in range(1, DOCTORS + 1)),
+        )
+        days = [(START + timedelta(days=day)).isoformat() for day in range(DAYS)]
+        cursor.executemany(
+            "INSERT INTO visits (id, public_id, visit_id, patient_id, doctor_id, visit_date, visit_type, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'Checkup', 'completed')",
+            ((i, f'v{i}', f'V{i}', i % patients + 1, i % DOCTORS + 1, days[(i - 1) * DAYS // rows] + ' 09:00:00')
+             for i in range(1, rows + 1)),
+        )
+        cursor.executemany(
+            "INSERT INTO triage (id, public_id, visit_id, height, weight, temperature, blood_pressure_systolic, "
+            "blood_pressure_diastolic, pulse, oxygen_saturation) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((i, f't{i}', i, round(rng.uniform(145, 190), 1), round(rng.uniform(40, 110), 1),
+              round(rng.uniform(35.8, 39.8), 1), rng.randint(95, 170), rng.randint(60, 105),
+              rng.randint(55, 125), rng.randint(90, 100)) for i in range(1, rows + 1)),
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    result = fn()
+    print(f"{label:<44}{time.perf_counter() - started:>9.3f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--patients', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'vitals.db')}"})
+        with app.app_context():
+            timed(f"seed {args.rows:,} readings", lambda: seed(args.rows, args.patients))
+
+            rows = timed("load (one Core query into arrays)", VitalsService.load)
+            report = timed("cohort report (vectorized)", lambda: VitalsService.cohort_report(rows))
+            print(f"  {report['readings']:,} readings, {report['patients']:,} patients, BMI bands {report['bmi_bands']}")
+            timed("cohort() cold: load + report", lambda: VitalsService.cohort())
+            timed("cohort() cached", lambda: VitalsService.cohort())
+
+            patient = args.patients // 2
+            timed("patient trend cold", lambda: VitalsService.patient_trend(patient))
+            timed("patient trend cached", lambda: VitalsService.patient_trend(patient))
+            cache.clear()
+
+            def orm_bands():
+                # What a per-object report does: load every Triage row and use its bmi property
+                bands = [0, 0, 0, 0]
+                for triage in db.session.execute(db.select(Triage).execution_options(yield_per=10000)).scalars():
+                    bmi = triage.bmi
+                    if bmi is not None:
+                        bands[(bmi >= 18.5) + (bmi >= 25) + (bmi >= 30)] += 1
+                return bands
+
+            timed("BMI bands from ORM objects, for comparison", orm_bands)
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+"""Deterministic synthetic data for every model, at benchmark scale.
+
+Fills an empty database with patients, doctors, drugs and a chronological
+stream of visits, each with its triage, diagnoses, report, prescription,
+invoice, payments and receipts, plus the stock ledger, id_sequences
+counters and an import checkpoint. Rollups, the patient search index and
+stock snapshots are then rebuilt the way the app's own commands do. The
+same --seed, scale and --end always produce the same rows.
+
+    python -m benchmarks.datagen --scale large --database sqlite:////tmp/ehr-large.db
+    python -m benchmarks.datagen --patients 1000000 --visits 5000000 --database sqlite:////tmp/ehr.db
+"""
+import argparse
+from datetime import date, datetime, time as clock, timedelta
+from decimal import Decimal
+import random
+import time
+import uuid
+
+from sqlalchemy import func, insert, select
+
+from application import create_app
+from application.extensions import db
+from application.models.models import (
+    Diagnosis, Doctor, Drug, IdSequence, ImportCheckpoint, Invoice, InvoiceItem, MonthlyRollup, Patient,
+    PatientActivity, Payment, Prescription, PrescriptionDrug, Receipt, StockMovement, StockSnapshot, Triage,
+    Visit, VisitReport,
+)
+from application.services.rollup_service import RollupService
+from application.services.search_service import PatientSearchService
+from application.services.sequence_service import SequenceService
+from application.services.stock_service import StockService
+
+# name -> (patients, visits)
+SCALES = {
+    'small': (2000, 10000),
+    'medium': (100000, 500000),
+    'large': (1000000, 5000000),
+}
+
+FIRST_NAMES = [
+    'Akello', 'Nakato', 'Okello', 'Mukasa', 'Namubiru', 'Ssemanda', 'Atim', 'Kato', 'Nansubuga', 'Opio',
+    'Apio', 'Babirye', 'Kizza', 'Nabirye', 'Mugabi', 'Auma', 'Byamukama', 'Achan', 'Wanyana', 'Lwanga',
+    'Namutebi', 'Kaggwa', 'Adong', 'Ouma', 'Nalubega', 'Tumwine', 'Akot', 'Kisakye', 'Ojok', 'Nakimuli',
+    'Grace', 'Joseph', 'Sarah', 'David', 'Esther', 'Moses', 'Ruth', 'Peter', 'Harriet', 'Samuel',
+]
+LAST_NAMES = [
+    'Achieng', 'Byaruhanga', 'Kiggundu', 'Lubega', 'Mugisha', 'Nalwoga', 'Ochieng', 'Tumusiime', 'Wasswa',
+    'Kasozi', 'Mutebi', 'Namaganda', 'Okot', 'Ssali', 'Atuhaire', 'Kyomuhendo', 'Musoke', 'Nsubuga',
+    'Odongo', 'Kabuye', 'Ainembabazi', 'Mwesigwa', 'Nakitende', 'Ogwang', 'Ssebunya', 'Twinomujuni',
+    'Bukenya', 'Kirabo', 'Magezi', 'Nankya', 'Oryem', 'Sserwadda', 'Tugume', 'Wamala', 'Zziwa',
+]
+SPECIALTIES = ['General Practice', 'Paediatrics', 'Internal Medicine', 'Obstetrics', 'Surgery', 'Dental']
+# (generic name, dosage form, strength, unit price in shillings)
+DRUGS = [
+    ('Amoxicillin', 'Capsule', '250mg', 500), ('Paracetamol', 'Tablet', '500mg', 100),
+    ('Artemether/Lumefantrine', 'Tablet', '20/120mg', 1500), ('Ciprofloxacin', 'Tablet', '500mg', 700),
+    ('Metronidazole', 'Tablet', '400mg', 200), ('Ibuprofen', 'Tablet', '400mg', 150),
+    ('Cotrimoxazole', 'Tablet', '960mg', 250), ('Omeprazole', 'Capsule', '20mg', 400),
+    ('Metformin', 'Tablet', '500mg', 300), ('Amlodipine', 'Tablet', '5mg', 350),
+    ('Losartan', 'Tablet', '50mg', 600), ('Hydrochlorothiazide', 'Tablet', '25mg', 200),
+    ('Salbutamol', 'Inhaler', '100mcg', 12000), ('Prednisolone', 'Tablet', '5mg', 150),
+    ('Ferrous Sulphate', 'Tablet', '200mg', 100), ('Folic Acid', 'Tablet', '5mg', 50),
+    ('Doxycycline', 'Capsule', '100mg', 300), ('Azithromycin', 'Tablet', '500mg', 1200),
+    ('Ceftriaxone', 'Injection', '1g', 5000), ('Oral Rehydration Salts', 'Sachet', '20.5g', 500),
+    ('Zinc Sulphate', 'Tablet', '20mg', 150), ('Albendazole', 'Tablet', '400mg', 500),
+    ('Cetirizine', 'Tablet', '10mg', 200), ('Diclofenac', 'Tablet', '50mg', 150),
+    ('Quinine', 'Injection', '600mg', 3000), ('Fluconazole', 'Capsule', '150mg', 1000),
+    ('Nifedipine', 'Tablet', '20mg', 300), ('Glibenclamide', 'Tablet', '5mg', 150),
+    ('Ranitidine', 'Tablet', '150mg', 200), ('Vitamin B Complex', 'Tablet', None, 50),
+]
+VENDORS = ['Quality Chemicals', 'Abacus Pharma', 'Cipla', 'Kampala Pharmaceutical Industries', 'Medipharm']
+# (ICD-10 code, condition, presenting complaint)
+CONDITIONS = [
+    ('B54', 'Malaria', 'Fever, headache and joint pains'),
+    ('A01.0', 'Typhoid fever', 'Fever and abdominal pain for a week'),
+    ('J06.9', 'Upper respiratory tract infection', 'Cough, sore throat and runny nose'),
+    ('I10', 'Essential hypertension', 'Headache and dizziness'),
+    ('E11.9', 'Type 2 diabetes mellitus', 'Frequent urination and thirst'),
+    ('K29.7', 'Gastritis', 'Epigastric pain after meals'),
+    ('N39.0', 'Urinary tract infection', 'Painful urination'),
+    ('J18.9', 'Pneumonia', 'Cough with fever and difficulty in breathing'),
+    ('D64.9', 'Anaemia', 'General body weakness'),
+    ('A09', 'Gastroenteritis', 'Diarrhoea and vomiting'),
+    ('L30.9', 'Dermatitis', 'Itchy skin rash'),
+    ('B82.9', 'Intestinal worms', 'Abdominal discomfort'),
+]
+VISIT_TYPES = ['Checkup', 'Follow-up', 'Emergency', 'Walk-in', 'Consultation']
+FREQUENCIES = ['Once daily', 'Twice daily', 'Three times daily', 'Every 8 hours', 'As needed']
+PAYMENT_METHODS = ['cash', 'mobile money', 'insurance', 'card']
+CASHIERS = ['Front Desk', 'Cashier 1', 'Cashier 2', 'Pharmacy']
+
+TABLES = (
+    IdSequence, Patient, Doctor, Drug, Visit, Triage, Diagnosis, VisitReport, Prescription,
+    PrescriptionDrug, Invoice, InvoiceItem, Payment, Receipt, StockMovement, ImportCheckpoint,
+)
+
+
+class Generator:
+    """Writes the synthetic rows in id order, in chunks of CHUNK_VISITS visits.
+
+    Every value comes from one seeded random.Random consumed in a fixed
+    order, and every timestamp is placed relative to end, so nothing
+    depends on the clock or on the chunk size. Rows go in through Core
+    executemany with explicit ids, so none of the ORM listeners (rollups,
+    search index, stock ledger, document cache) fire per row; their tables
+    are rebuilt in one pass at the end instead.
+    """
+
+    CHUNK_VISITS = 20000
+
+    def __init__(self, connection, patients, visits, seed=0, end=None, days=730, drugs=None):
+        self.connection = connection
+        self.patients = patients
+        self.visits = visits
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.end = end or date.today()
+        self.start = self.end - timedelta(days=days - 1)
+        self.days = days
+        self.drug_count = drugs or len(DRUGS)
+        self.sequences = {}  # (entity, period) -> last value issued
+        self.counts = dict.fromkeys((model.__tablename__ for model in TABLES), 0)
+        self._rows = {model.__table__: [] for model in TABLES}
+        self._ids = dict.fromkeys(self._rows, 0)
+
+    def run(self):
+        self.doctors()
+        self.drugs()
+        self.patient_rows()
+        self.visit_rows()
+        self.opening_stock()
+        self.flush()
+        self.connection.execute(insert(IdSequence.__table__), [
+            {'entity': entity, 'period': period, 'last_value': value}
+            for (entity, period), value in sorted(self.sequences.items())
+        ])
+        self.connection.execute(insert(ImportCheckpoint.__table__).values(
+            source=f'synthetic:{self.seed}:{self.patients}:{self.visits}',
+            rows_done=self.patients, imported=self.patients, rejected=0, finished=True,
+            updated_at=self._at(self.end),
+        ))
+        self.counts.update({'id_sequences': len(self.sequences), 'import_checkpoints': 1})
+        return self.counts
+
+    # Reference data
+
+    def doctors(self):
+        count = min(max(5, self.patients // 2000), 500)
+        self.doctor_count = count
+        for i in range(1, count + 1):
+            first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+            joined = self._at(self.start - timedelta(days=self.rng.randint(0, 1000)))
+            self.add(Doctor, created_at=joined, doctor_id=self._sequence_id('doctor', joined),
+                     first_name=first, last_name=last, license_number=f'UMDPC-{10000 + i}',
+                     specialty=SPECIALTIES[(i - 1) % len(SPECIALTIES)],
+                     email=f'{first.lower()}.{last.lower()}{i}@kmc.example',
+                     phone=f'07{(i * 104729) % 10 ** 8:08d}', is_active=self.rng.random() > 0.05)
+
+    def drugs(self):
+        self.prices = {}
+        self.stock = {}
+        for i in range(1, self.drug_count + 1):
+            name, form, strength, price = DRUGS[(i - 1) % len(DRUGS)]
+            if i > len(DRUGS):
+                name = f'{name} {(i - 1) // len(DRUGS) + 1}'
+            self.prices[i] = Decimal(price)
+            self.stock[i] = self.rng.randint(200, 5000)
+            self.add(Drug, created_at=self._at(self.start), name=name, vendor=self.rng.choice(VENDORS),
+                     dosage_form=form, strength=strength, unit_price=self.prices[i], stock=self.stock[i],
+                     expiry_date=self.end + timedelta(days=self.rng.randint(30, 900)), is_active=True)
+        self.dispensed = dict.fromkeys(self.prices, 0)
+
+    def patient_rows(self):
+        """Patients registered evenly over the window, oldest first"""
+        for i in range(1, self.patients + 1):
+            registered = self._at(self.start + timedelta(days=self.days * (i - 1) / self.patients))
+            self.add(Patient, created_at=registered, patient_id=self._sequence_id('patient', registered),
+                     first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+                     age=self.rng.randint(1, 90), gender=self.rng.choice(('male', 'female')),
+                     # 7919 is coprime with 10**8, so every patient gets a distinct number
+                     phone=f'07{(i * 7919) % 10 ** 8:08d}', email=None,
+                     address=f'Plot {self.rng.randint(1, 400)}, {self.rng.choice(("Kampala", "Wakiso", "Mukono", "Entebbe"))}',
+                     blood_type=self.rng.choice(('A+', 'A-', 'B+', 'B-', 'AB+', 'O+', 'O-', None)),
+                     allergies=self.rng.choice((None, None, None, 'Penicillin', 'Sulphur drugs')))
+            if i % 50000 == 0:
+                self.flush()
+
+    # Clinical and billing rows
+
+    def visit_rows(self):
+        """Visits in date order, each to a patient already registered by then"""
+        for i in range(1, self.visits + 1):
+            progress = (i - 1) / self.visits
+            day = self.start + timedelta(days=int(self.days * progress))
+            at = self._at(day, hour=self.rng.randint(8, 17), minute=self.rng.randint(0, 59))
+            patient = self.rng.randrange(max(1, int(self.patients * progress))) + 1
+            doctor = self.rng.randint(1, self.doctor_count)
+            # Today's visits are still open, so triage and the journey have work to do
+            status = 'in-progress' if day >= self.end else (
+                'cancelled' if self.rng.random() < 0.02 else 'completed')
+            visit = self.add(Visit, created_at=at, visit_id=self._sequence_id('visit', at), patient_id=patient,
+                             doctor_id=doctor, visit_date=at, visit_type=self.rng.choice(VISIT_TYPES),
+                             status=status)
+            if status != 'cancelled':
+                self.clinical(visit, patient, doctor, at, status)
+            if i % self.CHUNK_VISITS == 0:
+                self.flush()
+
+    def clinical(self, visit, patient, doctor, at, status):
+        rng = self.rng
+        if rng.random() < 0.9:
+            self.add(Triage, created_at=at, visit_id=visit, height=round(rng.uniform(145, 190), 1),
+                     weight=round(rng.uniform(40, 110), 1), temperature=round(rng.uniform(35.8, 39.8), 1),
+                     blood_pressure_systolic=rng.randint(95, 170), blood_pressure_diastolic=rng.randint(60, 105),
+                     pulse=rng.randint(55, 125), oxygen_saturation=rng.randint(90, 100), notes=None)
+        if status != 'completed':
+            return
+
+        conditions = rng.sample(CONDITIONS, rng.choice((1, 1, 1, 2)))
+        for n, (code, condition, _) in enumerate(conditions):
+            self.add(Diagnosis, created_at=at, visit_id=visit, patient_id=patient, doctor_id=doctor,
+                     icd10_code=code, condition=condition, description=None, is_primary=n == 0)
+        if rng.random() < 0.3:
+            _, condition, complaint = conditions[0]
+            self.add(VisitReport, created_at=at, visit_id=visit, patient_id=patient, doctor_id=doctor,
+                     visit_date=at, presenting_complaint=complaint, history_complaint=None,
+                     medical_history=None, physical_examination='Fair general condition',
+                     investigations=None, preliminary_diagnosis=condition, final_diagnosis=condition,
+                     management_plan='Treat and review', recommendations=None,
+                     review_date=at.date() + timedelta(days=14))
+
+        lines = []
+        prescription = None
+        if rng.random() < 0.7:
+            duration = rng.randint(3, 14)
+            started = at.date()
+            ended = started + timedelta(days=duration)
+            prescription = self.add(Prescription, created_at=at, visit_id=visit, patient_id=patient,
+                                    doctor_id=doctor, dosage=None, frequency=None, quantity=None,
+                                    duration_days=duration, start_date=started, end_date=ended,
+                                    instructions=None, status='completed' if ended < self.end else 'active')
+            for drug in rng.sample(range(1, self.drug_count + 1), rng.randint(1, 3)):
+                quantity = rng.randint(1, 30)
+                self.add(PrescriptionDrug, created_at=at, prescription_id=prescription, drug_id=drug,
+                         dosage='1 tablet', frequency=rng.choice(FREQUENCIES), quantity=quantity)
+                self.add(StockMovement, drug_id=drug, quantity=-quantity, reason='dispense',
+                         prescription_id=prescription, note=None, created_at=at)
+                self.dispensed[drug] += quantity
+                lines.append((drug, quantity))
+
+        if rng.random() < 0.85:
+            self.invoice(visit, patient, prescription, lines, at)
+
+    def invoice(self, visit, patient, prescription, lines, at):
+        rng = self.rng
+        issued = at.date()
+        fee = Decimal(rng.choice((10000, 20000, 30000, 50000)))
+        sundries = Decimal(rng.choice((0, 0, 2000, 5000)))
+        subtotal = sum((self.prices[drug] * quantity for drug, quantity in lines), Decimal(0))
+        total = subtotal + fee + sundries
+        outcome = rng.random()
+        status = 'paid' if outcome < 0.7 else 'partial' if outcome < 0.85 else (
+            'cancelled' if outcome < 0.87 else 'pending')
+        invoice = self.add(Invoice, created_at=at, visit_id=visit, patient_id=patient, invoice_date=issued,
+                           due_date=issued + timedelta(days=30), subtotal=subtotal, professional_fee=fee,
+                           sundries=sundries, tax_amount=Decimal(0), discount_amount=Decimal(0),
+                           total_amount=total, status=status, notes=None)
+        for drug, quantity in lines:
+            name = DRUGS[(drug - 1) % len(DRUGS)][0]
+            self.add(InvoiceItem, created_at=at, drug_id=drug, invoice_id=invoice, prescription_id=prescription,
+                     item_type='medication', description=name, quantity=quantity,
+                     unit_price=self.prices[drug], total_price=self.prices[drug] * quantity)
+
+        if status == 'paid':
+            first = (total / 2).quantize(Decimal('1')) if rng.random() < 0.2 else total
+            amounts = [first, total - first] if first < total else [total]
+        elif status == 'partial':
+            amounts = [(total * Decimal(rng.choice((25, 50, 75))) / 100).quantize(Decimal('1'))]
+        else:
+            amounts = []
+        for n, amount in enumerate(amounts):
+            paid_on = issued + timedelta(days=n * rng.randint(1, 20))
+            payment = self.add(Payment, created_at=at, invoice_id=invoice, payment_date=paid_on, amount=amount,
+                               payment_method=rng.choice(PAYMENT_METHODS), transaction_reference=None, notes=None)
+            self.add(Receipt, created_at=at, payment_id=payment, receipt_date=paid_on,
+                     receipt_number=f'RCT-{payment:08d}', issued_by=rng.choice(CASHIERS), notes=None)
+
+    def opening_stock(self):
+        """Receipts dated at the start that leave each drug's ledger equal to its stock"""
+        for drug, stock in self.stock.items():
+            self.add(StockMovement, drug_id=drug, quantity=stock + self.dispensed[drug], reason='receipt',
+                     prescription_id=None, note='Opening balance', created_at=self._at(self.start))
+
+    # Plumbing
+
+    def add(self, model, **values):
+        """Queue a row with the next id of its table; returns the id"""
+        table = model.__table__
+        self._ids[table] += 1
+        row = dict(values, id=self._ids[table])
+        if 'public_id' in table.c:
+            row['public_id'] = str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+            row['updated_at'] = row['created_at']
+        self._rows[table].append(row)
+        return row['id']
+
+    def flush(self):
+        """Insert every queued row, parents before children"""
+        for table, rows in self._rows.items():
+            if rows:
+                self.connection.execute(insert(table), rows)
+                self.counts[table.name] += len(rows)
+                rows.clear()
+
+    def _sequence_id(self, entity, at):
+        key = (entity, SequenceService.period(at))
+        self.sequences[key] = self.sequences.get(key, 0) + 1
+        return f"{SequenceService.prefix(entity, at)}{self.sequences[key]:04d}"
+
+    @staticmethod
+    def _at(day, hour=8, minute=0):
+        return datetime.combine(day, clock(hour, minute))
+
+
+def generate(patients, visits, seed=0, end=None, days=730, drugs=None, log=print):
+    """Fill the app's (empty) database; returns rows written per table"""
+    with db.engine.connect() as connection:
+        if connection.execute(select(func.count()).select_from(Patient.__table__)).scalar():
+            raise ValueError("The database already has patients; generate into an empty one")
+
+    started = time.perf_counter()
+    with db.engine.begin() as connection:
+        counts = Generator(connection, patients, visits, seed=seed, end=end, days=days, drugs=drugs).run()
+    log(f"wrote {sum(counts.values()):,} rows in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    RollupService.rebuild()
+    with db.engine.begin() as connection:
+        StockService.snapshot(connection)
+        if PatientSearchService.available(connection):
+            PatientSearchService.rebuild(connection)
+        for model in (MonthlyRollup, PatientActivity, StockSnapshot):
+            counts[model.__tablename__] = connection.execute(
+                select(func.count()).select_from(model.__table__)).scalar()
+    log(f"rebuilt rollups, stock snapshots and search index in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True, help='SQLAlchemy URL of an empty database')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--patients', type=int, help='overrides the scale')
+    parser.add_argument('--visits', type=int, help='overrides the scale')
+    parser.add_argument('--drugs', type=int, default=len(DRUGS))
+    parser.add_argument('--days', type=int, default=730, help='visits are spread over this many days')
+    parser.add_argument('--end', type=date.fromisoformat, default=date.today(), help='last visit day (YYYY-MM-DD)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    patients, visits = SCALES[args.scale]
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database})
+    with app.app_context():
+        counts = generate(args.patients or patients, args.visits or visits, seed=args.seed,
+                          end=args.end, days=args.days, drugs=args.drugs)
+        for table, count in counts.items():
+            print(f"{table:<20}{count:>12,}")
+        db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
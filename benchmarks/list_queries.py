@@ -0,0 +1,79 @@
+"""SQL statement counts for every admin list page.
+
+Renders each ModelView list at several page sizes against a seeded
+throwaway database and counts the statements issued on the primary and
+read engines. The count must not grow with the page size; the script
+exits non-zero if it does, if a list page fails to render, or if no
+statement was counted.
+
+    python -m benchmarks.list_queries --visits 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from flask_admin.contrib.sqla import ModelView
+from sqlalchemy import event
+
+from application import create_app
+from application.extensions import db
+from benchmarks.query_plans import seed_database
+
+PAGE_SIZES = (5, 20, 100)
+
+
+def count_statements(app, view, page_size):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    view.page_size = page_size
+    # Requests reuse the outer app context, and with it the session; start
+    # each one with an empty identity map so lazy loads are not hidden
+    db.session.remove()
+    # List views read through the read engine when routing is on (application/routing.py)
+    engines = {db.engine, app.extensions.get('read_engine')} - {None}
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = app.test_client().get(f"{view.url}/")
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', record)
+    return response.status_code, len(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--visits', type=int, default=2000)
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'lists.db')}"})
+        with app.app_context():
+            seed_database(db.engine, args.visits)
+            print(f"{'view':<14} " + ' '.join(f"{f'page={size}':>9}" for size in PAGE_SIZES))
+            for view in app.extensions['admin'][0]._views:
+                if not isinstance(view, ModelView):
+                    continue
+                # Warm up first so cached counts do not skew the first size
+                count_statements(app, view, PAGE_SIZES[0])
+                results = [count_statements(app, view, size) for size in PAGE_SIZES]
+                counts = {count for _, count in results}
+                errors = [status for status, _ in results if status != 200]
+                # No statements at all means the page's queries went uncounted
+                status = 'ok' if not errors and len(counts) == 1 and 0 not in counts else 'FAIL'
+                failed = failed or status == 'FAIL'
+                cells = ' '.join(
+                    f"{count:>9}" if code == 200 else f"{'HTTP ' + str(code):>9}" for code, count in results
+                )
+                print(f"{view.endpoint:<14} {cells}  {status}")
+            db.engine.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
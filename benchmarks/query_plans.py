@@ -0,0 +1,170 @@
+"""Query-plan regression check for the hot queries.
+
+Seeds a throwaway SQLite database with the real schema, runs
+EXPLAIN QUERY PLAN on every query in HOT_QUERIES and exits non-zero if
+any of them falls back to a full table scan.
+
+    python -m benchmarks.query_plans --visits 200000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, or_, select
+from sqlalchemy.dialects import sqlite
+
+from application.extensions import db
+from application.models.models import (
+    Diagnosis, Doctor, Drug, Invoice, InvoiceItem, Patient, Payment, Prescription,
+    PrescriptionDrug, Triage, Visit,
+)
+
+SINCE = date.today() - timedelta(days=180)
+
+# name -> statement, mirroring the routes and admin views that issue them
+HOT_QUERIES = {
+    'patient by patient_id': select(Patient).where(Patient.patient_id == 'KMC-01-2025-0001'),
+    'active visit (patient_journey)': select(Visit).where(
+        Visit.patient_id == 1, Visit.status == 'in-progress'
+    ).limit(1),
+    'latest active visit (manage_triage)': select(Visit).where(
+        Visit.patient_id == 1, Visit.status == 'in-progress'
+    ).order_by(Visit.visit_date.desc()).limit(1),
+    'triage by visit': select(Triage).where(Triage.visit_id == 1),
+    'prescriptions by visit': select(Prescription).where(Prescription.visit_id == 1),
+    'invoice by visit': select(Invoice).where(Invoice.visit_id == 1),
+    'diagnoses by visit': select(Diagnosis).where(Diagnosis.visit_id == 1),
+    'prescription drugs by prescription': select(PrescriptionDrug).where(PrescriptionDrug.prescription_id == 1),
+    'invoice items by invoice': select(InvoiceItem).where(InvoiceItem.invoice_id == 1),
+    'amount paid by invoice': select(func.sum(Payment.amount)).where(Payment.invoice_id == 1),
+    'visits per month': select(
+        func.strftime('%Y-%m', Visit.visit_date).label('month'), func.count(Visit.id)
+    ).where(Visit.visit_date >= SINCE).group_by('month'),
+    'prescriptions per month': select(
+        func.strftime('%Y-%m', Prescription.start_date).label('month'), func.count(Prescription.id)
+    ).where(Prescription.start_date >= SINCE).group_by('month'),
+    'invoice totals per month': select(
+        func.strftime('%Y-%m', Invoice.invoice_date).label('month'), func.sum(Invoice.total_amount)
+    ).where(Invoice.invoice_date >= SINCE).group_by('month'),
+    'invoices by status': select(Invoice).where(Invoice.status == 'pending').order_by(Invoice.invoice_date.desc()),
+    'visits by date range': select(Visit).where(Visit.visit_date.between(SINCE, date.today())),
+    'visit list keyset page': select(Visit).where(
+        Visit.visit_date <= SINCE, or_(Visit.visit_date < SINCE, Visit.id < 1000)
+    ).order_by(Visit.visit_date.desc(), Visit.id.desc()).limit(21),
+    'patient list keyset page': select(Patient).where(
+        Patient.created_at <= SINCE, or_(Patient.created_at < SINCE, Patient.id < 1000)
+    ).order_by(Patient.created_at.desc(), Patient.id.desc()).limit(21),
+    'invoice list keyset page': select(Invoice).where(
+        Invoice.created_at <= SINCE, or_(Invoice.created_at < SINCE, Invoice.id < 1000)
+    ).order_by(Invoice.created_at.desc(), Invoice.id.desc()).limit(21),
+}
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def seed_database(engine, visits, seed=0):
+    """Populate every hot table with roughly `visits` visits worth of rows"""
+    rng = random.Random(seed)
+    patients = max(visits // 5, 1)
+    today = datetime.now()
+    db.metadata.create_all(engine)
+
+    def base(kind, i):
+        return {'public_id': f'{kind}-{i}'}
+
+    with engine.begin() as conn:
+        conn.execute(insert(Doctor.__table__), [dict(
+            base('doctor', i), doctor_id=f'KMC-DOC-SEED-{i:04d}', first_name='Doc', last_name=str(i),
+            license_number=f'LIC-{i:05d}', specialty='general', phone='0700000000', is_active=True,
+        ) for i in range(1, 21)])
+        conn.execute(insert(Drug.__table__), [dict(
+            base('drug', i), name=f'Drug {i}', unit_price=rng.randint(1, 500), stock=1000, is_active=True,
+        ) for i in range(1, 201)])
+        conn.execute(insert(Patient.__table__), [dict(
+            base('patient', i), patient_id=f'KMC-SEED-{i:08d}', first_name='Seed', last_name=str(i),
+            age=rng.randint(1, 90), gender=rng.choice(['male', 'female']), phone=f'07{i:08d}',
+        ) for i in range(1, patients + 1)])
+
+        visit_rows, triage_rows, diagnosis_rows, prescription_rows = [], [], [], []
+        drug_rows, invoice_rows, item_rows, payment_rows = [], [], [], []
+        for i in range(1, visits + 1):
+            when = today - timedelta(days=rng.randint(0, 3 * 365), minutes=rng.randint(0, 1440))
+            patient_id = rng.randint(1, patients)
+            visit_rows.append(dict(
+                base('visit', i), visit_id=f'KMC-VIS-SEED/{i:08d}', patient_id=patient_id,
+                doctor_id=rng.randint(1, 20), visit_date=when, visit_type='walk-in',
+                status='in-progress' if rng.random() < 0.02 else 'completed',
+            ))
+            triage_rows.append(dict(base('triage', i), visit_id=i, height=170, weight=70, pulse=72))
+            diagnosis_rows.append(dict(
+                base('diagnosis', i), visit_id=i, patient_id=patient_id, doctor_id=1, condition='Seed',
+            ))
+            prescription_rows.append(dict(
+                base('prescription', i), visit_id=i, patient_id=patient_id, doctor_id=1,
+                start_date=when.date(), status='completed',
+            ))
+            drug_rows.append(dict(
+                base('prescription-drug', i), id=i, prescription_id=i, drug_id=rng.randint(1, 200),
+                dosage='1x1', frequency='daily', quantity=rng.randint(1, 30),
+            ))
+            total = rng.randint(10, 5000)
+            invoice_rows.append(dict(
+                base('invoice', i), visit_id=i, patient_id=patient_id, invoice_date=when.date(),
+                subtotal=total, total_amount=total, status=rng.choice(['pending', 'partial', 'paid']),
+            ))
+            item_rows.append(dict(
+                base('invoice-item', i), invoice_id=i, drug_id=drug_rows[-1]['drug_id'], prescription_id=i,
+                item_type='medication', description='Seed', quantity=1, unit_price=total, total_price=total,
+            ))
+            payment_rows.append(dict(
+                base('payment', i), invoice_id=i, payment_date=when.date(), amount=total, payment_method='cash',
+            ))
+        for model, rows in [
+            (Visit, visit_rows), (Triage, triage_rows), (Diagnosis, diagnosis_rows),
+            (Prescription, prescription_rows), (PrescriptionDrug, drug_rows), (Invoice, invoice_rows),
+            (InvoiceItem, item_rows), (Payment, payment_rows),
+        ]:
+            conn.execute(insert(model.__table__), rows)
+        conn.exec_driver_sql('ANALYZE')
+
+
+def explain(conn, statement):
+    compiled = statement.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True})
+    return [row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}')]
+
+
+def check_plans(engine):
+    """Return {name: plan lines} for every hot query that does a full table scan"""
+    failures = {}
+    with engine.connect() as conn:
+        for name, statement in HOT_QUERIES.items():
+            plan = explain(conn, statement)
+            if any(FULL_SCAN.match(line) for line in plan):
+                failures[name] = plan
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--visits', type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'plans.db')}")
+        seed_database(engine, args.visits)
+        failures = check_plans(engine)
+        engine.dispose()
+
+    for name in HOT_QUERIES:
+        print(f"{'FAIL' if name in failures else 'ok':<5} {name}")
+        for line in failures.get(name, []):
+            print(f"        {line}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
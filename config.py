@@ -1,5 +1,87 @@
+import os
+
+
 class Config:
     
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///ehr.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///ehr.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = 'starsbooksjah'
+
+    # Connection pool, used as-is for a server database (DATABASE_URL)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = 30
+    DB_POOL_RECYCLE = 1800  # seconds
+    DB_POOL_PRE_PING = True
+
+    # Reports, exports and list views read through their own engine and pool
+    # (application/routing.py): SQLALCHEMY_READ_URI for a replica of a server
+    # database, else a read-only connection to the SQLite file. Writes always
+    # go to the primary.
+    DB_READ_ROUTING = True
+    SQLALCHEMY_READ_URI = os.environ.get('DATABASE_READ_URL')
+    DB_READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', 10))
+    DB_READ_MAX_OVERFLOW = int(os.environ.get('DB_READ_MAX_OVERFLOW', 20))
+
+    # Applied to every new SQLite connection
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',  # readers no longer block on the writer
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,  # ms to wait for the write lock
+        'cache_size': -64000,  # 64 MB page cache
+        'mmap_size': 268435456,  # 256 MB
+        'foreign_keys': 'ON',
+    }
+
+    # Result cache for dashboard and report data. 'memory' is per process;
+    # 'sqlite' shares one file between waitress workers on the same host
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_SQLITE_PATH = None  # defaults to <instance>/cache.db
+    CACHE_MAX_ENTRIES = 1024
+    CACHE_DEFAULT_TTL = 300  # seconds
+
+    # IDs reserved per round trip to the id_sequences table; 1 allocates
+    # inside each insert transaction. Must stay 1 on SQLite, where a block
+    # reservation would wait on the inserting flush's own write lock
+    ID_SEQUENCE_BLOCK_SIZE = 1
+
+    # Invoices and visit reports are rendered to PDF by a pool of workers so
+    # request threads never wait on wkhtmltopdf
+    PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 2))
+    PDF_MAX_PENDING = 100  # queued PDFs before new requests get a 503
+    PDF_JOB_TTL = 600  # seconds a rendered PDF stays downloadable
+    PDF_OPTIONS = {}  # passed to wkhtmltopdf
+    WKHTMLTOPDF_PATH = os.environ.get('WKHTMLTOPDF_PATH')  # None searches PATH
+
+    # Generated invoices and reports, reused until their inputs change
+    DOCUMENT_CACHE_DIR = None  # defaults to <instance>/documents
+    DOCUMENT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+    # Word templates with [PLACEHOLDER] fields, compiled once at startup
+    DOCX_TEMPLATE_DIR = None  # defaults to application/templates/docs
+
+    # Rows per transaction for bulk patient imports (flask patients import)
+    PATIENT_IMPORT_CHUNK_SIZE = 5000
+
+    # Rows fetched per round trip when streaming exports (/exports/...)
+    EXPORT_BATCH_SIZE = 2000
+
+    # Integration API (/api): items per batch write, ids per batched read
+    API_BATCH_LIMIT = 1000
+    API_READ_LIMIT = 10000
+
+    # Seconds a patient's journey stage stays cached; workflow commits
+    # update it sooner
+    JOURNEY_STATE_TTL = 600
+
+    # Stripped from phone numbers before they are indexed for patient search
+    PHONE_COUNTRY_CODE = '256'
+
+    # Per-request wall, SQL and render timings, served to Prometheus at
+    # METRICS_PATH with percentiles over the last METRICS_WINDOW seconds
+    INSTRUMENTATION_ENABLED = True
+    METRICS_PATH = '/metrics'
+    METRICS_WINDOW = 300  # seconds
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 1000))  # logged with their slowest statements
+    SLOW_REQUEST_STATEMENTS = 5
+
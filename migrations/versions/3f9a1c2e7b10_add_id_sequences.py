@@ -0,0 +1,32 @@
+"""add id_sequences counter table
+
+Revision ID: 3f9a1c2e7b10
+Revises: 
+Create Date: 2026-10-17 09:12:41.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2e7b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have made it
+    if sa.inspect(op.get_bind()).has_table('id_sequences'):
+        return
+    op.create_table('id_sequences',
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('period', sa.String(length=7), nullable=False),
+    sa.Column('last_value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('entity', 'period')
+    )
+
+
+def downgrade():
+    op.drop_table('id_sequences')
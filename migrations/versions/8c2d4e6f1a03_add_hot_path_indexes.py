@@ -0,0 +1,49 @@
+"""add indexes for hot foreign keys and filters
+
+Revision ID: 8c2d4e6f1a03
+Revises: 3f9a1c2e7b10
+Create Date: 2026-10-17 11:40:05.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2d4e6f1a03'
+down_revision = '3f9a1c2e7b10'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_visits_patient_status_date', 'visits', ['patient_id', 'status', 'visit_date']),
+    ('ix_visits_date_patient', 'visits', ['visit_date', 'patient_id']),
+    ('ix_visits_doctor_id', 'visits', ['doctor_id']),
+    ('ix_triage_visit_id', 'triage', ['visit_id']),
+    ('ix_diagnoses_visit_id', 'diagnoses', ['visit_id']),
+    ('ix_diagnoses_patient_id', 'diagnoses', ['patient_id']),
+    ('ix_prescriptions_start_date', 'prescriptions', ['start_date']),
+    ('ix_prescriptions_patient_id', 'prescriptions', ['patient_id']),
+    ('ix_prescription_drugs_prescription_id', 'prescription_drugs', ['prescription_id']),
+    ('ix_prescription_drugs_drug_id', 'prescription_drugs', ['drug_id']),
+    ('ix_invoices_date_total', 'invoices', ['invoice_date', 'total_amount']),
+    ('ix_invoices_status_date', 'invoices', ['status', 'invoice_date']),
+    ('ix_invoices_visit_id', 'invoices', ['visit_id']),
+    ('ix_invoices_patient_id', 'invoices', ['patient_id']),
+    ('ix_invoice_items_invoice_id', 'invoice_items', ['invoice_id']),
+    ('ix_payments_invoice_amount', 'payments', ['invoice_id', 'amount']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+    # Give the planner row counts for the new indexes
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('ANALYZE')
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,59 @@
+"""add stock_movements ledger and stock_snapshots
+
+Revision ID: a7d3e5f9c2b8
+Revises: f2c6a9e1b3d4
+Create Date: 2026-10-17 21:40:12.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e5f9c2b8'
+down_revision = 'f2c6a9e1b3d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # create_app() runs db.create_all(), which may already have made them
+    if not inspector.has_table('stock_movements'):
+        op.create_table('stock_movements',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('drug_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('reason', sa.String(length=20), nullable=False),
+        sa.Column('prescription_id', sa.Integer(), nullable=True),
+        sa.Column('note', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.CheckConstraint("reason IN ('receipt', 'dispense', 'return', 'adjustment')", name='valid_stock_reason'),
+        sa.ForeignKeyConstraint(['drug_id'], ['drugs.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_stock_movements_drug_id_id', 'stock_movements', ['drug_id', 'id'], unique=False)
+        op.create_index('ix_stock_movements_prescription_id', 'stock_movements', ['prescription_id'], unique=False)
+    if not inspector.has_table('stock_snapshots'):
+        op.create_table('stock_snapshots',
+        sa.Column('drug_id', sa.Integer(), nullable=False),
+        sa.Column('movement_id', sa.Integer(), nullable=False),
+        sa.Column('stock', sa.Integer(), nullable=False),
+        sa.Column('taken_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['drug_id'], ['drugs.id'], ),
+        sa.PrimaryKeyConstraint('drug_id', 'movement_id')
+        )
+
+    # Open the ledger at each drug's current stock
+    op.execute(
+        "INSERT INTO stock_movements (drug_id, quantity, reason, note, created_at) "
+        "SELECT id, stock, 'adjustment', 'Opening balance', CURRENT_TIMESTAMP FROM drugs "
+        "WHERE COALESCE(stock, 0) <> 0 AND id NOT IN (SELECT drug_id FROM stock_movements)"
+    )
+
+
+def downgrade():
+    op.drop_table('stock_snapshots')
+    op.drop_index('ix_stock_movements_prescription_id', table_name='stock_movements')
+    op.drop_index('ix_stock_movements_drug_id_id', table_name='stock_movements')
+    op.drop_table('stock_movements')
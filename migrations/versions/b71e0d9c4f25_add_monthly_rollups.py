@@ -0,0 +1,43 @@
+"""add monthly_rollups and patient_activity
+
+Revision ID: b71e0d9c4f25
+Revises: 8c2d4e6f1a03
+Create Date: 2026-10-17 14:02:18.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71e0d9c4f25'
+down_revision = '8c2d4e6f1a03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have made them;
+    # either way run `flask rollups rebuild` afterwards to backfill
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('monthly_rollups'):
+        op.create_table('monthly_rollups',
+        sa.Column('period', sa.String(length=7), nullable=False),
+        sa.Column('visit_count', sa.Integer(), nullable=False),
+        sa.Column('prescription_count', sa.Integer(), nullable=False),
+        sa.Column('invoice_total', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('active_patients', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('period')
+        )
+    if not inspector.has_table('patient_activity'):
+        op.create_table('patient_activity',
+        sa.Column('period', sa.String(length=7), nullable=False),
+        sa.Column('patient_id', sa.Integer(), nullable=False),
+        sa.Column('visit_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('period', 'patient_id')
+        )
+
+
+def downgrade():
+    op.drop_table('patient_activity')
+    op.drop_table('monthly_rollups')
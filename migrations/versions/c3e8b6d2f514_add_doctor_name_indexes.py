@@ -0,0 +1,32 @@
+"""add lower(name) indexes for the doctor lookup
+
+Revision ID: c3e8b6d2f514
+Revises: a7d3e5f9c2b8
+Create Date: 2026-10-18 09:12:30.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8b6d2f514'
+down_revision = 'a7d3e5f9c2b8'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_doctors_last_name_lower', 'doctors', [sa.text('lower(last_name)')]),
+    ('ix_doctors_first_name_lower', 'doctors', [sa.text('lower(first_name)')]),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
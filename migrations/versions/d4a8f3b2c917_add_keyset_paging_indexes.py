@@ -0,0 +1,33 @@
+"""add indexes for keyset paging of admin lists
+
+Revision ID: d4a8f3b2c917
+Revises: b71e0d9c4f25
+Create Date: 2026-10-17 16:25:47.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8f3b2c917'
+down_revision = 'b71e0d9c4f25'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_patients_created_at', 'patients', ['created_at']),
+    ('ix_visits_visit_date', 'visits', ['visit_date']),
+    ('ix_invoices_created_at', 'invoices', ['created_at']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
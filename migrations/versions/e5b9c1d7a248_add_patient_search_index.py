@@ -0,0 +1,30 @@
+"""add patient_search full-text index
+
+Revision ID: e5b9c1d7a248
+Revises: d4a8f3b2c917
+Create Date: 2026-10-17 17:40:12.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9c1d7a248'
+down_revision = 'd4a8f3b2c917'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 is SQLite only; other databases search with LIKE
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    from application.services.search_service import PatientSearchService
+    PatientSearchService.ensure_index(op.get_bind())
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS patient_search")
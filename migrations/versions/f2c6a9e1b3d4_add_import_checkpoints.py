@@ -0,0 +1,35 @@
+"""add import_checkpoints table for resumable bulk imports
+
+Revision ID: f2c6a9e1b3d4
+Revises: e5b9c1d7a248
+Create Date: 2026-10-17 19:05:33.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c6a9e1b3d4'
+down_revision = 'e5b9c1d7a248'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have made it
+    if sa.inspect(op.get_bind()).has_table('import_checkpoints'):
+        return
+    op.create_table('import_checkpoints',
+    sa.Column('source', sa.String(length=255), nullable=False),
+    sa.Column('rows_done', sa.Integer(), nullable=False),
+    sa.Column('imported', sa.Integer(), nullable=False),
+    sa.Column('rejected', sa.Integer(), nullable=False),
+    sa.Column('finished', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('source')
+    )
+
+
+def downgrade():
+    op.drop_table('import_checkpoints')